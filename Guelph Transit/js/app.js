@@ -9,7 +9,7 @@ let selectedEnd = null;
 // ----- Initialize Application -----
 async function initApp() {
     await initMap();
-    await fetchStops();
+    // Stops are searched on the backend; the full list is only fetched if that fails
     initSearch();
     initRouteHandlers();
     console.log('App initialized successfully');
@@ -35,23 +35,28 @@ function clearRoutes() {
 }
 
 // ----- Route Drawing -----
+const ROUTE_COLORS = ['#2563eb', '#10b981', '#8b5cf6', '#f59e0b', '#ef4444'];
+
 function drawRoutesOnMap(routes) {
     clearRoutes();
-    
-    const colors = ['#2563eb', '#10b981', '#8b5cf6', '#f59e0b', '#ef4444'];
-    
-    routes.forEach((route, index) => {
-        if (route.path && route.path.length > 1) {
-            const polyline = L.polyline(route.path, {
-                color: colors[index % colors.length],
-                weight: 6,
-                opacity: 0.7
-            }).addTo(map);
-            
-            routeLayers.push(polyline);
-        }
-    });
-    
+    routes.forEach((route, index) => addRouteToMap(route, index));
+    showRouteEndpoints();
+}
+
+// Draws one route; used on its own while results are still streaming in
+function addRouteToMap(route, index) {
+    if (route.path && route.path.length > 1) {
+        const polyline = L.polyline(route.path, {
+            color: ROUTE_COLORS[index % ROUTE_COLORS.length],
+            weight: 6,
+            opacity: 0.7
+        }).addTo(map);
+        
+        routeLayers.push(polyline);
+    }
+}
+
+function showRouteEndpoints() {
     // Fit map to show all routes
     if (routeLayers.length > 0) {
         const group = new L.featureGroup(routeLayers);
@@ -75,9 +80,8 @@ function highlightRoute(route, index) {
     clearRoutes();
     
     if (route.path && route.path.length > 1) {
-        const colors = ['#2563eb', '#10b981', '#8b5cf6', '#f59e0b', '#ef4444'];
         const polyline = L.polyline(route.path, {
-            color: colors[index % colors.length],
+            color: ROUTE_COLORS[index % ROUTE_COLORS.length],
             weight: 8,
             opacity: 0.9
         }).addTo(map);
@@ -20,9 +20,19 @@ async function findRoutes() {
     showLoading('Finding the best routes for you...');
     
     try {
-        const routes = await fetchRoutesFromBackend(start, end);
-        displayRouteResults(routes);
-        drawRoutesOnMap(routes);
+        // Itineraries are shown one by one as the backend finds them
+        const routes = await fetchRoutesFromBackend(start, end, (route, index) => {
+            if (index === 0) {
+                document.getElementById('routeResults').innerHTML = '';
+                clearRoutes();
+            }
+            appendRouteResult(route, index);
+            addRouteToMap(route, index);
+        });
+        if (routes.length === 0) {
+            displayRouteResults(routes);
+        }
+        showRouteEndpoints();
     } catch (error) {
         console.error('Error finding routes:', error);
         showStatus('error', 'Failed to find routes. Please try again.');
@@ -32,13 +42,14 @@ async function findRoutes() {
     }
 }
 
-async function fetchRoutesFromBackend(start, end) {
-    // Use your Django backend API
+async function fetchRoutesFromBackend(start, end, onRoute = () => {}) {
+    // Use your Django backend API, streamed as one JSON itinerary per line
     const params = new URLSearchParams({
         from_lat: start.latitude,
         from_lon: start.longitude,
         to_lat: end.latitude,
-        to_lon: end.longitude
+        to_lon: end.longitude,
+        stream: 'ndjson'
     });
     
     const response = await fetch(`${API_BASE}/plan/?${params}`);
@@ -47,10 +58,42 @@ async function fetchRoutesFromBackend(start, end) {
         throw new Error(`Backend error: ${response.status}`);
     }
     
-    const data = await response.json();
+    const routes = [];
+    const handleLine = (line) => {
+        if (!line.trim()) {
+            return;
+        }
+        const itinerary = JSON.parse(line);
+        if (itinerary.error) {
+            throw new Error(itinerary.error);
+        }
+        // Transform backend response to match frontend format
+        const route = transformItinerary(itinerary, routes.length);
+        routes.push(route);
+        onRoute(route, routes.length - 1);
+    };
+    
+    if (!response.body || !response.body.getReader) {
+        // No streaming support: parse the whole body at once
+        (await response.text()).split('\n').forEach(handleLine);
+        return routes;
+    }
     
-    // Transform backend response to match frontend format
-    return transformBackendResponse(data);
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = '';
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split('\n');
+        buffered = lines.pop();
+        lines.forEach(handleLine);
+    }
+    handleLine(buffered + decoder.decode());
+    return routes;
 }
 
 function transformBackendResponse(backendData) {
@@ -61,39 +104,43 @@ function transformBackendResponse(backendData) {
         return [];
     }
     
-    return backendData.map((itinerary, index) => {
-        // Extract basic route information
-        // You'll need to adjust this based on your actual serializer output
-        const duration = itinerary.total_duration || 30;
-        const cost = itinerary.total_cost || 3.50;
-        const transfers = itinerary.transfer_count || 0;
-        
-        // Create a simple path for demonstration
-        // In production, you'd use actual shape data from the backend
+    return backendData.map(transformItinerary);
+}
+
+function transformItinerary(itinerary, index) {
+    // Extract basic route information
+    // You'll need to adjust this based on your actual serializer output
+    const duration = itinerary.total_duration || 30;
+    const cost = itinerary.total_cost || 3.50;
+    const transfers = itinerary.transfer_count || 0;
+    
+    // Join the legs' polylines (bus legs follow the route shape, walks are straight lines)
+    const path = [];
+    (itinerary.legs || []).forEach(leg => {
+        (leg.path || []).forEach(point => path.push(point));
+    });
+    if (path.length < 2) {
         const start = getSelectedStart();
         const end = getSelectedEnd();
-        const path = [
+        path.push(
             [parseFloat(start.latitude), parseFloat(start.longitude)],
-            [43.5330, -80.2270],
-            [43.5345, -80.2285],
-            [43.5360, -80.2300],
             [parseFloat(end.latitude), parseFloat(end.longitude)]
-        ];
-        
-        // Create steps based on itinerary segments
-        const steps = createStepsFromItinerary(itinerary);
-        
-        return {
-            id: `route_${index + 1}`,
-            duration: duration,
-            cost: cost,
-            transfers: transfers,
-            ecoScore: 75 + Math.floor(Math.random() * 20), // Mock eco score
-            features: ['electric_bus'], // Mock features
-            steps: steps,
-            path: path
-        };
-    });
+        );
+    }
+    
+    // Create steps based on itinerary segments
+    const steps = createStepsFromItinerary(itinerary);
+    
+    return {
+        id: `route_${index + 1}`,
+        duration: duration,
+        cost: cost,
+        transfers: transfers,
+        ecoScore: 75 + Math.floor(Math.random() * 20), // Mock eco score
+        features: ['electric_bus'], // Mock features
+        steps: steps,
+        path: path
+    };
 }
 
 function createStepsFromItinerary(itinerary) {
@@ -150,60 +197,62 @@ function displayRouteResults(routes) {
     }
     
     container.innerHTML = '';
+    routes.forEach((route, index) => appendRouteResult(route, index));
+}
+
+function appendRouteResult(route, index) {
+    const container = document.getElementById('routeResults');
+    const div = document.createElement('div');
+    div.className = 'list-item route-option';
     
-    routes.forEach((route, index) => {
-        const div = document.createElement('div');
-        div.className = 'list-item route-option';
-        
-        const stepsHtml = route.steps.map(step => {
-            const iconClass = step.type === 'walk' ? 'walk' : 
-                             step.type === 'bus' ? 'bus' : 
-                             step.type === 'on_demand' ? 'eco' : 'bus';
-            const iconText = step.type === 'walk' ? 'W' : 
-                            step.type === 'bus' ? 'B' : 
-                            step.type === 'on_demand' ? 'O' : 'B';
-            
-            return `
-                <div class="route-step">
-                    <div class="step-icon ${iconClass}">${iconText}</div>
-                    <span>${step.description} (${step.duration} min)</span>
-                </div>
-            `;
-        }).join('');
-        
-        const featuresHtml = route.features.map(feature => {
-            const featureName = feature === 'electric_bus' ? 'Electric' :
-                               feature === 'ride_sharing' ? 'Ride Share' :
-                               feature === 'on_demand' ? 'On Demand' : feature;
-            return `<span style="background:#e0f2fe; color:#0369a1; padding:2px 6px; border-radius:4px; font-size:10px; margin-right:4px;">${featureName}</span>`;
-        }).join('');
+    const stepsHtml = route.steps.map(step => {
+        const iconClass = step.type === 'walk' ? 'walk' : 
+                         step.type === 'bus' ? 'bus' : 
+                         step.type === 'on_demand' ? 'eco' : 'bus';
+        const iconText = step.type === 'walk' ? 'W' : 
+                        step.type === 'bus' ? 'B' : 
+                        step.type === 'on_demand' ? 'O' : 'B';
         
-        div.innerHTML = `
-            <div class="route-header">
-                <div class="route-title">Option ${index + 1}</div>
-                <div class="route-duration">${route.duration} min</div>
-            </div>
-            <div class="route-details">
-                <div>Cost: $${route.cost.toFixed(2)}</div>
-                <div>Transfers: ${route.transfers}</div>
-            </div>
-            <div class="route-details">
-                <div>Eco Score: ${route.ecoScore}/100</div>
-                <div>${featuresHtml}</div>
-            </div>
-            <div class="route-steps">
-                ${stepsHtml}
+        return `
+            <div class="route-step">
+                <div class="step-icon ${iconClass}">${iconText}</div>
+                <span>${step.description} (${step.duration} min)</span>
             </div>
         `;
-        
-        div.onclick = () => {
-            document.querySelectorAll('.route-option').forEach(item => {
-                item.style.background = '#fff';
-            });
-            div.style.background = '#f0f5ff';
-            highlightRoute(route, index);
-        };
-        
-        container.appendChild(div);
-    });
+    }).join('');
+    
+    const featuresHtml = route.features.map(feature => {
+        const featureName = feature === 'electric_bus' ? 'Electric' :
+                           feature === 'ride_sharing' ? 'Ride Share' :
+                           feature === 'on_demand' ? 'On Demand' : feature;
+        return `<span style="background:#e0f2fe; color:#0369a1; padding:2px 6px; border-radius:4px; font-size:10px; margin-right:4px;">${featureName}</span>`;
+    }).join('');
+    
+    div.innerHTML = `
+        <div class="route-header">
+            <div class="route-title">Option ${index + 1}</div>
+            <div class="route-duration">${route.duration} min</div>
+        </div>
+        <div class="route-details">
+            <div>Cost: $${route.cost.toFixed(2)}</div>
+            <div>Transfers: ${route.transfers}</div>
+        </div>
+        <div class="route-details">
+            <div>Eco Score: ${route.ecoScore}/100</div>
+            <div>${featuresHtml}</div>
+        </div>
+        <div class="route-steps">
+            ${stepsHtml}
+        </div>
+    `;
+    
+    div.onclick = () => {
+        document.querySelectorAll('.route-option').forEach(item => {
+            item.style.background = '#fff';
+        });
+        div.style.background = '#f0f5ff';
+        highlightRoute(route, index);
+    };
+    
+    container.appendChild(div);
 }
\ No newline at end of file
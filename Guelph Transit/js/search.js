@@ -21,24 +21,56 @@ function initSearch() {
 }
 
 // ----- Search Handlers -----
+const SEARCH_DELAY_MS = 150;
+const SUGGESTION_LIMIT = 10;
+let searchTimer = null;
+let searchSequence = 0;
+
 function handleSearchInput(inputEl, suggestBox, type) {
-    const query = inputEl.value.toLowerCase().trim();
+    const query = inputEl.value.trim();
+    clearTimeout(searchTimer);
     
     if (!query) {
         suggestBox.style.display = 'none';
         return;
     }
     
-    const results = getStops().filter(stop => 
-        stop.name.toLowerCase().includes(query)
-    ).slice(0, 10);
-    
-    if (results.length === 0) {
-        suggestBox.style.display = 'none';
-        return;
+    // Wait for a pause in typing, and ignore answers to queries that were typed over
+    const sequence = ++searchSequence;
+    searchTimer = setTimeout(async () => {
+        const results = await searchStops(query);
+        if (sequence !== searchSequence) {
+            return;
+        }
+        
+        if (results.length === 0) {
+            suggestBox.style.display = 'none';
+            return;
+        }
+        
+        displaySuggestions(results, suggestBox, type);
+    }, SEARCH_DELAY_MS);
+}
+
+async function searchStops(query) {
+    // Ranked prefix/typo-tolerant matching happens on the backend
+    const params = new URLSearchParams({ q: query, limit: SUGGESTION_LIMIT });
+    try {
+        const response = await fetch(`${API_BASE}/stops/search/?${params}`);
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        return await response.json();
+    } catch (error) {
+        console.error('Stop search failed, filtering locally:', error);
+        if (getStops().length === 0) {
+            await fetchStops();
+        }
+        const needle = query.toLowerCase();
+        return getStops().filter(stop => 
+            stop.name.toLowerCase().includes(needle)
+        ).slice(0, SUGGESTION_LIMIT);
     }
-    
-    displaySuggestions(results, suggestBox, type);
 }
 
 function displaySuggestions(results, suggestBox, type) {
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class TransitApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'transit_api'
+
+    def ready(self):
+        from django.conf import settings
+        mode = getattr(settings, 'TRANSIT_WARMUP', None)
+        if mode:
+            from .warmup import start_warmup
+            start_warmup(mode)
@@ -0,0 +1,229 @@
+"""
+Reproducible planner benchmarks.
+
+make_workload draws a seeded list of origin/destination/time queries from a
+timetable; run_benchmark runs one planner engine over it and summarises latency
+percentiles, throughput, search expansions and peak memory. run_realtime_benchmark
+measures what real-time delays cost: applying a trip update feed, and planning on the
+delayed timetable instead of the static one. bench_planner (and the synthetic feed
+generator) write the results as JSON so runs can be diffed.
+"""
+import gc
+import math
+import platform
+import random
+import statistics
+import tracemalloc
+from datetime import datetime, timedelta
+from time import perf_counter
+
+from .planning.planner import TransitPlanner
+from .planning.raptor import RaptorPlanner
+from .planning.realtime import DelayOverlay, StopUpdate, TripUpdate
+from .planning.transfer_patterns import TransferPatternPlanner
+
+# Every query is planned on this (fixed) Monday so runs stay comparable
+BENCHMARK_DATE = datetime(2025, 11, 17)
+PEAK_HOURS = ((7, 9), (16, 18))
+OFF_PEAK_HOURS = ((10, 15), (19, 22))
+QUERY_KINDS = ('stop_to_stop', 'random_points')
+PROFILE_WINDOW = timedelta(hours=1)
+
+
+def make_workload(timetable, count, seed=0):
+	"""
+	Returns `count` queries, alternating stop-to-stop and random-point pairs and
+	peak and off-peak departures. The same seed and feed always give the same list.
+	"""
+	rng = random.Random(seed)
+	lats = [lat for lat, _ in timetable.stop_coords]
+	lons = [lon for _, lon in timetable.stop_coords]
+	queries = []
+	for i in range(count):
+		kind = QUERY_KINDS[i % len(QUERY_KINDS)]
+		period = 'peak' if (i // len(QUERY_KINDS)) % 2 == 0 else 'off_peak'
+		if kind == 'stop_to_stop':
+			origin, destination = (timetable.stop_coords[stop] for stop in rng.sample(range(len(timetable.stop_ids)), 2))
+		else:
+			origin, destination = [(rng.uniform(min(lats), max(lats)), rng.uniform(min(lons), max(lons))) for _ in range(2)]
+		start_hour, end_hour = rng.choice(PEAK_HOURS if period == 'peak' else OFF_PEAK_HOURS)
+		depart = BENCHMARK_DATE + timedelta(seconds=rng.randrange(start_hour * 3600, end_hour * 3600))
+		queries.append({
+			'kind': kind,
+			'period': period,
+			'origin': [round(origin[0], 6), round(origin[1], 6)],
+			'destination': [round(destination[0], 6), round(destination[1], 6)],
+			'depart': depart.isoformat(),
+		})
+	return queries
+
+
+def _coords(point):
+	return {'latitude': point[0], 'longitude': point[1]}
+
+
+def _run_a_star(query, timetable):
+	planner = TransitPlanner(_coords(query['origin']), _coords(query['destination']), datetime.fromisoformat(query['depart']), timetable=timetable)
+	return planner.find_five_paths(), planner.stats.nodes_popped
+
+
+def _run_profile(query, timetable):
+	depart = datetime.fromisoformat(query['depart'])
+	planner = RaptorPlanner(_coords(query['origin']), _coords(query['destination']), timetable=timetable)
+	return planner.profile(depart, depart + PROFILE_WINDOW), None
+
+
+def _run_transfer_patterns(query, timetable):
+	planner = TransferPatternPlanner(_coords(query['origin']), _coords(query['destination']), datetime.fromisoformat(query['depart']), timetable=timetable)
+	return planner.find_paths(), None
+
+
+# Engine name -> function(query, timetable) returning (itineraries, expansions or None)
+ENGINES = {
+	'a_star': _run_a_star,
+	'profile': _run_profile,
+	'transfer_patterns': _run_transfer_patterns,
+}
+
+
+def percentile(sorted_values, fraction):
+	"""Nearest-rank percentile of an already sorted list."""
+	if not sorted_values:
+		return None
+	rank = min(max(1, math.ceil(fraction * len(sorted_values))), len(sorted_values))
+	return sorted_values[rank - 1]
+
+
+def run_benchmark(engine, queries, timetable, measure_memory=True, warmup=1):
+	"""
+	Plans every query with `engine` and returns a JSON-serialisable summary. Memory is
+	measured in a second pass under tracemalloc, so it does not distort the timings.
+	"""
+	plan = ENGINES[engine]
+	for query in queries[:warmup]:
+		plan(query, timetable)
+
+	latencies, expansions, found = [], [], 0
+	gc.collect()
+	started = perf_counter()
+	for query in queries:
+		query_started = perf_counter()
+		itineraries, expanded = plan(query, timetable)
+		latencies.append(perf_counter() - query_started)
+		found += bool(itineraries)
+		if expanded is not None:
+			expansions.append(expanded)
+	elapsed = perf_counter() - started
+
+	peaks = []
+	if measure_memory:
+		tracemalloc.start()
+		try:
+			for query in queries:
+				tracemalloc.reset_peak()
+				baseline = tracemalloc.get_traced_memory()[0]
+				plan(query, timetable)
+				peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+		finally:
+			tracemalloc.stop()
+
+	latencies_ms = sorted(latency * 1000 for latency in latencies)
+	return {
+		'queries': len(queries),
+		'answered': found,
+		'total_seconds': round(elapsed, 4),
+		'throughput_qps': round(len(queries) / elapsed, 2) if elapsed else None,
+		'latency_ms': {
+			'mean': round(statistics.fmean(latencies_ms), 3) if latencies_ms else None,
+			'p50': _round(percentile(latencies_ms, 0.50)),
+			'p95': _round(percentile(latencies_ms, 0.95)),
+			'p99': _round(percentile(latencies_ms, 0.99)),
+			'max': _round(latencies_ms[-1] if latencies_ms else None),
+		},
+		'expansions_per_query': round(statistics.fmean(expansions), 1) if expansions else None,
+		'peak_memory_kib': {
+			'median': round(statistics.median(peaks) / 1024, 1),
+			'max': round(max(peaks) / 1024, 1),
+		} if peaks else None,
+	}
+
+
+def make_trip_updates(timetable, share, seed=0):
+	"""
+	Seeded trip updates for `share` of the trips: each runs 1 to 10 minutes late from a
+	random stop on, and one in twenty is cancelled.
+	"""
+	rng = random.Random(seed)
+	updates = {}
+	for pattern in timetable.patterns:
+		for trip in pattern.trips:
+			if rng.random() >= share:
+				continue
+			if rng.random() < 0.05:
+				updates[timetable.trip_ids[trip]] = TripUpdate(cancelled=True, delay=None, stops=())
+				continue
+			delay = rng.randrange(60, 601)
+			position = rng.randrange(len(pattern.stops))
+			stop = StopUpdate(stop_sequence=position + 1, stop_id=None, arrival_delay=delay, departure_delay=delay)
+			updates[timetable.trip_ids[trip]] = TripUpdate(cancelled=False, delay=None, stops=(stop,))
+	return updates
+
+
+def run_realtime_benchmark(engines, queries, timetable, share, seed=0, repeat=5):
+	"""
+	Applies seeded delays to `share` of the trips and reports the apply latency (the
+	whole feed at once, then an update changing a single trip) and, for every engine,
+	the latency of the workload on the delayed timetable against the static one.
+	"""
+	updates = make_trip_updates(timetable, share, seed)
+	full, single = [], []
+	for _ in range(repeat):
+		overlay = DelayOverlay()
+		started = perf_counter()
+		overlay.apply(updates, base=timetable)
+		full.append(perf_counter() - started)
+		if updates:
+			trip_id, update = next(iter(updates.items()))
+			changed = dict(updates)
+			changed[trip_id] = update._replace(cancelled=False, delay=(update.delay or 0) + 30)
+			started = perf_counter()
+			overlay.apply(changed, base=timetable)
+			single.append(perf_counter() - started)
+	live = overlay.timetable(base=timetable)
+	delayed, cancelled = overlay.delayed_trips()
+
+	report = {
+		'share': share,
+		'delayed_trips': delayed,
+		'cancelled_trips': cancelled,
+		'delayed_patterns': sum(pattern is not original for pattern, original in zip(live.patterns, timetable.patterns)),
+		'apply_ms': {
+			'full': _round(statistics.median(full) * 1000),
+			'single_trip': _round(statistics.median(single) * 1000) if single else None,
+		},
+		'engines': {},
+	}
+	for engine in engines:
+		static = run_benchmark(engine, queries, timetable, measure_memory=False)
+		delayed_run = run_benchmark(engine, queries, live, measure_memory=False)
+		base_p50, live_p50 = static['latency_ms']['p50'], delayed_run['latency_ms']['p50']
+		report['engines'][engine] = {
+			'static_ms': static['latency_ms'],
+			'delayed_ms': delayed_run['latency_ms'],
+			'p50_overhead_pct': round((live_p50 / base_p50 - 1) * 100, 1) if base_p50 else None,
+		}
+	return report
+
+
+def _round(value):
+	return None if value is None else round(value, 3)
+
+
+def environment():
+	"""What a result file needs to say about where it was produced."""
+	return {
+		'python': platform.python_version(),
+		'implementation': platform.python_implementation(),
+		'machine': platform.machine(),
+		'timestamp': datetime.now().isoformat(timespec='seconds'),
+	}
@@ -0,0 +1,89 @@
+"""
+Fast JSON encoding of planner results.
+
+encode_itineraries produces exactly the bytes DRF's JSONRenderer would render for
+ItinerarySerializer(itineraries, many=True).data, but builds plain dicts straight
+from the dataclasses instead of walking serializer fields. Timestamps repeat a lot
+across the legs of one response (a walk ends when the next ride starts), so their
+ISO strings are cached. orjson is used when installed, the json module otherwise.
+(The one difference: orjson writes coordinates closer than 1e-4 to zero positionally,
+0.00001 rather than 1e-05, which parses to the same number.)
+"""
+import json
+from datetime import timezone as dt_timezone
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils import timezone
+
+try:
+	import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+	orjson = None
+
+
+def encode_itineraries(itineraries):
+	"""Returns the JSON bytes of a list of Itinerary objects."""
+	tz = _current_timezone()
+	return _dumps([_itinerary_dict(itinerary, tz) for itinerary in itineraries])
+
+
+def encode_itinerary(itinerary):
+	"""Returns the JSON bytes of a single Itinerary (one element of encode_itineraries)."""
+	return _dumps(_itinerary_dict(itinerary, _current_timezone()))
+
+
+def _dumps(data):
+	if orjson is not None:
+		# JSONRenderer escapes the two line terminators that are valid JSON but not valid JavaScript
+		return orjson.dumps(data).replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+	content = json.dumps(data, ensure_ascii=False, allow_nan=False, separators=(',', ':'))
+	return content.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+
+
+def _itinerary_dict(itinerary, tz):
+	total = itinerary.total_duration
+	return {
+		'legs': [_leg_dict(leg, tz) for leg in itinerary.legs],
+		'start_time': _format_datetime(itinerary.start_time, tz),
+		'end_time': _format_datetime(itinerary.end_time, tz),
+		'total_duration_minutes': None if total is None else round(total.total_seconds() / 60),
+	}
+
+
+def _leg_dict(leg, tz):
+	return {
+		'mode': str(leg.mode),
+		'start_time': _format_datetime(leg.start_time, tz),
+		'end_time': _format_datetime(leg.end_time, tz),
+		'start_location_name': str(leg.start_location_name),
+		'end_location_name': str(leg.end_location_name),
+		'route_short_name': None if leg.route_short_name is None else str(leg.route_short_name),
+		'trip_headsign': None if leg.trip_headsign is None else str(leg.trip_headsign),
+		'num_stops': None if leg.num_stops is None else int(leg.num_stops),
+		'duration_minutes': round(leg.duration.total_seconds() / 60),
+		# Already float pairs; both backends write tuples as JSON arrays
+		'path': leg.path,
+	}
+
+
+def _current_timezone():
+	return timezone.get_current_timezone() if settings.USE_TZ else None
+
+
+@lru_cache(maxsize=4096)
+def _format_datetime(value, tz):
+	"""Formats like serializers.DateTimeField: in the current timezone, with 'Z' for UTC."""
+	if not value:
+		return None
+	if tz is not None:
+		if timezone.is_aware(value):
+			value = value.astimezone(tz)
+		else:
+			value = timezone.make_aware(value, tz)
+	elif timezone.is_aware(value):
+		value = timezone.make_naive(value, dt_timezone.utc)
+	formatted = value.isoformat()
+	if formatted.endswith('+00:00'):
+		formatted = formatted[:-6] + 'Z'
+	return formatted
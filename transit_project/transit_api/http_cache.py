@@ -0,0 +1,174 @@
+"""
+HTTP caching of the read-only endpoints, keyed on the imported feed.
+
+Routes, stops, trips and stop times only change when import_transit_data runs, and
+it records a hash of the source files in FeedInfo. Responses carry an ETag built from
+that version (and the representation), so a client or proxy revalidating with
+If-None-Match gets a 304 without the view touching the database: the version itself
+is read at most every settings.TRANSIT_FEED_VERSION_SECONDS per process. Rendered
+bodies are also kept in a per-process LRU bounded to settings.TRANSIT_RESPONSE_CACHE_BYTES,
+keyed by (path, query, feed version, media type), so a new import never serves
+an old body.
+"""
+import functools
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+
+from .models import FeedInfo
+from .planning.stats import render_counters
+
+
+class FeedVersionCache:
+	"""FeedInfo.current_version(), read from the database at most once per TTL."""
+	def __init__(self):
+		self._lock = threading.Lock()
+		self.clear()
+
+	def get(self):
+		if time.monotonic() < self._expires:
+			return self._version
+		with self._lock:
+			if time.monotonic() >= self._expires:
+				self._version = FeedInfo.current_version()
+				self._expires = time.monotonic() + settings.TRANSIT_FEED_VERSION_SECONDS
+			return self._version
+
+	def clear(self):
+		self._version = None
+		self._expires = 0.0
+
+
+class ResponseCache:
+	"""A bounded LRU of rendered response bodies, safe to use from any thread."""
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._entries = OrderedDict()  # key -> (content, content type)
+		self.size = 0                  # bytes of content held
+		self.reset_metrics()
+
+	def reset_metrics(self):
+		self.hits = 0
+		self.misses = 0
+		self.not_modified = 0  # conditional requests answered with 304
+
+	def get(self, key):
+		"""The (content, content type) cached for `key`, or None."""
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is None:
+				self.misses += 1
+				return None
+			self._entries.move_to_end(key)
+			self.hits += 1
+			return entry
+
+	def put(self, key, content, content_type, max_bytes):
+		"""Caches a body, dropping the least recently used ones to stay within `max_bytes`."""
+		if len(content) > max_bytes:
+			return
+		with self._lock:
+			if key in self._entries:
+				self.size -= len(self._entries.pop(key)[0])
+			self._entries[key] = (content, content_type)
+			self.size += len(content)
+			while self.size > max_bytes:
+				_, (dropped, _) = self._entries.popitem(last=False)
+				self.size -= len(dropped)
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+			self.size = 0
+
+	def __len__(self):
+		return len(self._entries)
+
+	def render(self, prefix):
+		"""The counters in the Prometheus text format, named `<prefix>_...`."""
+		with self._lock:
+			counters = [
+				('hits_total', 'Read-only responses served from the response cache.', self.hits),
+				('misses_total', 'Read-only responses the response cache could not serve.', self.misses),
+				('not_modified_total', 'Conditional requests answered with 304 Not Modified.', self.not_modified),
+			]
+			gauges = [
+				('entries', 'Rendered responses currently cached.', len(self._entries)),
+				('bytes', 'Size of the rendered responses currently cached.', self.size),
+			]
+		return render_counters(prefix, counters) + render_counters(prefix, gauges, 'gauge')
+
+
+# Shared by every request in this process
+feed_version_cache = FeedVersionCache()
+response_cache = ResponseCache()
+
+
+def clear_http_cache():
+	"""Forgets the feed version and the cached bodies (e.g. after an import)."""
+	feed_version_cache.clear()
+	response_cache.clear()
+
+
+def _patch_headers(response, etag):
+	response['ETag'] = etag
+	patch_cache_control(response, public=True, max_age=settings.TRANSIT_HTTP_CACHE_SECONDS)
+	patch_vary_headers(response, ('Accept',))
+	return response
+
+
+def feed_cached(handler):
+	"""
+	Wraps a GET handler of a FeedCachedMixin view: answers 304 or a cached body when it
+	can, and otherwise lets the view's finalize_response cache what the handler returns.
+	"""
+	@functools.wraps(handler)
+	def wrapper(self, request, *args, **kwargs):
+		version = feed_version_cache.get()
+		if version is None:
+			return handler(self, request, *args, **kwargs)  # nothing imported yet
+		etag = f'"{version[:16]}-{request.accepted_renderer.format}"'
+		not_modified = get_conditional_response(request, etag=etag)
+		if not_modified is not None:
+			response_cache.not_modified += 1
+			return _patch_headers(not_modified, etag)
+		key = (request.path, urlencode(sorted(request.query_params.lists()), doseq=True), version, request.accepted_media_type)
+		cached = response_cache.get(key)
+		if cached is not None:
+			content, content_type = cached
+			return _patch_headers(HttpResponse(content, content_type=content_type), etag)
+		self.feed_cache_entry = (key, etag)
+		return handler(self, request, *args, **kwargs)
+	return wrapper
+
+
+class FeedCachedMixin:
+	"""
+	Feed-version caching (see the module docstring) for the list and detail views of a
+	read-only ViewSet. Extra actions opt in with @feed_cached.
+	"""
+	feed_cache_entry = None
+
+	@feed_cached
+	def list(self, request, *args, **kwargs):
+		return super().list(request, *args, **kwargs)
+
+	@feed_cached
+	def retrieve(self, request, *args, **kwargs):
+		return super().retrieve(request, *args, **kwargs)
+
+	def finalize_response(self, request, response, *args, **kwargs):
+		response = super().finalize_response(request, response, *args, **kwargs)
+		if self.feed_cache_entry is not None and response.status_code == 200:
+			key, etag = self.feed_cache_entry
+			_patch_headers(response, etag)
+			max_bytes = settings.TRANSIT_RESPONSE_CACHE_BYTES
+			if max_bytes > 0:
+				response.render()
+				response_cache.put(key, response.content, response['Content-Type'], max_bytes)
+		return response
@@ -0,0 +1,258 @@
+"""
+Load tests of the HTTP API.
+
+make_http_workload draws a seeded mix of /plan/, /stops/ and /routes/ requests from
+a timetable; run_load replays it against a running server with a fixed number of
+concurrent clients and summarises throughput, latency percentiles and errors per
+endpoint. The clients are asyncio coroutines speaking plain HTTP/1.1 with keep-alive
+(no third-party client needed), so one process can keep a multi-worker server busy.
+start_server runs `manage.py runserver` on the configured database for the duration
+of a test; `manage.py load_test` ties it together.
+"""
+import asyncio
+import contextlib
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from time import perf_counter
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+
+from .benchmarks import make_workload, percentile
+
+ENDPOINTS = ('plan', 'stops', 'routes')
+# Share of each endpoint in a workload
+DEFAULT_MIX = {'plan': 0.5, 'stops': 0.3, 'routes': 0.2}
+# /plan/ requests ask for the itineraries leaving in this window
+PLAN_WINDOW = timedelta(minutes=30)
+API_PREFIX = '/api/v1'
+
+
+def make_http_workload(timetable, count, seed=0, mix=None):
+	"""
+	Returns `count` requests ({'endpoint': ..., 'path': ...}) drawn in the proportions of
+	`mix`. /plan/ uses the planner benchmark's queries; /stops/ is split between the
+	list, single stops and name search, /routes/ between the list and single routes.
+	The same seed and feed always give the same list.
+	"""
+	mix = mix or DEFAULT_MIX
+	rng = random.Random(seed)
+	endpoints = rng.choices(list(mix), weights=list(mix.values()), k=count)
+	queries = iter(make_workload(timetable, endpoints.count('plan'), seed=seed))
+	route_ids = sorted(timetable.route_names)
+	requests = []
+	for endpoint in endpoints:
+		if endpoint == 'plan':
+			query = next(queries)
+			depart = datetime.fromisoformat(query['depart'])
+			path = '/plan/?' + urlencode({
+				'from_lat': query['origin'][0], 'from_lon': query['origin'][1],
+				'to_lat': query['destination'][0], 'to_lon': query['destination'][1],
+				'depart_after': depart.isoformat(), 'depart_before': (depart + PLAN_WINDOW).isoformat(),
+			})
+		elif endpoint == 'stops':
+			stop = rng.randrange(len(timetable.stop_ids))
+			kind = rng.random()
+			if kind < 0.1:
+				path = '/stops/'
+			elif kind < 0.7:
+				path = f'/stops/{timetable.stop_ids[stop]}/'
+			else:
+				prefix = (timetable.stop_names[stop].split() or ['stop'])[0][:4].lower()
+				path = '/stops/search/?' + urlencode({'q': prefix})
+		elif endpoint == 'routes':
+			path = '/routes/' if not route_ids or rng.random() < 0.3 else f'/routes/{rng.choice(route_ids)}/'
+		else:
+			raise ValueError(f"unknown endpoint {endpoint!r}")
+		requests.append({'endpoint': endpoint, 'path': API_PREFIX + path})
+	return requests
+
+
+class _Connection:
+	"""One keep-alive HTTP/1.1 connection, reopened whenever the server closes it."""
+	def __init__(self, host, port):
+		self.host = host
+		self.port = port
+		self.reader = self.writer = None
+
+	async def get(self, path):
+		"""Returns (status, body) of a GET of `path`."""
+		for attempt in range(2):
+			fresh = self.writer is None
+			if fresh:
+				self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+			try:
+				self.writer.write((
+					f'GET {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n'
+					'Accept: application/json\r\nConnection: keep-alive\r\n\r\n'
+				).encode('latin-1'))
+				await self.writer.drain()
+				status, headers = await self._read_head()
+				body = await self._read_body(status, headers)
+			except (ConnectionError, asyncio.IncompleteReadError):
+				self.close()
+				if fresh:
+					raise
+				continue  # the server dropped an idle connection; retry on a new one
+			if headers.get('connection', '').lower() == 'close':
+				self.close()
+			return status, body
+
+	async def _read_head(self):
+		line = await self.reader.readline()
+		if not line:
+			raise ConnectionResetError('connection closed by the server')
+		status = int(line.split()[1])
+		headers = {}
+		while True:
+			line = await self.reader.readline()
+			if line in (b'\r\n', b'\n', b''):
+				return status, headers
+			name, _, value = line.decode('latin-1').partition(':')
+			headers[name.strip().lower()] = value.strip()
+
+	async def _read_body(self, status, headers):
+		if status in (204, 304) or 100 <= status < 200:
+			return b''
+		if headers.get('transfer-encoding', '').lower() == 'chunked':
+			chunks = []
+			while True:
+				size = int((await self.reader.readline()).split(b';')[0], 16)
+				if size == 0:
+					while (await self.reader.readline()) not in (b'\r\n', b'\n', b''):
+						pass  # trailers
+					return b''.join(chunks)
+				chunks.append(await self.reader.readexactly(size))
+				await self.reader.readexactly(2)
+		if 'content-length' in headers:
+			return await self.reader.readexactly(int(headers['content-length']))
+		body = await self.reader.read()
+		self.close()
+		return body
+
+	def close(self):
+		if self.writer is not None:
+			self.writer.close()
+		self.reader = self.writer = None
+
+
+def _split_url(url):
+	parts = urlsplit(url)
+	if parts.scheme != 'http' or not parts.hostname:
+		raise ValueError(f"{url!r} is not an http:// URL")
+	return parts.hostname, parts.port or 80, parts.path.rstrip('/')
+
+
+async def _replay(url, requests, concurrency, timeout):
+	host, port, base_path = _split_url(url)
+	pending = iter(requests)  # shared by the clients; the event loop runs one at a time
+	results = []              # (endpoint, seconds, error or None)
+
+	async def client():
+		connection = _Connection(host, port)
+		try:
+			for request in pending:
+				started = perf_counter()
+				try:
+					status, _ = await asyncio.wait_for(connection.get(base_path + request['path']), timeout)
+					error = f'HTTP {status}' if status >= 400 else None
+				except asyncio.TimeoutError:
+					connection.close()
+					error = 'timeout'
+				except (OSError, ValueError, IndexError, asyncio.IncompleteReadError) as e:
+					connection.close()
+					error = type(e).__name__
+				results.append((request['endpoint'], perf_counter() - started, error))
+		finally:
+			connection.close()
+
+	started = perf_counter()
+	await asyncio.gather(*(client() for _ in range(concurrency)))
+	return results, perf_counter() - started
+
+
+def _summarise(results, elapsed):
+	latencies_ms = sorted(seconds * 1000 for _, seconds, _ in results)
+	errors = Counter(error for _, _, error in results if error is not None)
+	return {
+		'requests': len(results),
+		'errors': sum(errors.values()),
+		'error_rate': round(sum(errors.values()) / len(results), 4) if results else None,
+		'error_kinds': dict(errors),
+		'throughput_rps': round(len(results) / elapsed, 2) if elapsed else None,
+		'latency_ms': {
+			'mean': round(statistics.fmean(latencies_ms), 3) if latencies_ms else None,
+			'p50': _round(percentile(latencies_ms, 0.50)),
+			'p90': _round(percentile(latencies_ms, 0.90)),
+			'p99': _round(percentile(latencies_ms, 0.99)),
+			'max': _round(latencies_ms[-1] if latencies_ms else None),
+		},
+	}
+
+
+def run_load(url, requests, concurrency, timeout=30):
+	"""
+	Sends `requests` to the server at `url` from `concurrency` clients, each issuing
+	its next request as soon as the previous one is answered, and returns a
+	JSON-serialisable summary: 'total' plus one entry per endpoint. Throughput is per
+	second of the whole run; a request fails on a connection error, a timeout or a
+	status of 400 and above.
+	"""
+	results, elapsed = asyncio.run(_replay(url, requests, max(1, concurrency), timeout))
+	summary = {
+		'concurrency': concurrency,
+		'seconds': round(elapsed, 4),
+		'total': _summarise(results, elapsed),
+		'endpoints': {},
+	}
+	for endpoint in sorted({endpoint for endpoint, _, _ in results}):
+		summary['endpoints'][endpoint] = _summarise([r for r in results if r[0] == endpoint], elapsed)
+	return summary
+
+
+def wait_until_ready(url, timeout=60, process=None):
+	"""Polls /ready/ until the server answers 200; raises RuntimeError after `timeout` seconds."""
+	deadline = time.monotonic() + timeout
+	while True:
+		results, _ = asyncio.run(_replay(url, [{'endpoint': 'ready', 'path': API_PREFIX + '/ready/'}], 1, 5))
+		if results[0][2] is None:
+			return
+		if process is not None and process.poll() is not None:
+			raise RuntimeError(f'the server exited with status {process.returncode}')
+		if time.monotonic() > deadline:
+			raise RuntimeError(f'{url} was not ready after {timeout}s')
+		time.sleep(0.2)
+
+
+@contextlib.contextmanager
+def start_server(port, host='127.0.0.1', timeout=60):
+	"""
+	Runs `manage.py runserver` (threaded, without the autoreloader) on this project's
+	settings and database, yields its URL once /ready/ answers, and stops it on exit.
+	"""
+	url = f'http://{host}:{port}'
+	process = subprocess.Popen(
+		[sys.executable, str(settings.BASE_DIR / 'manage.py'), 'runserver', '--noreload', f'{host}:{port}'],
+		env={**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'transit_project.settings')},
+		stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+	)
+	try:
+		wait_until_ready(url, timeout, process)
+		yield url
+	finally:
+		process.terminate()
+		try:
+			process.wait(timeout=10)
+		except subprocess.TimeoutExpired:
+			process.kill()
+			process.wait()
+
+
+def _round(value):
+	return None if value is None else round(value, 3)
@@ -0,0 +1,96 @@
+import json
+import time
+import tracemalloc
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from transit_api.benchmarks import ENGINES, environment, make_workload, run_benchmark, run_realtime_benchmark
+from transit_api.planning.timetable import Timetable
+from transit_api.planning.transfer_patterns import get_transfer_patterns
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the planners on a seeded origin/destination workload over the imported feed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=50, help='Number of queries in the workload')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the workload')
+        parser.add_argument('--engine', choices=sorted(ENGINES), action='append',
+                            help='Planner to benchmark (repeatable; defaults to every available one)')
+        parser.add_argument('--import-dir', help='Import this GTFS directory first (replaces the imported feed)')
+        parser.add_argument('--no-memory', action='store_true', help='Skip the tracemalloc pass')
+        parser.add_argument('--delayed-share', type=float, default=0,
+                            help='Also measure real-time delays on this share of the trips (0 to 1)')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        if options['import_dir']:
+            started = time.perf_counter()
+            call_command('import_transit_data', data_dir=options['import_dir'], stdout=self.stdout)
+            self.stdout.write(f'Imported {options["import_dir"]} in {time.perf_counter() - started:.2f}s')
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        timetable = Timetable.from_db()
+        load_seconds = time.perf_counter() - started
+        timetable_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        if not timetable.stop_ids:
+            raise CommandError('No feed imported; run import_transit_data (or pass --import-dir)')
+
+        engines = options['engine'] or [
+            name for name in sorted(ENGINES) if name != 'transfer_patterns' or get_transfer_patterns() is not None
+        ]
+        queries = make_workload(timetable, options['queries'], seed=options['seed'])
+        report = {
+            'environment': environment(),
+            'feed': {
+                'version': timetable.feed_version,
+                'stops': len(timetable.stop_ids),
+                'trips': len(timetable.trip_ids),
+                'patterns': len(timetable.patterns),
+                'load_seconds': round(load_seconds, 3),
+                'timetable_mib': round(timetable_bytes / (1 << 20), 2),
+            },
+            'workload': {'seed': options['seed'], 'queries': len(queries)},
+            'results': {},
+        }
+        self.stdout.write(
+            f'Feed: {len(timetable.stop_ids)} stops, {len(timetable.patterns)} patterns, {len(timetable.trip_ids)} trips '
+            f'(loaded in {load_seconds:.2f}s, {timetable_bytes / (1 << 20):.1f} MiB)'
+        )
+
+        for engine in engines:
+            result = run_benchmark(engine, queries, timetable, measure_memory=not options['no_memory'])
+            report['results'][engine] = result
+            latency = result['latency_ms']
+            line = (
+                f'{engine:>18}: p50 {latency["p50"]:.2f}ms  p95 {latency["p95"]:.2f}ms  p99 {latency["p99"]:.2f}ms  '
+                f'{result["throughput_qps"]:.1f} q/s  {result["answered"]}/{result["queries"]} answered'
+            )
+            if result['expansions_per_query'] is not None:
+                line += f'  {result["expansions_per_query"]:.0f} expansions/query'
+            if result['peak_memory_kib'] is not None:
+                line += f'  peak {result["peak_memory_kib"]["max"]:.0f} KiB'
+            self.stdout.write(line)
+
+        if options['delayed_share'] > 0:
+            realtime = run_realtime_benchmark(engines, queries, timetable, options['delayed_share'], seed=options['seed'])
+            report['realtime'] = realtime
+            self.stdout.write(
+                f'Delays: {realtime["delayed_trips"]} trips delayed, {realtime["cancelled_trips"]} cancelled '
+                f'({realtime["delayed_patterns"]} patterns); applied in {realtime["apply_ms"]["full"]:.2f}ms, '
+                f'one trip changed in {realtime["apply_ms"]["single_trip"] or 0:.2f}ms'
+            )
+            for engine, result in realtime['engines'].items():
+                overhead = result['p50_overhead_pct']
+                self.stdout.write(
+                    f'{engine:>18}: p50 {result["static_ms"]["p50"]:.2f}ms static, {result["delayed_ms"]["p50"]:.2f}ms delayed'
+                    + (f' ({overhead:+.1f}%)' if overhead is not None else '')
+                )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f'Wrote {options["output"]}')
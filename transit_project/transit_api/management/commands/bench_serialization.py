@@ -0,0 +1,57 @@
+import timeit
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from transit_api.encoders import encode_itineraries
+from transit_api.planning.itinerary import Itinerary, RouteLeg
+from transit_api.serializers import ItinerarySerializer
+
+
+def sample_itineraries(count):
+    """`count` realistic itineraries: walk, ride, transfer walk, ride, walk, with leg geometry."""
+    itineraries = []
+    start = datetime(2025, 11, 17, 8, 0)
+    for i in range(count):
+        t = start + timedelta(minutes=i)
+        times = [t + timedelta(minutes=m) for m in (0, 4, 21, 24, 38, 43)]
+        points = [(round(43.5 + 0.0011 * p, 6), round(-80.25 + 0.0007 * p, 6)) for p in range(81)]
+        itineraries.append(Itinerary(legs=[
+            RouteLeg('walk', times[0], times[1], 'Your Location', 'University Centre', path=points[0:2]),
+            RouteLeg('transit', times[1], times[2], 'University Centre', 'Guelph Central Station', '99', 'Mainline North', 9, path=points[1:41]),
+            RouteLeg('walk', times[2], times[3], 'Guelph Central Station', 'Carden St at Wyndham', path=points[40:42]),
+            RouteLeg('transit', times[3], times[4], 'Carden St at Wyndham', 'Stone Road Mall', '5', 'Gordon – Downtown', 11, path=points[41:80]),
+            RouteLeg('walk', times[4], times[5], 'Stone Road Mall', 'Your Destination', path=points[79:81]),
+        ]))
+    return itineraries
+
+
+def render_with_serializer(itineraries):
+    return JSONRenderer().render(ItinerarySerializer(itineraries, many=True).data)
+
+
+class Command(BaseCommand):
+    help = 'Compares the itinerary encoder with the DRF serializer path on synthetic responses.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[5, 50, 500], help='Itineraries per response')
+        parser.add_argument('--repeat', type=int, default=5, help='Timing runs per size (best is reported)')
+
+    def handle(self, *args, **options):
+        for size in options['sizes']:
+            itineraries = sample_itineraries(size)
+            if encode_itineraries(itineraries) != render_with_serializer(itineraries):
+                self.stderr.write(self.style.ERROR(f'{size} itineraries: encoder output differs from DRF'))
+                continue
+
+            number = max(1, 2000 // size)
+            results = {}
+            for name, render in (('DRF serializer', render_with_serializer), ('encoder', encode_itineraries)):
+                best = min(timeit.repeat(lambda: render(itineraries), number=number, repeat=options['repeat']))
+                results[name] = best / number * 1000
+            speedup = results['DRF serializer'] / results['encoder']
+            self.stdout.write(
+                f'{size:>5} itineraries: DRF {results["DRF serializer"]:.3f}ms, '
+                f'encoder {results["encoder"]:.3f}ms ({speedup:.1f}x)'
+            )
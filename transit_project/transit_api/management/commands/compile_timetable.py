@@ -0,0 +1,37 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from transit_api.planning.compiled import load_timetable, write_timetable
+from transit_api.planning.timetable import Timetable
+
+
+class Command(BaseCommand):
+    help = 'Compiles the imported feed into a memory-mappable binary timetable file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='File to write (defaults to settings.TRANSIT_TIMETABLE_FILE)')
+
+    def handle(self, *args, **options):
+        path = options.get('output') or getattr(settings, 'TRANSIT_TIMETABLE_FILE', None)
+        if not path:
+            raise CommandError('No output file given and TRANSIT_TIMETABLE_FILE is not set')
+
+        started = time.perf_counter()
+        timetable = Timetable.from_db()
+        if timetable.feed_version is None:
+            self.stdout.write('Warning: no feed version recorded; run import_transit_data first')
+        size = write_timetable(timetable, path)
+        built = time.perf_counter() - started
+
+        # Map the result once to make sure it loads, and report how fast a cold worker gets it
+        started = time.perf_counter()
+        load_timetable(path, expected_version=timetable.feed_version)
+        loaded = time.perf_counter() - started
+
+        self.stdout.write(
+            f'Wrote {path}: {len(timetable.stop_ids)} stops, {len(timetable.patterns)} patterns, '
+            f'{len(timetable.trip_ids)} trips, {size / 1024:.1f} KiB '
+            f'(compiled in {built:.2f}s, maps in {loaded * 1000:.1f}ms)'
+        )
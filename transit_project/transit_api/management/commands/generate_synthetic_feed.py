@@ -0,0 +1,107 @@
+import json
+import resource
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_time
+from rest_framework.test import APIRequestFactory
+
+from transit_api.benchmarks import ENGINES
+from transit_api.synthetic import GUELPH_ROUTES, GUELPH_STOPS, generate_feed
+from transit_api.views import RouteViewSet, StopViewSet
+
+
+def _seconds(value):
+    parsed = parse_time(value)
+    if parsed is None:
+        raise CommandError(f"'{value}' is not a valid HH:MM time")
+    return parsed.hour * 3600 + parsed.minute * 60
+
+
+def _max_rss_mib():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = ('Writes a synthetic GTFS feed in the route-data layout, sized as a multiple of the Guelph feed. '
+            'With --benchmark it then imports the feed (replacing the imported one) and benchmarks import, '
+            'the list endpoints and the planners.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', required=True, help='Directory to write the CSV files to')
+        parser.add_argument('--scale', type=float, default=10, help='Size relative to the Guelph feed (default 10)')
+        parser.add_argument('--stops', type=int, help='Number of stops (overrides --scale)')
+        parser.add_argument('--routes', type=int, help='Number of routes (overrides --scale)')
+        parser.add_argument('--headway', type=int, default=15, help='Off-peak minutes between trips (halved in the peaks)')
+        parser.add_argument('--service-start', default='06:00', help='First departures (HH:MM)')
+        parser.add_argument('--service-end', default='23:00', help='Last departures (HH:MM)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--benchmark', action='store_true', help='Import the feed and benchmark it afterwards')
+        parser.add_argument('--queries', type=int, default=50, help='Planner queries for --benchmark')
+        parser.add_argument('--engine', choices=sorted(ENGINES), action='append',
+                            help='Planner to benchmark (repeatable; defaults to every available one)')
+        parser.add_argument('--benchmark-output', help='Write the --benchmark results to this JSON file')
+
+    def handle(self, *args, **options):
+        stops = options['stops'] or round(GUELPH_STOPS * options['scale'])
+        routes = options['routes'] or round(GUELPH_ROUTES * options['scale'])
+        if stops < 2 or routes < 1 or options['headway'] < 1:
+            raise CommandError('Need at least 2 stops, 1 route and a positive headway')
+
+        started = time.perf_counter()
+        counts = generate_feed(
+            options['output'], stops=stops, routes=routes, headway_minutes=options['headway'],
+            service_start=_seconds(options['service_start']), service_end=_seconds(options['service_end']),
+            seed=options['seed'],
+        )
+        self.stdout.write(
+            f'Wrote {options["output"]} in {time.perf_counter() - started:.1f}s: '
+            + ', '.join(f'{count} {name.replace("_", " ")}' for name, count in counts.items())
+        )
+        if options['benchmark']:
+            self._benchmark(options, counts)
+
+    def _benchmark(self, options, counts):
+        report = {'feed': counts}
+
+        rss_before = _max_rss_mib()
+        started = time.perf_counter()
+        call_command('import_transit_data', data_dir=options['output'], stdout=self.stdout)
+        report['import'] = {
+            'seconds': round(time.perf_counter() - started, 2),
+            'max_rss_growth_mib': round(_max_rss_mib() - rss_before, 1),
+        }
+        self.stdout.write(f'Import: {report["import"]["seconds"]}s, peak RSS +{report["import"]["max_rss_growth_mib"]} MiB')
+
+        # List endpoints, rendered the way a client would receive them
+        factory = APIRequestFactory()
+        report['endpoints'] = {}
+        for name, viewset in (('routes', RouteViewSet), ('stops', StopViewSet)):
+            view = viewset.as_view({'get': 'list'})
+            started = time.perf_counter()
+            try:
+                response = view(factory.get(f'/api/v1/{name}/', HTTP_ACCEPT='application/json'))
+                response.render()
+            except Exception as e:
+                report['endpoints'][name] = {'error': str(e)}
+                self.stdout.write(f'GET /{name}/ failed: {e}')
+                continue
+            report['endpoints'][name] = {
+                'seconds': round(time.perf_counter() - started, 3),
+                'bytes': len(response.content),
+            }
+            self.stdout.write(f'GET /{name}/: {report["endpoints"][name]["seconds"]}s, {len(response.content)} bytes')
+
+        planner_output = options['benchmark_output'] and options['benchmark_output'] + '.planner.json'
+        call_command(
+            'bench_planner', queries=options['queries'], seed=options['seed'], engine=options['engine'],
+            output=planner_output, stdout=self.stdout,
+        )
+        if options['benchmark_output']:
+            with open(planner_output) as f:
+                report['planner'] = json.load(f)
+            with open(options['benchmark_output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f'Wrote {options["benchmark_output"]}')
@@ -1,9 +1,33 @@
 import csv
+import hashlib
 import os
 from datetime import datetime, time
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, transaction
+from django.db.models import Max
 from django.utils.dateparse import parse_time
-from transit_api.models import Route, Stop, StopTime, Trip, Shape
+from transit_api.models import DEFAULT_FEED, FeedInfo, FeedTransfer, Route, RoutePattern, Stop, StopTime, Trip, Shape, ShapeGeometry
+from transit_api.planning.patterns import build_patterns, gtfs_time_seconds
+from transit_api.planning.shapes import build_shapes
+from transit_api.planning.timetable import clear_timetable_cache, inter_feed_transfers
+from transit_api.http_cache import clear_http_cache
+from transit_api.search import clear_stop_index
+
+GTFS_FILES = ('routes.csv', 'stops.csv', 'stop_times.csv', 'trips.csv', 'shapes.csv')
+# Every feed's GTFS ids are stored plus a multiple of this (0 for the default feed),
+# which keeps the ids of different feeds apart and within int32
+FEED_ID_SPAN = 100_000_000
+INT32_MAX = 2 ** 31 - 1
+
+def feed_version(data_dir):
+    """Hashes the source files so every distinct feed gets a distinct version."""
+    digest = hashlib.sha256()
+    for name in GTFS_FILES:
+        digest.update(name.encode())
+        with open(os.path.join(data_dir, name), 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
 
 def parse_gtfs_time(time_str):
     """Parse GTFS time which can be in 24+ hour format."""
@@ -18,101 +42,232 @@ def parse_gtfs_time(time_str):
     
     return time(hours, minutes, seconds)
 
+def feed_id_offset(feed):
+    """The offset of `feed`'s ids: kept across re-imports, the next free one for a new feed."""
+    if feed == DEFAULT_FEED:
+        return 0
+    existing = FeedInfo.objects.filter(feed=feed).values_list('id_offset', flat=True).first()
+    if existing is not None:
+        return existing
+    highest = FeedInfo.objects.aggregate(highest=Max('id_offset'))['highest']
+    offset = (highest or 0) + FEED_ID_SPAN
+    if offset + FEED_ID_SPAN - 1 > INT32_MAX:
+        raise CommandError(
+            f'No room left for the ids of feed {feed}: its offset {offset} would push them past {INT32_MAX} '
+            f'(at most {INT32_MAX // FEED_ID_SPAN} feeds besides the default one fit)'
+        )
+    return offset
+
 class Command(BaseCommand):
+    help = 'Imports one GTFS feed directory, replacing the previous import of the same feed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--data-dir', help='Directory holding the GTFS CSV files (defaults to the repo route-data, or route-data/<feed>)')
+        parser.add_argument('--feed', default=DEFAULT_FEED, help='Id of the feed (agency); other feeds are left as they are')
+
     def handle(self, *args, **options):
-        # Clear existing data (ignore if tables don't exist yet)
-        self.stdout.write('Clearing existing data...')
+        feed = options.get('feed') or DEFAULT_FEED
+
+        offset = 0
         try:
-            Route.objects.all().delete()
-            Stop.objects.all().delete()
-            StopTime.objects.all().delete()
-            Trip.objects.all().delete()
-            Shape.objects.all().delete()
-        except Exception as e:
+            offset = feed_id_offset(feed)
+        except DatabaseError as e:
             self.stdout.write(f'Tables not yet created: {e}')
-        
-        # Get the base directory (5 levels up from this script to reach repo root)
-        base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
-        data_dir = os.path.join(base_dir, 'route-data')
-        
-        # Load Routes
-        routes = []
-        with open(os.path.join(data_dir, 'routes.csv'), newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                routes.append(Route(
-                    id=int(row['route_id']),
-                    short_name=row['route_short_name'],
-                    long_name=row['route_long_name'],
-                    color=row['route_color']
-                ))
-        Route.objects.bulk_create(routes)
-
-        # Load Stops
-        stops = []
-        with open(os.path.join(data_dir, 'stops.csv'), newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                stops.append(Stop(
-                    id=int(row['stop_id']),
-                    code=int(row['stop_code']),
-                    name=row['stop_name'],
-                    desc=row['stop_desc'],
-                    latitude=float(row['stop_lat']),
-                    longitude=float(row['stop_lon'])
-                ))
-        Stop.objects.bulk_create(stops)
-
-        # Load StopTimes
-        stoptimes = []
-        with open(os.path.join(data_dir, 'stop_times.csv'), newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                stoptimes.append(StopTime(
-                    trip_id=int(row['trip_id']),
-                    stop_sequence=int(row['stop_sequence']),
-                    arrival_time=parse_gtfs_time(row['arrival_time']),
-                    departure_time=parse_gtfs_time(row['departure_time']),
-                    stop_id=int(row['stop_id']),
-                    pick_up=bool(int(row['pickup_type'])),
-                    drop_off=bool(int(row['drop_off_type'])),
-                    shape_dist_traveled=float(row['shape_dist_traveled']) if row['shape_dist_traveled'] else 0,
-                    timepoint=bool(int(row['timepoint']))
-                ))
-        StopTime.objects.bulk_create(stoptimes)
-
-        # Load Trips
-        trips = []
-        with open(os.path.join(data_dir, 'trips.csv'), newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                try:
-                    wheelchair = int(row['wheelchair_accessible']) if row.get('wheelchair_accessible', '').strip() else 0
-                    bikes = int(row['bikes_allowed']) if row.get('bikes_allowed', '').strip() else 0
-                    trips.append(Trip(
-                        route_id=int(row['route_id']),
-                        id=int(row['trip_id']),
-                        trip_headsign=row['trip_headsign'],
-                        direction_id=bool(int(row['direction_id'])) if row.get('direction_id', '').strip() else False,
-                        shape_id=int(row['shape_id']) if row.get('shape_id', '').strip() else 0,
-                        is_accessible=bool(wheelchair),
-                        is_bikes=bool(bikes)
+
+        # The old import of the feed stays in place until the new one is complete
+        with transaction.atomic():
+            # Clear this feed's data (ignore if tables don't exist yet)
+            self.stdout.write(f'Clearing existing data of feed {feed}...')
+            try:
+                with transaction.atomic():
+                    for model in (Route, Stop, StopTime, Trip, Shape, RoutePattern, ShapeGeometry, FeedInfo):
+                        model.objects.filter(feed=feed).delete()
+                    FeedTransfer.objects.filter(from_feed=feed).delete()
+                    FeedTransfer.objects.filter(to_feed=feed).delete()
+            except DatabaseError as e:
+                self.stdout.write(f'Tables not yet created: {e}')
+
+            def gtfs_id(value):
+                """The stored id of one of this feed's GTFS ids."""
+                value = int(value)
+                if not 0 <= value < FEED_ID_SPAN:
+                    raise CommandError(f'GTFS id {value} of feed {feed} is outside 0..{FEED_ID_SPAN - 1}')
+                return offset + value
+
+            # Get the base directory (5 levels up from this script to reach repo root)
+            base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+            default_dir = os.path.join(base_dir, 'route-data') if feed == DEFAULT_FEED else os.path.join(base_dir, 'route-data', feed)
+            data_dir = options.get('data_dir') or default_dir
+
+            # Load Routes
+            routes = []
+            with open(os.path.join(data_dir, 'routes.csv'), newline='') as csvfile:
+                reader = csv.DictReader(csvfile)
+                for row in reader:
+                    routes.append(Route(
+                        id=gtfs_id(row['route_id']),
+                        feed=feed,
+                        short_name=row['route_short_name'],
+                        long_name=row['route_long_name'],
+                        color=row['route_color']
+                    ))
+            Route.objects.bulk_create(routes)
+
+            # Load Stops
+            stops = []
+            with open(os.path.join(data_dir, 'stops.csv'), newline='') as csvfile:
+                reader = csv.DictReader(csvfile)
+                for row in reader:
+                    stops.append(Stop(
+                        id=gtfs_id(row['stop_id']),
+                        feed=feed,
+                        code=int(row['stop_code']),
+                        name=row['stop_name'],
+                        desc=row['stop_desc'],
+                        latitude=float(row['stop_lat']),
+                        longitude=float(row['stop_lon'])
                     ))
-                except (ValueError, KeyError) as e:
-                    self.stdout.write(f'Error parsing trip row: {e}, row={row}')
-                    continue
-        Trip.objects.bulk_create(trips)
-
-        # Load Shapes
-        shapes = []
-        with open(os.path.join(data_dir, 'shapes.csv'), newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                shapes.append(Shape(
-                    id=int(row['shape_id']),
-                    shape_pt_lat=float(row['shape_pt_lat']),
-                    shape_pt_lon=float(row['shape_pt_lon']),
-                    shape_pt_sequence=int(row['shape_pt_sequence']),
-                    shape_dist_traveled=float(row['shape_dist_traveled'])
-                ))
-        Shape.objects.bulk_create(shapes)
+            Stop.objects.bulk_create(stops)
+
+            # Load StopTimes
+            stoptimes = []
+            trip_stop_times = {}
+            trip_stop_dists = {}
+            with open(os.path.join(data_dir, 'stop_times.csv'), newline='') as csvfile:
+                reader = csv.DictReader(csvfile)
+                for row in reader:
+                    trip_id, stop_id = gtfs_id(row['trip_id']), gtfs_id(row['stop_id'])
+                    stoptimes.append(StopTime(
+                        feed=feed,
+                        trip_id=trip_id,
+                        stop_sequence=int(row['stop_sequence']),
+                        arrival_time=parse_gtfs_time(row['arrival_time']),
+                        departure_time=parse_gtfs_time(row['departure_time']),
+                        stop_id=stop_id,
+                        pick_up=bool(int(row['pickup_type'])),
+                        drop_off=bool(int(row['drop_off_type'])),
+                        shape_dist_traveled=float(row['shape_dist_traveled']) if row['shape_dist_traveled'] else 0,
+                        timepoint=bool(int(row['timepoint']))
+                    ))
+                    # Keep the unwrapped times (which may pass 24:00) for the pattern stage
+                    trip_stop_times.setdefault(trip_id, []).append((
+                        int(row['stop_sequence']),
+                        stop_id,
+                        gtfs_time_seconds(row['arrival_time']),
+                        gtfs_time_seconds(row['departure_time'])
+                    ))
+                    trip_stop_dists.setdefault(trip_id, []).append((
+                        int(row['stop_sequence']),
+                        stop_id,
+                        float(row['shape_dist_traveled']) if row['shape_dist_traveled'] else 0
+                    ))
+            StopTime.objects.bulk_create(stoptimes)
+
+            # Load Trips
+            trips = []
+            with open(os.path.join(data_dir, 'trips.csv'), newline='') as csvfile:
+                reader = csv.DictReader(csvfile)
+                for row in reader:
+                    try:
+                        # GTFS: 0 or empty = no information, 1 = yes, 2 = no
+                        wheelchair = int(row['wheelchair_accessible']) if row.get('wheelchair_accessible', '').strip() else 0
+                        bikes = int(row['bikes_allowed']) if row.get('bikes_allowed', '').strip() else 0
+                        trips.append(Trip(
+                            route_id=gtfs_id(row['route_id']),
+                            id=gtfs_id(row['trip_id']),
+                            feed=feed,
+                            trip_headsign=row['trip_headsign'],
+                            direction_id=bool(int(row['direction_id'])) if row.get('direction_id', '').strip() else False,
+                            shape_id=gtfs_id(row['shape_id']) if row.get('shape_id', '').strip() else 0,
+                            is_accessible=wheelchair == 1,
+                            is_bikes=bikes == 1
+                        ))
+                    except (ValueError, KeyError) as e:
+                        self.stdout.write(f'Error parsing trip row: {e}, row={row}')
+                        continue
+            Trip.objects.bulk_create(trips)
+
+            # Build route patterns: trips sharing a stop sequence, as dense time matrices
+            patterns = build_patterns(trip_stop_times, {trip.id: trip.route_id for trip in trips})
+            RoutePattern.objects.bulk_create([
+                RoutePattern(
+                    id=offset + index,
+                    feed=feed,
+                    route_id=pattern.route_id,
+                    stop_ids=pattern.stop_ids.tobytes(),
+                    trip_ids=pattern.trip_ids.tobytes(),
+                    arrivals=pattern.arrivals.tobytes(),
+                    departures=pattern.departures.tobytes()
+                )
+                for index, pattern in enumerate(patterns)
+            ])
+            self.stdout.write(f'Built {len(patterns)} route patterns from {len(trip_stop_times)} trips')
+
+            # Load Shapes
+            shapes = []
+            with open(os.path.join(data_dir, 'shapes.csv'), newline='') as csvfile:
+                reader = csv.DictReader(csvfile)
+                for row in reader:
+                    shapes.append(Shape(
+                        feed=feed,
+                        shape_id=gtfs_id(row['shape_id']),
+                        shape_pt_lat=float(row['shape_pt_lat']),
+                        shape_pt_lon=float(row['shape_pt_lon']),
+                        shape_pt_sequence=int(row['shape_pt_sequence']),
+                        shape_dist_traveled=float(row['shape_dist_traveled'])
+                    ))
+            Shape.objects.bulk_create(shapes)
+
+            # Index leg geometry: every shape as one coordinate array, with the point offset of each stop on it
+            shape_points = {}
+            for shape in shapes:
+                shape_points.setdefault(shape.shape_id, []).append(
+                    (shape.shape_pt_sequence, shape.shape_pt_lat, shape.shape_pt_lon, shape.shape_dist_traveled)
+                )
+            geometries = build_shapes(
+                shape_points,
+                trip_stop_dists,
+                {trip.id: trip.shape_id for trip in trips},
+                {stop.id: (stop.latitude, stop.longitude) for stop in stops}
+            )
+            ShapeGeometry.objects.bulk_create([
+                ShapeGeometry(
+                    shape_id=shape.shape_id,
+                    feed=feed,
+                    points=shape.points.tobytes(),
+                    stop_ids=shape.stop_ids.tobytes(),
+                    stop_points=shape.stop_points.tobytes()
+                )
+                for shape in geometries
+            ])
+            self.stdout.write(f'Indexed the stops of {len(geometries)} shapes')
+
+            # Walking transfers to the stops of the other feeds
+            transfers = inter_feed_transfers(
+                [(feed, stop.id, stop.latitude, stop.longitude) for stop in stops],
+                list(Stop.objects.exclude(feed=feed).values_list('feed', 'id', 'latitude', 'longitude'))
+            )
+            FeedTransfer.objects.bulk_create([
+                FeedTransfer(from_feed=from_feed, from_stop_id=from_stop, to_feed=to_feed, to_stop_id=to_stop, seconds=seconds)
+                for from_feed, from_stop, to_feed, to_stop, seconds in transfers
+            ])
+            if transfers:
+                self.stdout.write(f'Found {len(transfers)} transfers to other feeds')
+
+            # Record which feed is loaded, and where; compiled timetables check against it
+            version = feed_version(data_dir)
+            FeedInfo.objects.create(
+                feed=feed,
+                version=version,
+                id_offset=offset,
+                min_latitude=min((float(stop.latitude) for stop in stops), default=None),
+                max_latitude=max((float(stop.latitude) for stop in stops), default=None),
+                min_longitude=min((float(stop.longitude) for stop in stops), default=None),
+                max_longitude=max((float(stop.longitude) for stop in stops), default=None)
+            )
+            self.stdout.write(f'Imported feed {feed} version {version}')
+
+        # Planner and search caches in this process are now stale
+        clear_timetable_cache()
+        clear_stop_index()
+        clear_http_cache()
@@ -0,0 +1,92 @@
+import contextlib
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from transit_api.benchmarks import environment
+from transit_api.loadtest import DEFAULT_MIX, ENDPOINTS, make_http_workload, run_load, start_server
+from transit_api.planning.timetable import Timetable
+
+
+def parse_mix(value):
+    """Parses 'plan=0.5,stops=0.3,routes=0.2' into {endpoint: weight}."""
+    mix = {}
+    for part in value.split(','):
+        endpoint, _, weight = part.partition('=')
+        endpoint = endpoint.strip()
+        if endpoint not in ENDPOINTS:
+            raise CommandError(f'Unknown endpoint {endpoint!r} in --mix (expected {", ".join(ENDPOINTS)})')
+        try:
+            mix[endpoint] = float(weight)
+        except ValueError:
+            raise CommandError(f'Invalid weight {weight!r} for {endpoint} in --mix')
+    if not mix or any(weight < 0 for weight in mix.values()) or sum(mix.values()) <= 0:
+        raise CommandError('--mix needs non-negative weights that do not all add up to 0')
+    return mix
+
+
+class Command(BaseCommand):
+    help = 'Load-tests /plan/, /stops/ and /routes/ over HTTP at several concurrency levels.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Test this running server (e.g. gunicorn) instead of starting runserver')
+        parser.add_argument('--port', type=int, default=8765, help='Port of the runserver started for the test')
+        parser.add_argument('--concurrency', type=int, action='append',
+                            help='Number of concurrent clients (repeatable; defaults to 1, 4 and 16)')
+        parser.add_argument('--requests', type=int, default=200, help='Requests sent at each concurrency level')
+        parser.add_argument('--warmup', type=int, default=20, help='Requests sent before measuring, not reported')
+        parser.add_argument('--mix', default=','.join(f'{name}={share}' for name, share in DEFAULT_MIX.items()),
+                            help='Share of each endpoint, e.g. plan=0.5,stops=0.3,routes=0.2')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the workload')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds before a request counts as failed')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options['mix'])
+        levels = options['concurrency'] or [1, 4, 16]
+        if any(level < 1 for level in levels) or options['requests'] < 1:
+            raise CommandError('--concurrency and --requests must be at least 1')
+        timetable = Timetable.from_db()
+        if not timetable.stop_ids:
+            raise CommandError('No feed imported; run import_transit_data first')
+
+        report = {
+            'environment': environment(),
+            'feed_version': timetable.feed_version,
+            'workload': {'seed': options['seed'], 'requests': options['requests'], 'mix': mix},
+            'levels': [],
+        }
+        server = contextlib.nullcontext(options['url'].rstrip('/')) if options['url'] else start_server(options['port'])
+        with server as url:
+            report['url'] = url
+            self.stdout.write(f'Testing {url}')
+            if options['warmup'] > 0:
+                run_load(url, make_http_workload(timetable, options['warmup'], seed=options['seed'] - 1, mix=mix), 1, options['timeout'])
+            for i, level in enumerate(levels):
+                # A fresh draw per level, so a level does not hit the plans cached by the one before
+                requests = make_http_workload(timetable, options['requests'], seed=options['seed'] + i, mix=mix)
+                summary = run_load(url, requests, level, options['timeout'])
+                report['levels'].append(summary)
+                self.write_summary(summary)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f'Wrote {options["output"]}')
+
+    def write_summary(self, summary):
+        total = summary['total']
+        self.stdout.write(
+            f'Concurrency {summary["concurrency"]}: {total["requests"]} requests in {summary["seconds"]:.2f}s '
+            f'({total["throughput_rps"] or 0:.1f} req/s), {total["error_rate"] * 100:.1f}% errors'
+        )
+        for endpoint, result in [*summary['endpoints'].items(), ('all', total)]:
+            latency = result['latency_ms']
+            line = (
+                f'{endpoint:>8}: {result["requests"]:>5} req  {result["throughput_rps"] or 0:>7.1f} req/s  '
+                f'p50 {latency["p50"]:.2f}ms  p90 {latency["p90"]:.2f}ms  p99 {latency["p99"]:.2f}ms  '
+                f'max {latency["max"]:.2f}ms  errors {result["errors"]} ({result["error_rate"] * 100:.1f}%)'
+            )
+            if result['error_kinds']:
+                line += '  ' + ', '.join(f'{kind}: {count}' for kind, count in sorted(result['error_kinds'].items()))
+            self.stdout.write(line)
@@ -0,0 +1,106 @@
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from transit_api.planning.raptor import RaptorPlanner
+from transit_api.planning.timetable import Timetable
+from transit_api.planning.transfer_patterns import (
+    DEFAULT_SAMPLE_SECONDS, DEFAULT_WINDOWS, TransferPatternPlanner, TransferPatterns, precompute,
+    write_transfer_patterns
+)
+
+
+def parse_window(value):
+    """Parses 'HH:MM-HH:MM' (hours may exceed 24) into (start, end) seconds since midnight."""
+    try:
+        start, end = (int(h) * 3600 + int(m) * 60 for h, m in (part.split(':') for part in value.split('-')))
+    except ValueError:
+        raise CommandError(f'Invalid --window {value!r} (expected HH:MM-HH:MM)')
+    if end <= start:
+        raise CommandError(f'--window {value!r} ends before it starts')
+    return start, end
+
+
+def format_window(window):
+    return '-'.join(f'{seconds // 3600:02d}:{seconds % 3600 // 60:02d}' for seconds in window)
+
+
+class Command(BaseCommand):
+    help = 'Precomputes transfer patterns for every stop, optionally benchmarking queries against RAPTOR.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='File to write (defaults to settings.TRANSIT_TRANSFER_PATTERNS_FILE)')
+        parser.add_argument('--processes', type=int, default=None, help='Worker processes (default: one per CPU)')
+        parser.add_argument('--window', action='append', metavar='HH:MM-HH:MM',
+                            help='Sample departures in this window of the service day (repeatable; '
+                                 f'default {", ".join(map(format_window, DEFAULT_WINDOWS))})')
+        parser.add_argument('--sample-minutes', type=float, default=DEFAULT_SAMPLE_SECONDS / 60,
+                            help='Keep at most one departure per this many minutes (0 keeps them all)')
+        parser.add_argument('--benchmark', type=int, default=0, metavar='N',
+                            help='Time N random stop-to-stop queries against a RAPTOR search afterwards')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the benchmark queries')
+
+    def handle(self, *args, **options):
+        path = options.get('output') or getattr(settings, 'TRANSIT_TRANSFER_PATTERNS_FILE', None)
+        if not path:
+            raise CommandError('No output file given and TRANSIT_TRANSFER_PATTERNS_FILE is not set')
+
+        windows = [parse_window(window) for window in options['window']] if options['window'] else DEFAULT_WINDOWS
+        if options['sample_minutes'] < 0:
+            raise CommandError('--sample-minutes must not be negative')
+        sample_seconds = int(options['sample_minutes'] * 60)
+
+        timetable = Timetable.from_db()
+        stop_count = len(timetable.stop_ids)
+        self.stdout.write(
+            f'Sampling departures in {", ".join(map(format_window, windows))}, '
+            f'at most one every {sample_seconds / 60:g} minutes'
+        )
+        started = time.perf_counter()
+
+        def progress(done):
+            elapsed = time.perf_counter() - started
+            remaining = elapsed / done * (stop_count - done)
+            self.stdout.write(f'  {done}/{stop_count} stops in {elapsed:.1f}s, about {remaining:.0f}s left')
+
+        chunks = precompute(
+            timetable, processes=options['processes'], progress=progress, windows=windows, sample_seconds=sample_seconds
+        )
+        elapsed = time.perf_counter() - started
+        size = write_transfer_patterns(path, chunks, timetable.feed_version)
+        self.stdout.write(f'Precomputed {stop_count} stops in {elapsed:.1f}s; wrote {path} ({size / 1024:.1f} KiB)')
+
+        if options['benchmark']:
+            self._benchmark(timetable, TransferPatterns.load(path), options['benchmark'], options['seed'])
+
+    def _benchmark(self, timetable, patterns, count, seed):
+        rng = random.Random(seed)
+        day = datetime.combine(datetime.now().date(), datetime.min.time())
+        queries = []
+        for _ in range(count):
+            origin, destination = rng.sample(range(len(timetable.stop_ids)), 2)
+            when = day + timedelta(seconds=rng.randrange(6 * 3600, 22 * 3600))
+            queries.append((self._coords(timetable, origin), self._coords(timetable, destination), when))
+
+        engines = {
+            'transfer patterns': lambda o, d, t: TransferPatternPlanner(o, d, t, timetable=timetable, transfer_patterns=patterns).find_paths(),
+            'RAPTOR search': lambda o, d, t: RaptorPlanner(o, d, timetable=timetable).profile(t, t),
+        }
+        for name, engine in engines.items():
+            latencies = []
+            for origin, destination, when in queries:
+                started = time.perf_counter()
+                engine(origin, destination, when)
+                latencies.append((time.perf_counter() - started) * 1000)
+            latencies.sort()
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            self.stdout.write(f'{name}: median {statistics.median(latencies):.2f}ms, p95 {p95:.2f}ms over {count} queries')
+
+    @staticmethod
+    def _coords(timetable, stop):
+        lat, lon = timetable.stop_coords[stop]
+        return {'latitude': lat, 'longitude': lon}
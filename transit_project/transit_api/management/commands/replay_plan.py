@@ -0,0 +1,82 @@
+import cProfile
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from transit_api.encoders import encode_itineraries
+from transit_api.planning.realtime import delay_overlay
+from transit_api.planning.timetable import get_timetable
+from transit_api.profiling import PlanInputs, load_updates
+
+
+class Command(BaseCommand):
+    help = 'Replays a /plan/ request recorded by the profiling hook (settings.TRANSIT_PROFILE_DIR).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('recording', help='The <id>.json file written for the profiled request')
+        parser.add_argument('--repeat', type=int, default=1, help='Run the search this many times')
+        parser.add_argument('--profile', help='Write a cProfile dump of the runs to this file')
+        parser.add_argument('--force', action='store_true',
+                            help='Replay even if the imported feed is not the one the request was planned on')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['recording']) as f:
+                recording = json.load(f)
+            inputs = PlanInputs.from_dict(recording)
+            updates = load_updates(recording.get('realtime', []))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            raise CommandError(f'Cannot read recording {options["recording"]}: {e}')
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1')
+
+        timetable = get_timetable()
+        if timetable.feed_version != recording.get('feed_version'):
+            message = (
+                f'The request was planned on feed {recording.get("feed_version")}, '
+                f'the imported feed is {timetable.feed_version}'
+            )
+            if not options['force']:
+                raise CommandError(message + ' (pass --force to replay anyway)')
+            self.stderr.write('Warning: ' + message)
+        # Replace whatever delays this process has with those the request saw
+        delay_overlay.apply(updates)
+        self.stdout.write(
+            f'Replaying {recording.get("id", options["recording"])}: {inputs.mode} from '
+            f'{inputs.start_coords["latitude"]},{inputs.start_coords["longitude"]} to '
+            f'{inputs.end_coords["latitude"]},{inputs.end_coords["longitude"]} at '
+            f'{", ".join(t.isoformat() for t in inputs.times)} with {len(updates)} trip updates'
+        )
+
+        profiler = cProfile.Profile() if options['profile'] else None
+        timings = []
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            if profiler is not None:
+                profiler.enable()
+            try:
+                _, itineraries = inputs.start_planner()
+                itineraries = list(itineraries)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+
+        self.stdout.write(
+            f'{len(itineraries)} itineraries in {timings[0] * 1000:.2f}ms (best) / '
+            f'{timings[len(timings) // 2] * 1000:.2f}ms (median) over {len(timings)} runs; '
+            f'recorded: {recording.get("seconds", 0) * 1000:.2f}ms'
+        )
+        for itinerary in itineraries:
+            rides = [leg.route_short_name for leg in itinerary.legs if leg.mode == 'transit']
+            self.stdout.write(
+                f'  {itinerary.start_time:%H:%M:%S} -> {itinerary.end_time:%H:%M:%S}  {" > ".join(rides) or "walk"}'
+            )
+        if 'itineraries' in recording:
+            same = json.loads(encode_itineraries(itineraries)) == recording['itineraries']
+            self.stdout.write('Same itineraries as recorded' if same else 'Itineraries differ from the recording')
+        if profiler is not None:
+            profiler.dump_stats(options['profile'])
+            self.stdout.write(f'Wrote {options["profile"]}')
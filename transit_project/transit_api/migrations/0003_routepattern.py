@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-19 02:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transit_api', '0002_alter_shape_options_alter_stoptime_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoutePattern',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('route_id', models.IntegerField()),
+                ('stop_ids', models.BinaryField()),
+                ('trip_ids', models.BinaryField()),
+                ('arrivals', models.BinaryField()),
+                ('departures', models.BinaryField()),
+            ],
+        ),
+    ]
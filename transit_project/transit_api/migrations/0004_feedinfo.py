@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-19 02:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transit_api', '0003_routepattern'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedInfo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(max_length=64)),
+                ('imported_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Shape used the GTFS shape_id as its primary key, so only one point per shape
+    could be stored. Points now get their own key; import_transit_data refills the
+    table, so the old rows are dropped rather than converted.
+    """
+
+    dependencies = [
+        ('transit_api', '0004_feedinfo'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='Shape',
+        ),
+        migrations.CreateModel(
+            name='Shape',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shape_id', models.IntegerField(db_index=True)),
+                ('shape_pt_lat', models.DecimalField(decimal_places=5, max_digits=8)),
+                ('shape_pt_lon', models.DecimalField(decimal_places=5, max_digits=8)),
+                ('shape_pt_sequence', models.IntegerField()),
+                ('shape_dist_traveled', models.DecimalField(decimal_places=4, max_digits=6)),
+            ],
+            options={
+                'ordering': ['shape_id', 'shape_pt_sequence'],
+                'unique_together': {('shape_id', 'shape_pt_sequence')},
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.8 on 2026-10-19 03:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transit_api', '0005_shape_points'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShapeGeometry',
+            fields=[
+                ('shape_id', models.IntegerField(primary_key=True, serialize=False)),
+                ('points', models.BinaryField()),
+                ('stop_ids', models.BinaryField()),
+                ('stop_points', models.BinaryField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.8 on 2026-10-19 04:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transit_api', '0006_shapegeometry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedTransfer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_feed', models.CharField(db_index=True, max_length=32)),
+                ('from_stop_id', models.IntegerField()),
+                ('to_feed', models.CharField(db_index=True, max_length=32)),
+                ('to_stop_id', models.IntegerField()),
+                ('seconds', models.IntegerField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='feedinfo',
+            name='feed',
+            field=models.CharField(default='default', max_length=32, unique=True),
+        ),
+        migrations.AddField(
+            model_name='feedinfo',
+            name='id_offset',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='feedinfo',
+            name='max_latitude',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='feedinfo',
+            name='max_longitude',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='feedinfo',
+            name='min_latitude',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='feedinfo',
+            name='min_longitude',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='feed',
+            field=models.CharField(db_index=True, default='default', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='routepattern',
+            name='feed',
+            field=models.CharField(db_index=True, default='default', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='shape',
+            name='feed',
+            field=models.CharField(db_index=True, default='default', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='shapegeometry',
+            name='feed',
+            field=models.CharField(db_index=True, default='default', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='stop',
+            name='feed',
+            field=models.CharField(db_index=True, default='default', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='stoptime',
+            name='feed',
+            field=models.CharField(db_index=True, default='default', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='feed',
+            field=models.CharField(db_index=True, default='default', max_length=32),
+        ),
+    ]
@@ -1,8 +1,14 @@
+import hashlib
+
 from django.db import models
 from decimal import Decimal
 
+# Feed id of data imported without --feed
+DEFAULT_FEED = 'default'
+
 class Route(models.Model):
 	id = models.IntegerField(primary_key=True)
+	feed = models.CharField(max_length=32, default=DEFAULT_FEED, db_index=True)
 	short_name = models.CharField(max_length=100)
 	long_name = models.CharField(max_length=100)
 	color = models.CharField(max_length=6)
@@ -11,6 +17,7 @@ class Route(models.Model):
 
 class Stop(models.Model):
 	id = models.IntegerField(primary_key=True)
+	feed = models.CharField(max_length=32, default=DEFAULT_FEED, db_index=True)
 	code = models.IntegerField()
 	name = models.CharField(max_length=100)
 	desc = models.CharField(max_length=100)
@@ -22,6 +29,7 @@ class Stop(models.Model):
 
 
 class StopTime(models.Model):
+	feed = models.CharField(max_length=32, default=DEFAULT_FEED, db_index=True)
 	trip_id = models.IntegerField(null=False, blank=False)
 	stop_sequence = models.IntegerField(null=False, blank=False)
 	arrival_time = models.TimeField()
@@ -43,6 +51,7 @@ class StopTime(models.Model):
 
 class Trip(models.Model):
 	id = models.IntegerField(primary_key=True)
+	feed = models.CharField(max_length=32, default=DEFAULT_FEED, db_index=True)
 	route_id = models.IntegerField()
 	trip_headsign = models.CharField(max_length=50)
 	direction_id = models.BooleanField(default=True)
@@ -55,12 +64,91 @@ class Trip(models.Model):
 
 
 class Shape(models.Model):
-	id = models.IntegerField(primary_key=True)
+	# One row per shape point; a GTFS shape_id spans many rows
+	feed = models.CharField(max_length=32, default=DEFAULT_FEED, db_index=True)
+	shape_id = models.IntegerField(db_index=True)
 	shape_pt_lat = models.DecimalField(max_digits=8, decimal_places=5)
 	shape_pt_lon = models.DecimalField(max_digits=8, decimal_places=5)
 	shape_pt_sequence = models.IntegerField()
 	shape_dist_traveled = models.DecimalField(max_digits=6, decimal_places=4)
 
 	class Meta:
-		unique_together = ('id', 'shape_pt_sequence')
-		ordering = ['shape_pt_sequence']
\ No newline at end of file
+		unique_together = ('shape_id', 'shape_pt_sequence')
+		ordering = ['shape_id', 'shape_pt_sequence']
+
+class ShapeGeometry(models.Model):
+	"""
+	A shape's polyline and where its stops sit on it, built by import_transit_data.
+	`points` is a float64 blob of lat/lon pairs; the int32 blobs `stop_ids` and
+	`stop_points` give, in visiting order, each stop served along the shape and the
+	index of its point.
+	"""
+	shape_id = models.IntegerField(primary_key=True)
+	feed = models.CharField(max_length=32, default=DEFAULT_FEED, db_index=True)
+	points = models.BinaryField()
+	stop_ids = models.BinaryField()
+	stop_points = models.BinaryField()
+
+class RoutePattern(models.Model):
+	"""
+	Trips of a route that share one stop sequence, built by import_transit_data.
+	The int32 blobs hold the stop ids, the trip ids (in departure order) and the
+	trips x stops time matrices in seconds, stored stop by stop.
+	"""
+	id = models.IntegerField(primary_key=True)
+	feed = models.CharField(max_length=32, default=DEFAULT_FEED, db_index=True)
+	route_id = models.IntegerField()
+	stop_ids = models.BinaryField()
+	trip_ids = models.BinaryField()
+	arrivals = models.BinaryField()
+	departures = models.BinaryField()
+
+
+class FeedInfo(models.Model):
+	"""
+	Identifies the imported feeds, one row each. import_transit_data replaces a feed's
+	row with a hash of its source files, so caches built from the data can tell
+	whether they are still current. `id_offset` is added to every GTFS id of the feed
+	so the ids of different feeds never collide, and the bounding box of its stops
+	lets a query pick the feeds near it.
+	"""
+	feed = models.CharField(max_length=32, default=DEFAULT_FEED, unique=True)
+	version = models.CharField(max_length=64)
+	id_offset = models.IntegerField(default=0)
+	min_latitude = models.FloatField(null=True)
+	max_latitude = models.FloatField(null=True)
+	min_longitude = models.FloatField(null=True)
+	max_longitude = models.FloatField(null=True)
+	imported_at = models.DateTimeField(auto_now=True)
+
+	@classmethod
+	def current_version(cls):
+		"""The version of the imported feeds, or None if nothing was imported yet."""
+		return cls.combine_versions(cls.objects.values_list('feed', 'version'))
+
+	@staticmethod
+	def combine_versions(versions):
+		"""
+		One version for several (feed, version) pairs: the feed's own version when there
+		is one, else a hash of them all.
+		"""
+		versions = sorted(versions)
+		if len(versions) <= 1:
+			return versions[0][1] if versions else None
+		digest = hashlib.sha256()
+		for feed, version in versions:
+			digest.update(f'{feed}:{version};'.encode())
+		return digest.hexdigest()
+
+
+class FeedTransfer(models.Model):
+	"""
+	A walking transfer between stops of two different feeds, precomputed by
+	import_transit_data in both directions (the transfers within a feed are derived
+	from its stops when its timetable loads).
+	"""
+	from_feed = models.CharField(max_length=32, db_index=True)
+	from_stop_id = models.IntegerField()
+	to_feed = models.CharField(max_length=32, db_index=True)
+	to_stop_id = models.IntegerField()
+	seconds = models.IntegerField()
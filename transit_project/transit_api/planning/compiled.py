@@ -0,0 +1,268 @@
+"""
+Flat binary timetable files.
+
+compile_timetable writes the planner's Timetable as fixed-width arrays into one
+file; load_timetable maps it with mmap and hands out memoryview slices, so every
+worker process reading the same file shares the same page-cache pages instead of
+holding its own copy of the pattern matrices and footpaths.
+
+Layout (all integers little-endian):
+  header   magic, format version, section count, feed version
+  sections name, typecode, byte offset, element count -- one entry per array
+  data     the arrays themselves, each aligned to 8 bytes
+"""
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from collections.abc import Sequence
+
+from .timetable import Footpaths, Pattern, Shapes, Timetable
+
+MAGIC = b'GTTABLE\0'
+FORMAT_VERSION = 3  # 2: leg geometry (trip_shapes, shape_*), 3: trip_flags
+HEADER = struct.Struct('<8sII64s')
+SECTION = struct.Struct('<24s1s7xQQ')
+ALIGNMENT = 8
+# Every section load_timetable reads, in the order _sections writes them
+SECTION_NAMES = (
+	'stop_ids', 'stop_lats', 'stop_lons', 'stop_name_offsets', 'stop_names', 'route_ids', 'route_name_offsets',
+	'route_names', 'trip_ids', 'trip_routes', 'trip_headsign_offsets', 'trip_headsigns', 'trip_flags',
+	'pattern_routes', 'pattern_stop_offsets', 'pattern_stops', 'pattern_trip_offsets', 'pattern_trips',
+	'pattern_time_offsets', 'arrivals', 'departures', 'footpath_offsets', 'footpath_targets', 'footpath_seconds',
+	'trip_shapes', 'shape_ids', 'shape_point_offsets', 'shape_points', 'shape_stop_offsets', 'shape_stops',
+	'shape_stop_points',
+)
+
+
+class TimetableFileError(ValueError):
+	"""Raised when a compiled timetable is missing, malformed or out of date."""
+
+
+class StringTable(Sequence):
+	"""The strings of a string table section, decoded one at a time as they are read."""
+	def __init__(self, offsets, blob):
+		self.offsets = offsets
+		self.blob = blob
+
+	def __len__(self):
+		return len(self.offsets) - 1
+
+	def __getitem__(self, i):
+		if isinstance(i, slice):
+			return [self[j] for j in range(*i.indices(len(self)))]
+		if i < 0:
+			i += len(self)
+		if not 0 <= i < len(self):
+			raise IndexError('string table index out of range')
+		return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode()
+
+
+def write_timetable(timetable, path):
+	"""
+	Writes `timetable` to `path` and returns the file size in bytes. The file is written
+	next to the target and renamed into place, so processes that still map the old
+	file keep a consistent view.
+	"""
+	if sys.byteorder != 'little':
+		raise TimetableFileError("compiled timetables are only supported on little-endian hosts")
+
+	sections = _sections(timetable)
+	offset = _align(HEADER.size + SECTION.size * len(sections))
+	table, blobs = [], []
+	for name, data in sections:
+		payload = data.tobytes() if isinstance(data, array) else data
+		typecode = data.typecode if isinstance(data, array) else 'B'
+		count = len(data)
+		table.append(SECTION.pack(name.encode(), typecode.encode(), offset, count))
+		blobs.append((offset, payload))
+		offset = _align(offset + len(payload))
+
+	directory = os.path.dirname(os.path.abspath(path))
+	fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.timetable-')
+	try:
+		with os.fdopen(fd, 'wb') as f:
+			version = (timetable.feed_version or '').encode()
+			f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(sections), version))
+			f.write(b''.join(table))
+			for blob_offset, payload in blobs:
+				f.write(b'\0' * (blob_offset - f.tell()))
+				f.write(payload)
+		os.replace(temp_path, path)
+	except BaseException:
+		if os.path.exists(temp_path):
+			os.remove(temp_path)
+		raise
+	return offset
+
+
+def read_feed_version(path):
+	"""Returns the feed version recorded in a compiled timetable header."""
+	with open(path, 'rb') as f:
+		header = f.read(HEADER.size)
+	if len(header) < HEADER.size:
+		raise TimetableFileError(f"{path} is truncated")
+	magic, format_version, _, version = HEADER.unpack(header)
+	_check_header(magic, format_version)
+	return version.rstrip(b'\0').decode() or None
+
+
+def load_timetable(path, expected_version=None):
+	"""
+	Maps a compiled timetable. Raises TimetableFileError if the file is unreadable,
+	truncated or lacks a section or, when `expected_version` is given, was compiled
+	from a different feed.
+	"""
+	try:
+		with open(path, 'rb') as f:
+			buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+	except (OSError, ValueError) as e:
+		raise TimetableFileError(f"cannot map {path}: {e}") from e
+
+	try:
+		magic, format_version, section_count, version = HEADER.unpack_from(buffer, 0)
+	except struct.error as e:
+		raise TimetableFileError(f"{path} is truncated") from e
+	_check_header(magic, format_version)
+	feed_version = version.rstrip(b'\0').decode() or None
+	if expected_version is not None and feed_version != expected_version:
+		raise TimetableFileError(f"{path} was compiled from feed {feed_version}, expected {expected_version}")
+
+	view = memoryview(buffer)
+	data = {}
+	for i in range(section_count):
+		try:
+			name, typecode, offset, count = SECTION.unpack_from(buffer, HEADER.size + i * SECTION.size)
+			name, typecode = name.rstrip(b'\0').decode(), typecode.decode()
+			size = struct.calcsize(typecode)
+		except (struct.error, UnicodeDecodeError) as e:
+			raise TimetableFileError(f"{path} has a malformed section table: {e}") from e
+		if offset + count * size > len(buffer):
+			raise TimetableFileError(f"{path} is truncated in section {name}")
+		try:
+			data[name] = view[offset:offset + count * size].cast(typecode)
+		except (TypeError, ValueError) as e:
+			raise TimetableFileError(f"{path} has a malformed section {name}: {e}") from e
+	missing = [name for name in SECTION_NAMES if name not in data]
+	if missing:
+		raise TimetableFileError(f"{path} has no {', '.join(missing)} section")
+
+	patterns = []
+	pattern_routes = data['pattern_routes']
+	stop_offsets, trip_offsets = data['pattern_stop_offsets'], data['pattern_trip_offsets']
+	for index in range(len(pattern_routes)):
+		stops = data['pattern_stops'][stop_offsets[index]:stop_offsets[index + 1]]
+		trips = data['pattern_trips'][trip_offsets[index]:trip_offsets[index + 1]]
+		time_start = data['pattern_time_offsets'][index]
+		time_end = time_start + len(stops) * len(trips)
+		patterns.append(Pattern(
+			index=index,
+			route_id=pattern_routes[index],
+			stops=stops,
+			trips=trips,
+			arrivals=data['arrivals'][time_start:time_end],
+			departures=data['departures'][time_start:time_end],
+		))
+
+	route_ids = data['route_ids'].tolist()
+	return Timetable(
+		stop_ids=data['stop_ids'].tolist(),
+		stop_names=StringTable(data['stop_name_offsets'], data['stop_names']),
+		stop_coords=list(zip(data['stop_lats'].tolist(), data['stop_lons'].tolist())),
+		route_names=dict(zip(route_ids, _strings(data['route_name_offsets'], data['route_names']))),
+		trip_ids=data['trip_ids'].tolist(),
+		trip_routes=data['trip_routes'].tolist(),
+		trip_headsigns=StringTable(data['trip_headsign_offsets'], data['trip_headsigns']),
+		patterns=patterns,
+		footpaths=Footpaths(data['footpath_offsets'], data['footpath_targets'], data['footpath_seconds']),
+		feed_version=feed_version,
+		trip_shapes=data['trip_shapes'],
+		trip_flags=data['trip_flags'],
+		shapes=Shapes(
+			data['shape_ids'], data['shape_point_offsets'], data['shape_points'],
+			data['shape_stop_offsets'], data['shape_stops'], data['shape_stop_points'],
+		),
+	)
+
+
+def _sections(timetable):
+	"""The (name, array-or-bytes) pairs making up a compiled timetable."""
+	stop_name_offsets, stop_names = _string_table(timetable.stop_names)
+	route_ids = list(timetable.route_names)
+	route_name_offsets, route_names = _string_table(timetable.route_names[r] for r in route_ids)
+	headsign_offsets, headsigns = _string_table(timetable.trip_headsigns)
+
+	pattern_routes, stop_offsets, trip_offsets, time_offsets = array('i'), array('i', [0]), array('i', [0]), array('i')
+	pattern_stops, pattern_trips, arrivals, departures = array('i'), array('i'), array('i'), array('i')
+	for pattern in timetable.patterns:
+		pattern_routes.append(pattern.route_id)
+		pattern_stops.extend(pattern.stops)
+		pattern_trips.extend(pattern.trips)
+		stop_offsets.append(len(pattern_stops))
+		trip_offsets.append(len(pattern_trips))
+		time_offsets.append(len(arrivals))
+		arrivals.extend(pattern.arrivals)
+		departures.extend(pattern.departures)
+
+	footpaths = timetable.footpaths
+	shapes = timetable.shapes
+	return [
+		('stop_ids', array('i', timetable.stop_ids)),
+		('stop_lats', array('d', (lat for lat, _ in timetable.stop_coords))),
+		('stop_lons', array('d', (lon for _, lon in timetable.stop_coords))),
+		('stop_name_offsets', stop_name_offsets),
+		('stop_names', stop_names),
+		('route_ids', array('i', route_ids)),
+		('route_name_offsets', route_name_offsets),
+		('route_names', route_names),
+		('trip_ids', array('i', timetable.trip_ids)),
+		('trip_routes', array('i', timetable.trip_routes)),
+		('trip_headsign_offsets', headsign_offsets),
+		('trip_headsigns', headsigns),
+		('trip_flags', bytes(timetable.trip_flags)),
+		('pattern_routes', pattern_routes),
+		('pattern_stop_offsets', stop_offsets),
+		('pattern_stops', pattern_stops),
+		('pattern_trip_offsets', trip_offsets),
+		('pattern_trips', pattern_trips),
+		('pattern_time_offsets', time_offsets),
+		('arrivals', arrivals),
+		('departures', departures),
+		('footpath_offsets', array('i', footpaths.offsets)),
+		('footpath_targets', array('i', footpaths.targets)),
+		('footpath_seconds', array('i', footpaths.seconds)),
+		('trip_shapes', array('i', timetable.trip_shapes)),
+		('shape_ids', array('i', shapes.shape_ids)),
+		('shape_point_offsets', array('i', shapes.point_offsets)),
+		('shape_points', array('d', shapes.points)),
+		('shape_stop_offsets', array('i', shapes.stop_offsets)),
+		('shape_stops', array('i', shapes.stops)),
+		('shape_stop_points', array('i', shapes.stop_points)),
+	]
+
+
+def _string_table(strings):
+	"""Packs strings into one UTF-8 blob plus an offsets array (n + 1 entries)."""
+	offsets, blob = array('i', [0]), bytearray()
+	for value in strings:
+		blob += (value or '').encode()
+		offsets.append(len(blob))
+	return offsets, bytes(blob)
+
+
+def _strings(offsets, blob):
+	raw = blob.tobytes()
+	return [raw[offsets[i]:offsets[i + 1]].decode() for i in range(len(offsets) - 1)]
+
+
+def _check_header(magic, format_version):
+	if magic != MAGIC:
+		raise TimetableFileError("not a compiled timetable file")
+	if format_version != FORMAT_VERSION:
+		raise TimetableFileError(f"timetable format {format_version} is not supported (expected {FORMAT_VERSION})")
+
+
+def _align(offset):
+	return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
@@ -0,0 +1,6 @@
+# --- Constants shared by the planners and the timetable ---
+WALKING_SPEED_KPH = 5  # Kilometers per hour
+MAX_WALK_METERS = 750  # Maximum distance for a transfer walk
+PENALTY_AMOUNT_SECONDS = 600  # 10 minutes penalty for re-using an edge
+MAX_ROUNDS = 5  # Maximum number of vehicles in a RAPTOR journey
+MAX_SEARCH_SECONDS = 3 * 3600  # A* ignores states this long after the requested departure
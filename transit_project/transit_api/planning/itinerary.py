@@ -1,6 +1,6 @@
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
 # Gemini Pro 2.5, 2025-11-16
 
@@ -18,6 +18,13 @@ class RouteLeg:
 	trip_headsign: Optional[str] = None
 	num_stops: Optional[int] = None
 
+	# [(lat, lon)] polyline of the leg: the shape slice for rides, a straight line for walks
+	path: Optional[List[Tuple[float, float]]] = None
+
+	# GTFS id of the trip ridden; not serialized, it tells the plan cache which
+	# real-time updates affect the leg
+	trip_id: Optional[int] = None
+
 	@property
 	def duration(self) -> timedelta:
 		"""Calculates the duration of this leg."""
@@ -0,0 +1,88 @@
+from array import array
+
+SECONDS_PER_DAY = 24 * 3600
+
+
+def gtfs_time_seconds(time_str):
+	"""Parses a GTFS HH:MM:SS (hours may exceed 23) into seconds since service-day midnight."""
+	hours, minutes, seconds = time_str.strip().split(':')
+	return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+def int32_array(values=()):
+	"""Creates the int32 array type used for every timetable matrix."""
+	return array('i', values)
+
+
+class PatternData:
+	"""
+	Trips of one route that visit the same stop sequence, with their times as a dense
+	trips x stops int32 matrix. The matrix is stored stop by stop ("column-major"), so
+	the departures of all trips from one stop are contiguous and sorted, and finding the
+	next trip after a given time is a bisect over a single slice.
+	"""
+	__slots__ = ('route_id', 'stop_ids', 'trip_ids', 'arrivals', 'departures')
+
+	def __init__(self, route_id, stop_ids, trip_ids, arrivals, departures):
+		self.route_id = route_id
+		self.stop_ids = stop_ids
+		self.trip_ids = trip_ids
+		self.arrivals = arrivals
+		self.departures = departures
+
+
+def build_patterns(trip_stop_times, trip_routes):
+	"""
+	Groups trips into patterns.
+
+	`trip_stop_times` maps a trip id to its [(stop_sequence, stop_id, arrival, departure)]
+	with times in seconds, `trip_routes` maps a trip id to its route id. Trips sharing a
+	route and stop sequence end up in the same pattern unless one overtakes another, in
+	which case it is moved to a sibling pattern so every column stays sorted.
+	"""
+	groups = {}
+	for trip_id, stop_times in trip_stop_times.items():
+		route_id = trip_routes.get(trip_id)
+		if route_id is None or len(stop_times) < 2:
+			continue
+		stop_times = sorted(stop_times)
+		stop_ids = tuple(stop_id for _, stop_id, _, _ in stop_times)
+		arrivals = [arrival for _, _, arrival, _ in stop_times]
+		departures = [departure for _, _, _, departure in stop_times]
+		groups.setdefault((route_id, stop_ids), []).append((departures[0], trip_id, arrivals, departures))
+
+	patterns = []
+	for (route_id, stop_ids), members in sorted(groups.items()):
+		members.sort()
+		lanes = []  # each lane is a list of members that never overtake each other
+		for member in members:
+			for lane in lanes:
+				if _follows(lane[-1], member):
+					lane.append(member)
+					break
+			else:
+				lanes.append([member])
+		for lane in lanes:
+			patterns.append(_to_pattern(route_id, stop_ids, lane))
+	return patterns
+
+
+def _follows(previous, member):
+	"""True if `member` is never earlier than `previous` at any stop."""
+	_, _, prev_arrivals, prev_departures = previous
+	_, _, arrivals, departures = member
+	return all(a >= b for a, b in zip(arrivals, prev_arrivals)) and all(a >= b for a, b in zip(departures, prev_departures))
+
+
+def _to_pattern(route_id, stop_ids, lane):
+	arrivals, departures = int32_array(), int32_array()
+	for position in range(len(stop_ids)):
+		arrivals.extend(member[2][position] for member in lane)
+		departures.extend(member[3][position] for member in lane)
+	return PatternData(
+		route_id=route_id,
+		stop_ids=int32_array(stop_ids),
+		trip_ids=int32_array(member[1] for member in lane),
+		arrivals=arrivals,
+		departures=departures,
+	)
@@ -0,0 +1,90 @@
+"""
+Finished /plan/ results, kept for a short time.
+
+A real-time update drops every entry. Even a delay can improve an itinerary that
+never rides the delayed trip: a trip that now leaves later can be caught by someone
+who used to miss it, or make a connection it used to miss, and arrive earlier than
+any plan cached before the update.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from .stats import render_counters
+
+
+class PlanCache:
+	"""A bounded LRU of planning results, safe to use from any thread."""
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._entries = OrderedDict()  # key -> (expires, itineraries)
+		self.generation = 0            # bumped by every invalidation
+		self.reset_metrics()
+
+	def reset_metrics(self):
+		self.hits = 0
+		self.misses = 0
+		self.invalidated = 0  # entries dropped by real-time updates
+
+	def get(self, key):
+		"""The cached itineraries for `key`, or None."""
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is not None and entry[0] < time.monotonic():
+				del self._entries[key]
+				entry = None
+			if entry is None:
+				self.misses += 1
+				return None
+			self._entries.move_to_end(key)
+			self.hits += 1
+			return entry[1]
+
+	def put(self, key, itineraries, generation, max_entries, seconds):
+		"""
+		Caches `itineraries` unless an invalidation happened since `generation` was read
+		(the search may have seen the timetable from before it).
+		"""
+		if max_entries <= 0 or seconds <= 0:
+			return
+		with self._lock:
+			if generation != self.generation:
+				return
+			self._entries.pop(key, None)
+			self._entries[key] = (time.monotonic() + seconds, itineraries)
+			while len(self._entries) > max_entries:
+				self._entries.popitem(last=False)
+
+	def invalidate(self, change):
+		"""Drops every entry after a realtime.OverlayChange; returns how many."""
+		with self._lock:
+			self.generation += 1
+			dropped = len(self._entries)
+			self._entries.clear()
+			self.invalidated += dropped
+			return dropped
+
+	def clear(self):
+		with self._lock:
+			self.generation += 1
+			self._entries.clear()
+
+	def __len__(self):
+		return len(self._entries)
+
+	def render(self, prefix):
+		"""The counters in the Prometheus text format, named `<prefix>_...`."""
+		with self._lock:
+			counters = [
+				('hits_total', 'Requests answered from the plan cache.', self.hits),
+				('misses_total', 'Requests the plan cache could not answer.', self.misses),
+				('invalidated_total', 'Cached plans dropped by real-time updates.', self.invalidated),
+			]
+			size = len(self._entries)
+		return render_counters(prefix, counters) + render_counters(
+			prefix, [('entries', 'Plans currently cached.', size)], 'gauge'
+		)
+
+
+# Shared by every /plan/ request in this process
+plan_cache = PlanCache()
@@ -1,166 +1,229 @@
 # Gemini 2.5 Pro - 2025-11-16
 
 import heapq
+import itertools
 
+from collections import namedtuple
+from time import perf_counter
 from datetime import datetime, timedelta, time
 from haversine import haversine, Unit
 from decimal import Decimal
 
 from django.db.models import F, Func
 
-from transit_api.models import Stop, StopTime, Trip
 from .itinerary import Itinerary, RouteLeg
+from .constants import PENALTY_AMOUNT_SECONDS, MAX_SEARCH_SECONDS
+from .stats import PlannerStats
+from .realtime import get_live_timetable
+from .timetable import feeds_near, seconds_since_midnight, walk_seconds
 
-# --- Constants ---
-WALKING_SPEED_KPH = 5  # Kilometers per hour
-MAX_WALK_METERS = 750  # Maximum distance for a transfer walk
-PENALTY_AMOUNT_SECONDS = 600  # 10 minutes penalty for re-using an edge
+# One vehicle call at a stop. stop_sequence is the 0-based position in the trip's pattern.
+ScheduledCall = namedtuple('ScheduledCall', ['trip_id', 'stop_id', 'stop_sequence', 'arrival_time', 'departure_time'])
+
+DEPARTURES_PER_STOP = 5  # Number of upcoming departures expanded at each stop
 
 class TransitPlanner:
 	"""
 	Finds multiple diverse transit routes using A* search.
-	This version relies entirely on the Haversine formula for distance calculations and
-	has no dependency on GeoDjango or any GIS libraries.
+	Stops, their coordinates and the walks between them come from the timetable: the
+	stops around the origin and destination from its grid, transfers from its
+	precomputed footpaths, so no GIS library or stop query is needed.
+
+	`required` restricts the search to trips having those timetable.TRIP_* flags.
 	"""
-	def __init__(self, start_coords, end_coords, start_time):
+	def __init__(self, start_coords, end_coords, start_time, timetable=None, required=0):
 		# Store coordinates as simple float tuples for use with haversine
 		self.start_coords = (float(start_coords['latitude']), float(start_coords['longitude']))
 		self.end_coords = (float(end_coords['latitude']), float(end_coords['longitude']))
 		self.start_time_dt = start_time
+		self.required = required
+		# Phase timings, search counters and DB queries of this request (see stats.py)
+		self.stats = PlannerStats()
 
-		# Pre-fetch all stop locations into a cache to minimize DB hits.
-		# This is critical for the performance of the non-GIS version.
-		self.all_stops_cache = list(Stop.objects.all())
-		self.stop_locations_cache = {
-			stop.id: (float(stop.latitude), float(stop.longitude))
-			for stop in self.all_stops_cache
-		}
+		with self.stats.track_queries():
+			# Route patterns answer "next departures" and "next stop" without hitting the DB
+			with self.stats.phase('timetable'):
+				self.timetable = timetable or get_live_timetable(feeds_near(self.start_coords, self.end_coords))
 
-		# Find initial and final stops using the pure Python method
-		self.nearby_start_stops = self._get_nearby_stops(self.start_coords)
-		self.nearby_end_stop_ids = {s.id for s in self._get_nearby_stops(self.end_coords)}
+			# [(GTFS stop id, walk seconds)] around the origin, GTFS stop ids around the destination
+			with self.stats.phase('nearby_stops'):
+				tt = self.timetable
+				self.nearby_start_stops = [(tt.stop_ids[stop], walk) for stop, walk in tt.nearby_stops(self.start_coords)]
+				self.nearby_end_stop_ids = {tt.stop_ids[stop] for stop, _ in tt.nearby_stops(self.end_coords)}
 
 		self.penalties = {}
 		self.found_paths = []
 
 	def find_five_paths(self):
 		"""Main method to find 5 diverse paths using A* with penalization."""
-		if not self.nearby_start_stops or not self.nearby_end_stop_ids:
-			return []
-			
-		for i in range(5):
-			path_result = self._a_star_search()
-			if not path_result:
-				break # Stop if no more paths can be found
+		return list(self.iter_paths())
 
-			final_state, came_from = path_result
-			itinerary = self._reconstruct_path(final_state, came_from)
-			self.found_paths.append(itinerary)
+	def iter_paths(self):
+		"""
+		Yields up to 5 diverse paths one at a time, each as soon as its search finishes,
+		so callers can send the first itinerary before the other searches have run.
+		"""
+		if not self.nearby_start_stops or not self.nearby_end_stop_ids:
+			return
 
-			# Apply penalties to the edges of the found path for the next run
-			self._apply_penalties(final_state, came_from)
-		
-		return self.found_paths
+		for i in range(5):
+			with self.stats.track_queries():
+				with self.stats.phase('search'):
+					path_result = self._a_star_search()
+				if not path_result:
+					break # Stop if no more paths can be found
+
+				with self.stats.phase('reconstruct'):
+					final_state, came_from = path_result
+					itinerary = self._reconstruct_path(final_state, came_from)
+					self.found_paths.append(itinerary)
+
+					# Apply penalties to the edges of the found path for the next run
+					self._apply_penalties(final_state, came_from)
+			# Yield outside the query wrapper: the consumer may run queries of its own
+			yield itinerary
 
 	def _a_star_search(self):
 		"""Runs a single A* search with the current set of penalties."""
 		# State: (datetime, stop_id, trip_id, stop_sequence)
+		# Entries are (priority, tie-breaker, state): states tied on priority and time would
+		# otherwise be compared by trip id, which is None while walking
 		pq = []
+		self._pushes = itertools.count()
 		cost_so_far = {}
 		came_from = {}
+		expanded = set()
+		# GTFS stop id -> (time, penalties) of the state expanded there off a vehicle. Cost is
+		# elapsed time plus penalties, so being there earlier with no more penalties is as good
+		# as being there later: the rider can wait.
+		on_foot = {}
+		started, popped, heap_peak = perf_counter(), 0, 0
 
 		# Initialize the search with walking from the origin to nearby stops
-		for stop in self.nearby_start_stops:
-			stop_coords = self.stop_locations_cache[stop.id]
-			walk_seconds = self._get_walk_time_seconds(self.start_coords, stop_coords)
-			state_time = self.start_time_dt + timedelta(seconds=walk_seconds)
-			state = (state_time, stop.id, None, 0)
+		for stop_id, walk in self.nearby_start_stops:
+			state_time = self.start_time_dt + timedelta(seconds=walk)
+			state = (state_time, stop_id, None, 0)
 			
-			cost_so_far[state] = walk_seconds
-			priority = walk_seconds + self._heuristic(stop_coords)
-			heapq.heappush(pq, (priority, state))
-			came_from[state] = {'prev_state': 'start', 'edge': ('walk_origin', 'origin', stop.id), 'cost': walk_seconds}
-
-		while pq:
-			priority, current_state = heapq.heappop(pq)
-			current_time, current_stop_id, on_trip_id, current_seq = current_state
+			cost_so_far[state] = walk
+			priority = walk + self._heuristic(self._stop_coords(stop_id))
+			heapq.heappush(pq, (priority, next(self._pushes), state))
+			came_from[state] = {'prev_state': 'start', 'edge': ('walk_origin', 'origin', stop_id), 'cost': walk}
 
-			if current_stop_id in self.nearby_end_stop_ids:
-				return current_state, came_from
-
-			current_stop_coords = self.stop_locations_cache.get(current_stop_id)
-			if not current_stop_coords:
-				continue
-
-			# --- Generate Next Moves ---
+		try:
+			while pq:
+				heap_peak = max(heap_peak, len(pq))
+				priority, _, current_state = heapq.heappop(pq)
+				popped += 1
+				current_time, current_stop_id, on_trip_id, current_seq = current_state
+
+				if current_stop_id in self.nearby_end_stop_ids:
+					return current_state, came_from
+
+				current_stop = self.timetable.stop_index.get(current_stop_id)
+				if current_stop is None or current_state in expanded:
+					continue  # the second pop of a state carries a stale cost
+				if on_trip_id is None:
+					penalties = cost_so_far[current_state] - (current_time - self.start_time_dt).total_seconds()
+					best = on_foot.get(current_stop_id)
+					if best is not None and best[0] <= current_time and best[1] <= penalties:
+						continue
+					on_foot[current_stop_id] = (current_time, penalties)
+				expanded.add(current_state)
+
+				# --- Generate Next Moves ---
 			
-			# Move 1: Stay on the current vehicle
-			if on_trip_id:
-				next_st = self._get_next_stop_on_trip(on_trip_id, current_seq)
-				if next_st:
-					cost = self._get_time_diff_seconds(current_time.time(), next_st.arrival_time)
-					next_state_time = self._update_time_from_gtfs(current_time, next_st.arrival_time)
-					next_state = (next_state_time, next_st.stop_id, on_trip_id, next_st.stop_sequence)
-					edge = ('trip', on_trip_id, current_stop_id, next_st.stop_id)
+				# Move 1: Stay on the current vehicle
+				if on_trip_id:
+					next_st = self._get_next_stop_on_trip(on_trip_id, current_seq)
+					if next_st:
+						cost = self._get_time_diff_seconds(current_time.time(), next_st.arrival_time)
+						next_state_time = self._update_time_from_gtfs(current_time, next_st.arrival_time)
+						next_state = (next_state_time, next_st.stop_id, on_trip_id, next_st.stop_sequence)
+						edge = ('trip', on_trip_id, current_stop_id, next_st.stop_id)
+						self._update_costs(current_state, next_state, edge, cost, came_from, cost_so_far, pq)
+
+				# Move 2: Board a vehicle at the current stop
+				departures = self._get_departures(current_stop_id, current_time)
+				for st in departures:
+					cost = self._get_time_diff_seconds(current_time.time(), st.departure_time)
+					next_state_time = self._update_time_from_gtfs(current_time, st.departure_time)
+					next_state = (next_state_time, st.stop_id, st.trip_id, st.stop_sequence)
+					edge = ('board', current_stop_id, st.trip_id)
 					self._update_costs(current_state, next_state, edge, cost, came_from, cost_so_far, pq)
-
-			# Move 2: Board a vehicle at the current stop
-			departures = self._get_departures(current_stop_id, current_time)
-			for st in departures:
-				cost = self._get_time_diff_seconds(current_time.time(), st.departure_time)
-				next_state_time = self._update_time_from_gtfs(current_time, st.departure_time)
-				next_state = (next_state_time, st.stop_id, st.trip_id, st.stop_sequence)
-				edge = ('board', current_stop_id, st.trip_id)
-				self._update_costs(current_state, next_state, edge, cost, came_from, cost_so_far, pq)
 			
-			# Move 3: Walk (transfer) to another nearby stop
-			for nearby_stop in self._get_nearby_stops(current_stop_coords):
-				if nearby_stop.id != current_stop_id:
-					nearby_stop_coords = self.stop_locations_cache[nearby_stop.id]
-					cost = self._get_walk_time_seconds(current_stop_coords, nearby_stop_coords)
+				# Move 3: Walk (transfer) to another nearby stop
+				for nearby_stop, cost in self.timetable.footpaths[current_stop]:
+					nearby_stop_id = self.timetable.stop_ids[nearby_stop]
 					next_state_time = current_time + timedelta(seconds=cost)
-					next_state = (next_state_time, nearby_stop.id, None, 0)
-					edge = ('walk', current_stop_id, nearby_stop.id)
+					next_state = (next_state_time, nearby_stop_id, None, 0)
+					edge = ('walk', current_stop_id, nearby_stop_id)
 					self._update_costs(current_state, next_state, edge, cost, came_from, cost_so_far, pq)
-		return None
+			return None
+		finally:
+			# The heap only grows by pushes, so what was pushed is what was popped plus what is left
+			self.stats.record_iteration(perf_counter() - started, popped + len(pq), popped, heap_peak)
 
 	def _update_costs(self, current_state, next_state, edge, cost, came_from, cost_so_far, pq):
 		"""Helper to update costs and push to the priority queue."""
+		# Without a horizon, walking back and forth between two stops never runs out of states
+		if (next_state[0] - self.start_time_dt).total_seconds() > MAX_SEARCH_SECONDS:
+			return
 		penalty = self.penalties.get(edge, 0)
 		new_cost = cost_so_far[current_state] + cost + penalty
 
 		if next_state not in cost_so_far or new_cost < cost_so_far[next_state]:
 			cost_so_far[next_state] = new_cost
-			next_stop_coords = self.stop_locations_cache.get(next_state[1])
-			priority = new_cost + self._heuristic(next_stop_coords)
-			heapq.heappush(pq, (priority, next_state))
+			priority = new_cost + self._heuristic(self._stop_coords(next_state[1]))
+			heapq.heappush(pq, (priority, next(self._pushes), next_state))
 			came_from[next_state] = {'prev_state': current_state, 'edge': edge, 'cost': cost}
 
-	def _get_nearby_stops(self, coords):
+	def _get_departures(self, stop_id, dt):
 		"""
-		Finds nearby stops by iterating through the cached list of all stops.
-		This is the performance bottleneck in the non-GIS version.
+		Finds the next departures from a stop after a given time: a bisect into the
+		departure column of every pattern serving the stop, merged by time.
 		"""
-		nearby = []
-		for stop in self.all_stops_cache:
-			stop_coords = self.stop_locations_cache[stop.id]
-			if haversine(coords, stop_coords, unit=Unit.METERS) <= MAX_WALK_METERS:
-				nearby.append(stop)
-		return nearby
-
-	def _get_departures(self, stop_id, dt):
-		"""Finds all departures from a stop after a given time."""
-		return StopTime.objects.filter(
-			stop_id=stop_id,
-			departure_time__gte=dt.time()
-		).select_related('trip', 'trip__route').order_by('departure_time')[:5]
+		tt = self.timetable
+		stop = tt.stop_index.get(stop_id)
+		if stop is None:
+			return []
+		# Round up: a departure a fraction of a second ago has already left
+		now = seconds_since_midnight(dt) + (1 if dt.microsecond else 0)
+		candidates = []
+		for pattern_index, position in tt.stop_patterns[stop]:
+			pattern = tt.patterns[pattern_index]
+			if position == len(pattern.stops) - 1:
+				continue  # trips end here
+			for trip in itertools.islice(pattern.departures_from(position, now, self.required), DEPARTURES_PER_STOP):
+				candidates.append((pattern.departure(trip, position), pattern_index, trip, position))
+		return [self._scheduled_call(*candidate[1:]) for candidate in heapq.nsmallest(DEPARTURES_PER_STOP, candidates)]
 
 	def _get_next_stop_on_trip(self, trip_id, current_sequence):
 		"""Finds the very next stop on a trip."""
-		try:
-			return StopTime.objects.select_related('stop').get(trip_id=trip_id, stop_sequence=current_sequence + 1)
-		except StopTime.DoesNotExist:
+		tt = self.timetable
+		trip = tt.trip_index.get(trip_id)
+		if trip not in tt.trip_patterns:
 			return None
+		pattern_index, trip_pos = tt.trip_patterns[trip]
+		if current_sequence + 1 >= len(tt.patterns[pattern_index].stops):
+			return None
+		return self._scheduled_call(pattern_index, trip_pos, current_sequence + 1)
+
+	def _scheduled_call(self, pattern_index, trip_pos, position):
+		tt = self.timetable
+		pattern = tt.patterns[pattern_index]
+		return ScheduledCall(
+			trip_id=tt.trip_ids[pattern.trips[trip_pos]],
+			stop_id=tt.stop_ids[pattern.stops[position]],
+			stop_sequence=position,
+			arrival_time=_clock_time(pattern.arrival(trip_pos, position)),
+			departure_time=_clock_time(pattern.departure(trip_pos, position)),
+		)
+
+	def _stop_name(self, stop_id):
+		return self.timetable.stop_names[self.timetable.stop_index[stop_id]]
+
+	def _stop_coords(self, stop_id):
+		return self.timetable.stop_coords[self.timetable.stop_index[stop_id]]
 
 	def _heuristic(self, coords):
 		"""Calculates 'as the crow flies' time estimate to the destination."""
@@ -168,11 +231,6 @@ class TransitPlanner:
 		# Assume a fast, straight-line speed of 25km/h for the heuristic
 		return (dist_km / 25) * 3600
 
-	def _get_walk_time_seconds(self, coords1, coords2):
-		"""Calculates walking time between two coordinate tuples."""
-		dist_km = haversine(coords1, coords2, unit=Unit.KILOMETERS)
-		return (dist_km / WALKING_SPEED_KPH) * 3600
-
 	def _get_time_diff_seconds(self, t1, t2):
 		"""Calculates the difference in seconds between two time objects."""
 		dummy_date = datetime(2000, 1, 1)
@@ -205,24 +263,32 @@ class TransitPlanner:
 			end_time = start_time + timedelta(seconds=edge_info['cost'])
 
 			if 'walk' in edge_type:
-				if current_transit_leg_edges:
+				if _rides(current_transit_leg_edges):
 					legs.append(self._create_transit_leg(current_transit_leg_edges))
-					current_transit_leg_edges = []
+				current_transit_leg_edges = []
 
-				start_name = "Your Location" if edge[1] == 'origin' else Stop.objects.get(id=edge[1]).name
-				end_name = Stop.objects.get(id=edge[2]).name
-				legs.append(RouteLeg(mode='walk', start_time=start_time, end_time=end_time, start_location_name=start_name, end_location_name=end_name))
+				start_name = "Your Location" if edge[1] == 'origin' else self._stop_name(edge[1])
+				end_name = self._stop_name(edge[2])
+				start_point = self.start_coords if edge[1] == 'origin' else self._stop_coords(edge[1])
+				path = [start_point, self._stop_coords(edge[2])]
+				legs.append(RouteLeg(mode='walk', start_time=start_time, end_time=end_time, start_location_name=start_name, end_location_name=end_name, path=path))
 			
 			elif 'board' in edge_type or 'trip' in edge_type:
+				if edge_type == 'board':
+					# Changing vehicles at the same stop starts a new leg (and a vehicle
+					# boarded but left at once makes none)
+					if _rides(current_transit_leg_edges):
+						legs.append(self._create_transit_leg(current_transit_leg_edges))
+					current_transit_leg_edges = []
 				current_transit_leg_edges.append(edge_info)
 		
-		if current_transit_leg_edges:
+		if _rides(current_transit_leg_edges):
 			legs.append(self._create_transit_leg(current_transit_leg_edges))
 
 		last_stop_id = final_state[1]
-		last_stop_obj = Stop.objects.get(id=last_stop_id)
-		walk_seconds = self._get_walk_time_seconds(self.stop_locations_cache[last_stop_id], self.end_coords)
-		legs.append(RouteLeg(mode='walk', start_time=final_state[0], end_time=final_state[0] + timedelta(seconds=walk_seconds), start_location_name=last_stop_obj.name, end_location_name="Your Destination"))
+		last_stop_coords = self._stop_coords(last_stop_id)
+		walk = walk_seconds(last_stop_coords, self.end_coords)
+		legs.append(RouteLeg(mode='walk', start_time=final_state[0], end_time=final_state[0] + timedelta(seconds=walk), start_location_name=self._stop_name(last_stop_id), end_location_name="Your Destination", path=[last_stop_coords, self.end_coords]))
 
 		return Itinerary(legs=legs)
 
@@ -238,11 +304,11 @@ class TransitPlanner:
 			trip_id = first_edge_info['edge'][1]
 			start_stop_id = first_edge_info['edge'][2]
 
-		trip_obj = Trip.objects.select_related('route').get(id=trip_id)
+		trip = self.timetable.trip_index[trip_id]
 		end_stop_id = last_edge_info['edge'][3]
 
-		start_stop_name = Stop.objects.get(id=start_stop_id).name
-		end_stop_name = Stop.objects.get(id=end_stop_id).name
+		start_stop_name = self._stop_name(start_stop_id)
+		end_stop_name = self._stop_name(end_stop_id)
 
 		start_time = first_edge_info['prev_state'][0] if first_edge_info['prev_state'] != 'start' else self.start_time_dt
 		end_time = last_edge_info['prev_state'][0] + timedelta(seconds=last_edge_info['cost'])
@@ -253,9 +319,11 @@ class TransitPlanner:
 			end_time=end_time,
 			start_location_name=start_stop_name,
 			end_location_name=end_stop_name,
-			route_short_name=trip_obj.route.short_name,
-			trip_headsign=trip_obj.trip_headsign,
-			num_stops=len(edges)
+			route_short_name=self.timetable.route_names.get(self.timetable.trip_routes[trip]),
+			trip_headsign=self.timetable.trip_headsigns[trip],
+			num_stops=len(edges),
+			path=self.timetable.leg_path(trip, self.timetable.stop_index[start_stop_id], self.timetable.stop_index[end_stop_id]),
+			trip_id=trip_id,
 		)
 
 	def _apply_penalties(self, final_state, came_from):
@@ -265,4 +333,13 @@ class TransitPlanner:
 			prev_info = came_from[curr]
 			edge_id = prev_info['edge']
 			self.penalties[edge_id] = self.penalties.get(edge_id, 0) + PENALTY_AMOUNT_SECONDS
-			curr = prev_info['prev_state']
\ No newline at end of file
+			curr = prev_info['prev_state']
+
+
+def _rides(edges):
+	"""Whether a run of board/trip edges actually travels between stops."""
+	return any(edge_info['edge'][0] == 'trip' for edge_info in edges)
+
+def _clock_time(seconds):
+	"""Converts timetable seconds (possibly past 24:00) into a wall-clock time."""
+	return time((seconds // 3600) % 24, (seconds // 60) % 60, seconds % 60)
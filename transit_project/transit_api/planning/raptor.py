@@ -0,0 +1,393 @@
+from datetime import datetime, timedelta, time
+
+from .constants import MAX_ROUNDS
+from .itinerary import Itinerary, RouteLeg
+from .realtime import get_live_timetable
+from .timetable import INFINITY, feeds_near
+
+
+class RaptorPlanner:
+	"""
+	Round-based transit routing (RAPTOR) over the in-memory timetable.
+
+	Round k finds the earliest arrival at every stop using at most k vehicles, so a
+	single search yields the whole trade-off between arrival time and transfers
+	instead of one "best" path.
+
+	`required` restricts the search to trips having those timetable.TRIP_* flags.
+	"""
+	def __init__(self, start_coords, end_coords, timetable=None, max_rounds=MAX_ROUNDS, required=0):
+		self.start_coords = (float(start_coords['latitude']), float(start_coords['longitude']))
+		self.end_coords = (float(end_coords['latitude']), float(end_coords['longitude']))
+		self.timetable = timetable or get_live_timetable(feeds_near(self.start_coords, self.end_coords))
+		self.max_rounds = max_rounds
+		self.required = required
+
+		# [(stop_index, walk_seconds)] around the origin, {stop_index: walk_seconds} around the destination
+		self.access = self.timetable.nearby_stops(self.start_coords)
+		self.egress = dict(self.timetable.nearby_stops(self.end_coords))
+
+	def profile(self, depart_after, depart_before):
+		"""
+		Range query: returns every Pareto-optimal itinerary (later departure, earlier
+		arrival, fewer vehicles) leaving the origin between the two datetimes (at that
+		instant when they are equal).
+
+		Departure times are processed from the latest to the earliest while the round
+		labels are kept between runs (range-RAPTOR): a later departure's labels remain
+		valid upper bounds for an earlier one, so each run only explores what improves.
+		"""
+		if not self.access or not self.egress or depart_before < depart_after:
+			return []
+
+		service_day = datetime.combine(depart_after.date(), time.min)
+		window_start = int((depart_after - service_day).total_seconds())
+		window_end = int((depart_before - service_day).total_seconds())
+
+		self._reset_labels()
+		journeys = []
+		# A window of one instant gets one run from that instant, vehicle or not
+		departures = self._departure_times(window_start, window_end) if window_end > window_start else [window_start]
+		for departure in departures:
+			journeys.extend(self._run(departure))
+		for journey in journeys:
+			# A run can reach the destination through a later trip at another access stop;
+			# leaving at the end of the window still catches it
+			journey.departure = min(journey.departure, window_end)
+
+		return [self._to_itinerary(journey, service_day) for journey in _pareto(journeys)]
+
+	def arrive_by(self, arrive_by):
+		"""
+		Reverse query: returns the Pareto-optimal itineraries (later departure, fewer
+		vehicles) reaching the destination no later than `arrive_by`.
+
+		The search runs backwards in time from the stops around the destination, so
+		labels hold the latest moment a rider can be at a stop and still make it.
+		"""
+		if not self.access or not self.egress:
+			return []
+
+		service_day = datetime.combine(arrive_by.date(), time.min)
+		deadline = int((arrive_by - service_day).total_seconds())
+		access = dict(self.access)
+
+		self._reset_labels(initial=-INFINITY)
+		marked = set()
+		for stop, walk in self.egress.items():
+			self.labels[0][stop] = deadline - walk
+			self.parents[0][stop] = ('egress', walk)
+			marked.add(stop)
+
+		journeys = []
+		for k in range(1, self.max_rounds + 1):
+			ridden, marked = self._scan_patterns_backward(k, marked)
+			marked |= self._relax_footpaths_backward(k, ridden)
+			if not marked:
+				break
+			journey = self._check_origin(k, marked, access)
+			if journey:
+				journeys.append(journey)
+
+		return [self._to_itinerary(journey, service_day) for journey in _pareto(journeys)]
+
+	# --- Search ---
+
+	def _reset_labels(self, initial=INFINITY):
+		stop_count = len(self.timetable.stop_ids)
+		rounds = self.max_rounds + 1
+		# labels[k][s]: earliest arrival at s with at most k vehicles (walking included)
+		# (in a reverse search: latest departure from s, and initial is -inf)
+		self.labels = [[initial] * stop_count for _ in range(rounds)]
+		# ride_labels[k][s]: same, but only counting arrivals by vehicle (reverse: boardings)
+		self.ride_labels = [[initial] * stop_count for _ in range(rounds)]
+		self.parents = [[None] * stop_count for _ in range(rounds)]
+		self.ride_parents = [[None] * stop_count for _ in range(rounds)]
+		self.target_labels = [initial] * rounds
+
+	def _departure_times(self, window_start, window_end):
+		"""Origin departure times that catch a vehicle at an access stop, latest first."""
+		times = set()
+		for stop, walk in self.access:
+			for pattern_index, position in self.timetable.stop_patterns[stop]:
+				pattern = self.timetable.patterns[pattern_index]
+				# In departure order even where delays have reordered the trips
+				for trip in pattern.departures_from(position, window_start + walk, self.required):
+					leave = pattern.departure(trip, position) - walk
+					if leave > window_end:
+						break
+					times.add(leave)
+		return sorted(times, reverse=True)
+
+	def _run(self, departure):
+		"""One RAPTOR run from the origin at `departure`, reusing the current labels."""
+		marked = set()
+		for stop, walk in self.access:
+			arrival = departure + walk
+			if arrival < self.labels[0][stop]:
+				self.labels[0][stop] = arrival
+				self.parents[0][stop] = ('access', departure, walk)
+				marked.add(stop)
+
+		found = []
+		for k in range(1, self.max_rounds + 1):
+			ridden, marked = self._scan_patterns(k, marked)
+			marked |= self._relax_footpaths(k, ridden)
+			if not marked:
+				break
+			journey = self._check_target(k, marked)
+			if journey:
+				found.append(journey)
+		return found
+
+	def _scan_patterns(self, k, marked):
+		"""Rides every pattern through a stop reached in round k-1."""
+		timetable, required = self.timetable, self.required
+		previous = self.labels[k - 1]
+		labels, ride_labels = self.labels[k], self.ride_labels[k]
+		parents, ride_parents = self.parents[k], self.ride_parents[k]
+		bound = min(self.target_labels[:k + 1])
+
+		queue = {}
+		for stop in marked:
+			for pattern_index, position in timetable.stop_patterns[stop]:
+				if position < queue.get(pattern_index, INFINITY):
+					queue[pattern_index] = position
+
+		ridden, improved = set(), set()
+		for pattern_index, first_position in queue.items():
+			pattern = timetable.patterns[pattern_index]
+			trip, board_position = None, None
+			for position in range(first_position, len(pattern.stops)):
+				stop = pattern.stops[position]
+				if trip is not None:
+					arrival = pattern.arrival(trip, position)
+					if arrival < ride_labels[stop] and arrival < bound:
+						ride_labels[stop] = arrival
+						ride_parents[stop] = (pattern_index, trip, board_position, position)
+						ridden.add(stop)
+						if arrival < labels[stop]:
+							labels[stop] = arrival
+							parents[stop] = ('ride',)
+							improved.add(stop)
+				ready = previous[stop]
+				if ready < INFINITY and (trip is None or ready <= pattern.departure(trip, position)):
+					candidate = pattern.earliest_trip(position, ready, required)
+					if candidate is not None and (trip is None or candidate < trip):
+						trip, board_position = candidate, position
+		return ridden, improved
+
+	def _relax_footpaths(self, k, ridden):
+		"""Transfers on foot from every stop where a vehicle was left in round k."""
+		labels, ride_labels, parents = self.labels[k], self.ride_labels[k], self.parents[k]
+		bound = min(self.target_labels[:k + 1])
+		improved = set()
+		for stop in ridden:
+			for other, seconds in self.timetable.footpaths[stop]:
+				arrival = ride_labels[stop] + seconds
+				if arrival < labels[other] and arrival < bound:
+					labels[other] = arrival
+					parents[other] = ('walk', stop, seconds)
+					improved.add(other)
+		return improved
+
+	def _check_target(self, k, marked):
+		"""Records a journey if round k now reaches the destination earlier than before."""
+		bound = min(self.target_labels[:k + 1])
+		best_arrival, best_stop = bound, None
+		for stop in marked:
+			walk = self.egress.get(stop)
+			if walk is not None and self.labels[k][stop] + walk < best_arrival:
+				best_arrival, best_stop = self.labels[k][stop] + walk, stop
+		if best_stop is None:
+			return None
+		self.target_labels[k] = best_arrival
+		return self._reconstruct(k, best_stop)
+
+	def _reconstruct(self, k, stop):
+		"""Follows the parent pointers back to the origin; returns the legs in travel order."""
+		timetable = self.timetable
+		legs = [('egress', stop, self.egress[stop])]
+		while k > 0:
+			parent = self.parents[k][stop]
+			if parent[0] == 'walk':
+				_, from_stop, seconds = parent
+				legs.append(('walk', from_stop, stop, seconds))
+				stop = from_stop
+			pattern_index, trip, board_position, alight_position = self.ride_parents[k][stop]
+			legs.append(('ride', pattern_index, trip, board_position, alight_position))
+			stop = timetable.patterns[pattern_index].stops[board_position]
+			k -= 1
+		_, _, walk = self.parents[0][stop]
+		legs.append(('access', stop, walk))
+		legs.reverse()
+		return _Journey(timetable, legs)
+
+	def _scan_patterns_backward(self, k, marked):
+		"""Rides every pattern backwards from a stop that can be left in round k-1."""
+		timetable, required = self.timetable, self.required
+		previous = self.labels[k - 1]
+		labels, ride_labels = self.labels[k], self.ride_labels[k]
+		parents, ride_parents = self.parents[k], self.ride_parents[k]
+		bound = max(self.target_labels[:k + 1])
+
+		queue = {}
+		for stop in marked:
+			for pattern_index, position in timetable.stop_patterns[stop]:
+				if position > queue.get(pattern_index, -INFINITY):
+					queue[pattern_index] = position
+
+		ridden, improved = set(), set()
+		for pattern_index, last_position in queue.items():
+			pattern = timetable.patterns[pattern_index]
+			trip, alight_position = None, None
+			for position in range(last_position, -1, -1):
+				stop = pattern.stops[position]
+				if trip is not None:
+					departure = pattern.departure(trip, position)
+					if departure > ride_labels[stop] and departure > bound:
+						ride_labels[stop] = departure
+						ride_parents[stop] = (pattern_index, trip, position, alight_position)
+						ridden.add(stop)
+						if departure > labels[stop]:
+							labels[stop] = departure
+							parents[stop] = ('ride',)
+							improved.add(stop)
+				ready = previous[stop]
+				if ready > -INFINITY and (trip is None or ready >= pattern.arrival(trip, position)):
+					candidate = pattern.latest_trip(position, ready, required)
+					if candidate is not None and (trip is None or candidate > trip):
+						trip, alight_position = candidate, position
+		return ridden, improved
+
+	def _relax_footpaths_backward(self, k, ridden):
+		"""Walks back from every stop where a vehicle was boarded in round k."""
+		labels, ride_labels, parents = self.labels[k], self.ride_labels[k], self.parents[k]
+		bound = max(self.target_labels[:k + 1])
+		improved = set()
+		for stop in ridden:
+			for other, seconds in self.timetable.footpaths[stop]:
+				departure = ride_labels[stop] - seconds
+				if departure > labels[other] and departure > bound:
+					labels[other] = departure
+					parents[other] = ('walk', stop, seconds)
+					improved.add(other)
+		return improved
+
+	def _check_origin(self, k, marked, access):
+		"""Records a journey if round k now lets the rider leave the origin later than before."""
+		bound = max(self.target_labels[:k + 1])
+		best_departure, best_stop = bound, None
+		for stop in marked:
+			walk = access.get(stop)
+			if walk is not None and self.labels[k][stop] - walk > best_departure:
+				best_departure, best_stop = self.labels[k][stop] - walk, stop
+		if best_stop is None:
+			return None
+		self.target_labels[k] = best_departure
+		return self._reconstruct_backward(k, best_stop, access[best_stop])
+
+	def _reconstruct_backward(self, k, stop, access_walk):
+		"""Follows the parent pointers of a reverse search forward to the destination."""
+		timetable = self.timetable
+		legs = [('access', stop, access_walk)]
+		while k > 0:
+			parent = self.parents[k][stop]
+			if parent[0] == 'walk':
+				_, to_stop, seconds = parent
+				legs.append(('walk', stop, to_stop, seconds))
+				stop = to_stop
+			pattern_index, trip, board_position, alight_position = self.ride_parents[k][stop]
+			legs.append(('ride', pattern_index, trip, board_position, alight_position))
+			stop = timetable.patterns[pattern_index].stops[alight_position]
+			k -= 1
+		_, walk = self.parents[0][stop]
+		legs.append(('egress', stop, walk))
+		return _Journey(timetable, legs)
+
+	# --- Output ---
+
+	def _to_itinerary(self, journey, service_day):
+		"""Turns a journey into an Itinerary, leaving the origin as late as possible."""
+		timetable = self.timetable
+		names = timetable.stop_names
+		coords = timetable.stop_coords
+
+		def at(seconds):
+			return service_day + timedelta(seconds=seconds)
+
+		route_legs = []
+		for leg in journey.legs:
+			kind = leg[0]
+			if kind == 'access':
+				_, stop, walk = leg
+				end = journey.departure + walk
+				route_legs.append(RouteLeg(mode='walk', start_time=at(journey.departure), end_time=at(end), start_location_name="Your Location", end_location_name=names[stop], path=[self.start_coords, coords[stop]]))
+			elif kind == 'ride':
+				_, pattern_index, trip, board, alight = leg
+				pattern = timetable.patterns[pattern_index]
+				trip_index = pattern.trips[trip]
+				route_legs.append(RouteLeg(
+					mode='transit',
+					start_time=at(pattern.departure(trip, board)),
+					end_time=at(pattern.arrival(trip, alight)),
+					start_location_name=names[pattern.stops[board]],
+					end_location_name=names[pattern.stops[alight]],
+					route_short_name=timetable.route_names.get(timetable.trip_routes[trip_index]),
+					trip_headsign=timetable.trip_headsigns[trip_index],
+					num_stops=alight - board,
+					path=timetable.leg_path(trip_index, pattern.stops[board], pattern.stops[alight]),
+					trip_id=timetable.trip_ids[trip_index],
+				))
+			elif kind == 'walk':
+				_, from_stop, to_stop, seconds = leg
+				start = route_legs[-1].end_time
+				route_legs.append(RouteLeg(mode='walk', start_time=start, end_time=start + timedelta(seconds=seconds), start_location_name=names[from_stop], end_location_name=names[to_stop], path=[coords[from_stop], coords[to_stop]]))
+			else:
+				_, stop, walk = leg
+				start = route_legs[-1].end_time
+				route_legs.append(RouteLeg(mode='walk', start_time=start, end_time=start + timedelta(seconds=walk), start_location_name=names[stop], end_location_name="Your Destination", path=[coords[stop], self.end_coords]))
+		return Itinerary(legs=route_legs)
+
+
+class _Journey:
+	"""A journey in timetable terms: its legs plus the criteria used for Pareto filtering."""
+	__slots__ = ('legs', 'departure', 'arrival', 'rides')
+
+	def __init__(self, timetable, legs):
+		self.legs = legs
+		rides = [leg for leg in legs if leg[0] == 'ride']
+		first, last = rides[0], rides[-1]
+		first_pattern = timetable.patterns[first[1]]
+		last_pattern = timetable.patterns[last[1]]
+		self.departure = first_pattern.departure(first[2], first[3]) - legs[0][2]
+		self.arrival = last_pattern.arrival(last[2], last[4]) + legs[-1][2]
+		if legs[-2][0] == 'walk':
+			self.arrival += legs[-2][3]
+		self.rides = len(rides)
+
+	@property
+	def key(self):
+		return (self.departure, self.arrival, self.rides)
+
+
+def _pareto(journeys):
+	"""
+	Keeps journeys not beaten on departure (later), arrival (earlier) and vehicles (fewer).
+
+	Sorted by departure (latest first), then arrival and vehicles, every journey that
+	could beat one comes before it, so one sweep keeping the earliest arrival seen per
+	vehicle count decides each journey: O(n log n + n * MAX_ROUNDS).
+	"""
+	unique = {}
+	for journey in journeys:
+		unique.setdefault(journey.key, journey)
+	earliest = {}  # rides -> earliest arrival among the journeys swept so far
+	kept = []
+	for journey in sorted(unique.values(), key=lambda j: (-j.departure, j.arrival, j.rides)):
+		if any(arrival <= journey.arrival for rides, arrival in earliest.items() if rides <= journey.rides):
+			continue
+		earliest[journey.rides] = journey.arrival
+		kept.append(journey)
+	kept.sort(key=lambda j: (j.departure, j.arrival, j.rides))
+	return kept
@@ -0,0 +1,536 @@
+"""
+Real-time delays (GTFS-Realtime trip updates) applied on top of the static timetable.
+
+A source returns trip updates in the JSON form of a GTFS-Realtime FeedMessage; the
+bundled FileSource reads a local file (JSON, or protobuf when gtfs-realtime-bindings
+is installed). DelayOverlay keeps a TripDelay for every trip with an update: two
+int32 arrays with its arrival and departure delay at each stop, resolved once when
+the update arrives.
+
+The timetable is never copied. LiveTimetable shares every structure of the static one
+except the list of patterns, in which only the patterns of delayed trips are wrapped
+in a DelayedPattern that adds the delays when a time is read. An update rebuilds the
+wrappers of the patterns it touches and nothing else.
+"""
+import heapq
+import json
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from transit_api.models import DEFAULT_FEED, FeedInfo
+from .patterns import int32_array
+from .stats import render_counters
+from .timetable import Timetable, get_timetable
+
+try:
+	from google.protobuf import json_format
+	from google.transit import gtfs_realtime_pb2
+except ImportError:  # pragma: no cover - depends on the environment
+	gtfs_realtime_pb2 = None
+
+# One trip's update. delay is the trip-level delay (None when absent), stops the
+# StopUpdates in stop order.
+TripUpdate = namedtuple('TripUpdate', ['cancelled', 'delay', 'stops'])
+# stop_sequence and stop_id identify the stop (either may be None); delays in seconds
+StopUpdate = namedtuple('StopUpdate', ['stop_sequence', 'stop_id', 'arrival_delay', 'departure_delay'])
+# What an update changed: the GTFS ids of the trips whose delays differ, and whether
+# any of them can now be caught (or reaches a stop) earlier than before.
+OverlayChange = namedtuple('OverlayChange', ['trips', 'earlier'])
+
+
+class RealtimeError(ValueError):
+	"""A trip update feed that cannot be read."""
+
+
+def _field(message, name):
+	"""A field of a FeedMessage dict under its proto name or its camelCase JSON name."""
+	if name in message:
+		return message[name]
+	head, *rest = name.split('_')
+	return message.get(head + ''.join(part.title() for part in rest))
+
+
+def _delay(event):
+	return None if event is None else _field(event, 'delay')
+
+
+def _int_id(value):
+	try:
+		return int(value)
+	except (TypeError, ValueError):
+		return None
+
+
+def _offset_id(value, id_offset):
+	return None if value is None else value + id_offset
+
+
+def parse_trip_updates(feed, id_offset=0):
+	"""
+	{trip id: TripUpdate} of the trip updates in a FeedMessage dict, with the feed's
+	GTFS trip and stop ids moved by `id_offset` (the FeedInfo.id_offset of the feed
+	they are for) to the ids they were imported under. Entities without a trip
+	update, trips unknown to the integer-keyed Trip table and stop time updates
+	without data are skipped.
+	"""
+	updates = {}
+	for entity in _field(feed, 'entity') or ():
+		if _field(entity, 'is_deleted'):
+			continue
+		trip_update = _field(entity, 'trip_update')
+		if not trip_update:
+			continue
+		descriptor = _field(trip_update, 'trip') or {}
+		trip_id = _int_id(_field(descriptor, 'trip_id'))
+		if trip_id is None:
+			continue
+		trip_id += id_offset
+		stops = []
+		for stop_time in _field(trip_update, 'stop_time_update') or ():
+			if (_field(stop_time, 'schedule_relationship') or 'SCHEDULED') != 'SCHEDULED':
+				continue  # SKIPPED stops are not modelled; NO_DATA carries no delay
+			arrival = _delay(_field(stop_time, 'arrival'))
+			departure = _delay(_field(stop_time, 'departure'))
+			if arrival is None and departure is None:
+				continue
+			stops.append(StopUpdate(
+				stop_sequence=_int_id(_field(stop_time, 'stop_sequence')),
+				stop_id=_offset_id(_int_id(_field(stop_time, 'stop_id')), id_offset),
+				arrival_delay=int(arrival if arrival is not None else departure),
+				departure_delay=int(departure if departure is not None else arrival),
+			))
+		delay = _field(trip_update, 'delay')
+		updates[trip_id] = TripUpdate(
+			cancelled=_field(descriptor, 'schedule_relationship') == 'CANCELED',
+			delay=None if delay is None else int(delay),
+			stops=tuple(stops),
+		)
+	return updates
+
+
+def is_differential(feed):
+	"""Whether the feed only carries changes (merged into the current updates) instead of all of them."""
+	header = _field(feed, 'header') or {}
+	return _field(header, 'incrementality') == 'DIFFERENTIAL'
+
+
+class TripDelay:
+	"""
+	The delays of one trip in seconds, by stop position: `arrivals` and `departures`
+	(int32 arrays as long as the trip). A cancelled trip has neither.
+	"""
+	__slots__ = ('arrivals', 'departures', 'cancelled', 'early', 'late')
+
+	def __init__(self, arrivals=(), departures=(), cancelled=False):
+		self.arrivals = int32_array(arrivals)
+		self.departures = int32_array(departures)
+		self.cancelled = cancelled
+		self.early = min(0, min(self.arrivals, default=0), min(self.departures, default=0))
+		self.late = max(0, max(self.arrivals, default=0), max(self.departures, default=0))
+
+	@classmethod
+	def resolve(cls, update, stops, stop_index):
+		"""
+		The TripDelay of `update` on a trip calling at `stops` (stop indices), or None
+		when it changes nothing. The trip-level delay applies from the first stop, and
+		each stop update from its stop to the next one, as GTFS-Realtime propagates
+		delays downstream. A stop update names its stop by stop_id (looked up from the
+		previous update on, so loops resolve in order) or else by its 1-based
+		stop_sequence, as the imported feeds number their stop times.
+		"""
+		if update.cancelled:
+			return cls(cancelled=True)
+		stops = list(stops)
+		arrivals = [update.delay or 0] * len(stops)
+		departures = list(arrivals)
+		start = 0
+		for stop in update.stops:
+			position = None
+			if stop.stop_id is not None and stop.stop_id in stop_index:
+				try:
+					position = stops.index(stop_index[stop.stop_id], start)
+				except ValueError:
+					pass
+			elif stop.stop_sequence is not None and 0 < stop.stop_sequence <= len(stops):
+				position = stop.stop_sequence - 1
+			if position is None or position < start:
+				continue
+			arrivals[position:] = [stop.arrival_delay] * (len(stops) - position)
+			departures[position:] = [stop.departure_delay] * (len(stops) - position)
+			start = position
+		if not any(arrivals) and not any(departures):
+			return None
+		return cls(arrivals, departures)
+
+
+def _runs_earlier(old, new):
+	"""Whether a trip delayed by `new` instead of `old` (None: on time) is anywhere earlier than before."""
+	if old is not None and old.cancelled:
+		return new is None or not new.cancelled
+	if new is None or new.cancelled:
+		return new is None and old is not None and old.late > 0
+	if old is None:
+		return new.early < 0
+	return any(n < o for n, o in zip(new.arrivals, old.arrivals)) or any(n < o for n, o in zip(new.departures, old.departures))
+
+
+class DelayedPattern:
+	"""
+	A Pattern seen through the delays of some of its trips (`delays`, trip position ->
+	TripDelay). Undelayed trips read the shared matrices as they are.
+
+	Delays can reorder trips, so a "next trip" lookup is answered twice and the better
+	answer wins: by the bisect over the shared matrix, skipping delayed and cancelled
+	trips, and by a bisect over the actual times of the delayed trips, which are kept
+	sorted per stop; `departures_from` merges the two the same way. Cancelled trips are
+	never returned. The round-based route scans still assume trips do not overtake
+	each other, so a trip that overtakes another may be missed, never wrongly used.
+	"""
+	__slots__ = ('base', 'index', 'route_id', 'stops', 'trips', 'trip_count', 'arrivals', 'departures', 'delays', 'running',
+		'cancelled', 'departure_index', 'arrival_index', 'trip_flags', 'restricted')
+
+	def __init__(self, base, delays):
+		self.base = base
+		self.index = base.index
+		self.route_id = base.route_id
+		self.stops = base.stops
+		self.trips = base.trips
+		self.trip_count = base.trip_count
+		self.trip_flags = base.trip_flags
+		self.restricted = base.restricted
+		self.arrivals = base.arrivals      # the shared schedule, without delays
+		self.departures = base.departures
+		self.delays = delays
+		self.running = {trip: delay for trip, delay in delays.items() if not delay.cancelled}
+		self.cancelled = frozenset(delays.keys() - self.running.keys())
+		# Per stop position: ([actual times], [trip positions]) of the running delayed trips, by time
+		self.departure_index = []
+		self.arrival_index = []
+		for position in range(len(self.stops)):
+			lo = position * self.trip_count
+			departures = sorted((base.departures[lo + trip] + delay.departures[position], trip) for trip, delay in self.running.items())
+			arrivals = sorted((base.arrivals[lo + trip] + delay.arrivals[position], trip) for trip, delay in self.running.items())
+			self.departure_index.append(([time for time, _ in departures], [trip for _, trip in departures]))
+			self.arrival_index.append(([time for time, _ in arrivals], [trip for _, trip in arrivals]))
+
+	def arrival(self, trip, position):
+		arrival = self.arrivals[position * self.trip_count + trip]
+		delay = self.running.get(trip)
+		return arrival if delay is None else arrival + delay.arrivals[position]
+
+	def departure(self, trip, position):
+		departure = self.departures[position * self.trip_count + trip]
+		delay = self.running.get(trip)
+		return departure if delay is None else departure + delay.departures[position]
+
+	def earliest_trip(self, position, time, required=0):
+		"""Returns the position of the trip with the `required` flags leaving `position` first at or after `time`."""
+		departures, delays = self.departures, self.delays
+		flags = self.trip_flags if required & self.restricted else None
+		lo = position * self.trip_count
+		hi = lo + self.trip_count
+		found = bisect_left(departures, time, lo, hi)
+		while found < hi and (found - lo in delays or (flags and flags[found - lo] & required != required)):
+			found += 1
+		times, trips = self.departure_index[position]
+		i = bisect_left(times, time)
+		while flags and i < len(times) and flags[trips[i]] & required != required:
+			i += 1
+		if i == len(times):
+			return found - lo if found < hi else None
+		if found == hi or times[i] < departures[found] or (times[i] == departures[found] and trips[i] < found - lo):
+			return trips[i]
+		return found - lo
+
+	def departures_from(self, position, time, required=0):
+		"""
+		Yields the positions of the running trips with the `required` flags leaving
+		`position` at or after `time`, earliest first: the shared column (delayed trips
+		skipped) merged with the actual times of the delayed trips.
+		"""
+		departures, delays = self.departures, self.delays
+		flags = self.trip_flags if required & self.restricted else None
+		lo = position * self.trip_count
+		hi = lo + self.trip_count
+		scheduled = (
+			(departures[found], found - lo) for found in range(bisect_left(departures, time, lo, hi), hi)
+			if found - lo not in delays and (flags is None or flags[found - lo] & required == required)
+		)
+		times, trips = self.departure_index[position]
+		delayed = (
+			(times[i], trips[i]) for i in range(bisect_left(times, time), len(times))
+			if flags is None or flags[trips[i]] & required == required
+		)
+		for _, trip in heapq.merge(scheduled, delayed):
+			yield trip
+
+	def latest_trip(self, position, time, required=0):
+		"""Returns the position of the trip with the `required` flags reaching `position` last at or before `time`."""
+		arrivals, delays = self.arrivals, self.delays
+		flags = self.trip_flags if required & self.restricted else None
+		lo = position * self.trip_count
+		found = bisect_right(arrivals, time, lo, lo + self.trip_count) - 1
+		while found >= lo and (found - lo in delays or (flags and flags[found - lo] & required != required)):
+			found -= 1
+		times, trips = self.arrival_index[position]
+		i = bisect_right(times, time) - 1
+		while flags and i >= 0 and flags[trips[i]] & required != required:
+			i -= 1
+		if i < 0:
+			return found - lo if found >= lo else None
+		if found < lo or times[i] > arrivals[found] or (times[i] == arrivals[found] and trips[i] > found - lo):
+			return trips[i]
+		return found - lo
+
+
+class LiveTimetable(Timetable):
+	"""
+	The static timetable `base` with delays: it shares every attribute of the base
+	(nothing is copied but the references) except `patterns`.
+	"""
+	def __init__(self, base, patterns):
+		self.__dict__.update(base.__dict__)
+		self.base = base
+		self.patterns = patterns
+
+	def __getattr__(self, name):
+		# The lookups the base builds on first use hold for the delayed patterns as well
+		if name == 'base':
+			raise AttributeError(name)
+		value = getattr(self.base, name)
+		self.__dict__[name] = value
+		return value
+
+
+class DelayOverlay:
+	"""
+	The trip updates in force in this process and the live timetable built from them,
+	safe to use from any thread. Readers get an immutable (base, live timetable) pair;
+	apply() builds the next one from the previous. Other bases (the feed shards of
+	timetable.get_timetable(feeds)) get their live timetable built on first use after
+	each apply().
+	"""
+	def __init__(self):
+		self._lock = threading.Lock()
+		self.reset()
+
+	def reset(self):
+		with self._lock:
+			self.updates = {}    # GTFS trip id -> TripUpdate
+			self._state = (None, None)
+			self._others = weakref.WeakKeyDictionary()  # other base -> its live timetable
+			self.applies = 0
+			self.apply_seconds = 0.0
+			self.last_apply_seconds = None
+
+	def timetable(self, base=None):
+		"""The timetable (default: the process-wide one) with the delays applied."""
+		default = base is None
+		base = base or get_timetable()
+		state_base, live = self._state
+		if state_base is base:
+			return live
+		with self._lock:
+			if self._state[0] is base:
+				return self._state[1]
+			if default or self._state[0] is None:
+				live, _ = self._patch(base, base, self.updates)
+				self._state = (base, live)
+				return live
+			live = self._others.get(base)
+			if live is None:
+				live = self._others[base] = self._patch(base, base, self.updates)[0]
+			return live
+
+	def apply(self, updates, replace=True, base=None):
+		"""
+		Brings the overlay to `updates` ({GTFS trip id: TripUpdate}); with replace=False
+		they are merged into the current ones instead (a differential feed). Only the
+		patterns of trips whose update changed are rebuilt. Returns an OverlayChange.
+		"""
+		started = time.perf_counter()
+		base = base or get_timetable()
+		with self._lock:
+			previous = self.updates
+			merged = dict(updates) if replace else {**previous, **updates}
+			changed = {trip_id for trip_id in previous.keys() | merged.keys() if previous.get(trip_id) != merged.get(trip_id)}
+			self.updates = merged
+			state_base, live = self._state
+			if state_base is base:
+				live, earlier = self._patch(base, live, changed)
+			else:
+				live, earlier = self._patch(base, base, merged)
+				# Compared with the static timetable, which is only right if no delays applied before
+				earlier = earlier or bool(previous)
+			self._state = (base, live)
+			self._others.clear()
+			seconds = time.perf_counter() - started
+			self.applies += 1
+			self.apply_seconds += seconds
+			self.last_apply_seconds = seconds
+		return OverlayChange(trips=frozenset(changed), earlier=earlier)
+
+	def _patch(self, base, current, trip_ids):
+		"""Returns (timetable, earlier): `current` with the delays of `trip_ids` brought up to date."""
+		touched = {}  # pattern index -> {trip position: TripDelay or None}
+		for trip_id in trip_ids:
+			trip = base.trip_index.get(trip_id)
+			if trip is None or trip not in base.trip_patterns:
+				continue
+			pattern_index, trip_pos = base.trip_patterns[trip]
+			update = self.updates.get(trip_id)
+			delay = None if update is None else TripDelay.resolve(update, base.patterns[pattern_index].stops, base.stop_index)
+			touched.setdefault(pattern_index, {})[trip_pos] = delay
+
+		patterns = list(current.patterns)
+		earlier = False
+		for pattern_index, trip_delays in touched.items():
+			pattern = patterns[pattern_index]
+			delays = dict(pattern.delays) if isinstance(pattern, DelayedPattern) else {}
+			for trip_pos, delay in trip_delays.items():
+				earlier = earlier or _runs_earlier(delays.get(trip_pos), delay)
+				if delay is None:
+					delays.pop(trip_pos, None)
+				else:
+					delays[trip_pos] = delay
+			original = base.patterns[pattern_index]
+			patterns[pattern_index] = DelayedPattern(original, delays) if delays else original
+		if not any(isinstance(pattern, DelayedPattern) for pattern in patterns):
+			return base, earlier
+		return LiveTimetable(base, patterns), earlier
+
+	def delayed_trips(self):
+		"""(delayed, cancelled) trip counts of the current live timetable."""
+		_, live = self._state
+		delayed = cancelled = 0
+		for pattern in live.patterns if live is not None else ():
+			if isinstance(pattern, DelayedPattern):
+				cancelled += len(pattern.cancelled)
+				delayed += len(pattern.delays) - len(pattern.cancelled)
+		return delayed, cancelled
+
+	def render(self):
+		"""The overlay gauges and counters in the Prometheus text format."""
+		delayed, cancelled = self.delayed_trips()
+		with self._lock:
+			counters = [
+				('applies_total', 'Trip update feeds applied to the timetable.', self.applies),
+				('apply_seconds_total', 'Time spent applying trip update feeds.', self.apply_seconds),
+			]
+		return render_counters('transit_realtime', counters) + render_counters('transit_realtime', [
+			('trips', 'Trips running with a real-time delay or cancelled.', {'state="delayed"': delayed, 'state="cancelled"': cancelled}),
+		], 'gauge')
+
+
+# The delays every planner of this process searches with
+delay_overlay = DelayOverlay()
+
+
+def get_live_timetable(feeds=None):
+	"""
+	Returns the process-wide timetable (or that of `feeds`, see timetable.feeds_near)
+	with the current real-time delays applied.
+	"""
+	return delay_overlay.timetable(get_timetable(feeds) if feeds is not None else None)
+
+
+class FileSource:
+	"""
+	Trip updates from a local GTFS-Realtime file, re-read only when it changes: the
+	protobuf encoding for *.pb files (needs gtfs-realtime-bindings), JSON otherwise.
+	"""
+	def __init__(self, path):
+		self.path = str(path)
+		self._seen = None
+
+	def fetch(self):
+		"""The FeedMessage as a dict, or None when the file is missing or unchanged."""
+		try:
+			stat = os.stat(self.path)
+		except FileNotFoundError:
+			return None
+		signature = (stat.st_mtime_ns, stat.st_size)
+		if signature == self._seen:
+			return None
+		with open(self.path, 'rb') as f:
+			data = f.read()
+		if self.path.endswith('.pb'):
+			if gtfs_realtime_pb2 is None:
+				raise RealtimeError(f"{self.path}: reading protobuf feeds needs gtfs-realtime-bindings")
+			message = gtfs_realtime_pb2.FeedMessage()
+			message.ParseFromString(data)
+			feed = json_format.MessageToDict(message, preserving_proto_field_name=True)
+		else:
+			try:
+				feed = json.loads(data)
+			except ValueError as e:
+				raise RealtimeError(f"{self.path}: {e}") from e
+		self._seen = signature
+		return feed
+
+
+_source = None
+_source_setting = None
+_next_poll = 0.0
+_poll_lock = threading.Lock()
+
+
+def get_realtime_source():
+	"""
+	The source configured by settings.TRANSIT_REALTIME_SOURCE (dotted path of a class
+	with a fetch() method, built without arguments) or TRANSIT_REALTIME_FILE, or None.
+	"""
+	global _source, _source_setting
+	setting = (getattr(settings, 'TRANSIT_REALTIME_SOURCE', ''), getattr(settings, 'TRANSIT_REALTIME_FILE', ''))
+	if setting != _source_setting:
+		source_path, file_path = setting
+		_source = import_string(source_path)() if source_path else FileSource(file_path) if file_path else None
+		_source_setting = setting
+	return _source
+
+
+def realtime_id_offset():
+	"""The id offset of settings.TRANSIT_REALTIME_FEED, the feed the source's trip updates are for."""
+	feed = getattr(settings, 'TRANSIT_REALTIME_FEED', DEFAULT_FEED)
+	if feed == DEFAULT_FEED:
+		return 0
+	offset = FeedInfo.objects.filter(feed=feed).values_list('id_offset', flat=True).first()
+	if offset is None:
+		raise RealtimeError(f"trip updates are for feed {feed}, which is not imported")
+	return offset
+
+
+def refresh_delays(force=False):
+	"""
+	Polls the configured source, at most every settings.TRANSIT_REALTIME_POLL_SECONDS
+	and from one thread at a time, and applies what it returns. Returns the
+	OverlayChange, or None when nothing was applied.
+	"""
+	global _next_poll
+	source = get_realtime_source()
+	if source is None or (not force and time.monotonic() < _next_poll):
+		return None
+	if not _poll_lock.acquire(blocking=False):
+		return None  # another request is polling
+	try:
+		_next_poll = time.monotonic() + getattr(settings, 'TRANSIT_REALTIME_POLL_SECONDS', 15)
+		feed = source.fetch()
+		if feed is None:
+			return None
+		return delay_overlay.apply(parse_trip_updates(feed, realtime_id_offset()), replace=not is_differential(feed))
+	finally:
+		_poll_lock.release()
+
+
+def reset_realtime():
+	"""Drops every delay and forgets the source (e.g. between tests)."""
+	global _source, _source_setting, _next_poll
+	delay_overlay.reset()
+	_source, _source_setting, _next_poll = None, None, 0.0
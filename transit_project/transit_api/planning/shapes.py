@@ -0,0 +1,114 @@
+"""
+Leg geometry.
+
+build_shapes runs once per import: every shape's points become one flat float64
+array of lat/lon pairs, and every stop served along the shape is mapped to the
+offset of its point. Slicing a transit leg's polyline is then two lookups and one
+slice of that array instead of a query over the Shape rows.
+"""
+import math
+from array import array
+from bisect import bisect_left
+
+from haversine import haversine, Unit
+
+from .patterns import int32_array
+
+# A stop further than this from the point its shape_dist_traveled points at is snapped
+# to the nearest point instead (feeds do not always use the same unit in both files)
+MAX_SNAP_METERS = 150
+
+
+class ShapeData:
+	"""
+	One shape as stored by the import: `points` holds lat, lon, lat, lon, ... and
+	`stop_ids[i]` sits on point `stop_points[i]`, in visiting order. A stop visited
+	twice (loop routes) appears twice.
+	"""
+	__slots__ = ('shape_id', 'points', 'stop_ids', 'stop_points')
+
+	def __init__(self, shape_id, points, stop_ids, stop_points):
+		self.shape_id = shape_id
+		self.points = points
+		self.stop_ids = stop_ids
+		self.stop_points = stop_points
+
+
+def build_shapes(shape_points, trip_stops, trip_shapes, stop_coords):
+	"""
+	Builds a ShapeData for every shape.
+
+	`shape_points` maps a shape id to its [(sequence, lat, lon, shape_dist_traveled)],
+	`trip_stops` maps a trip id to its [(stop_sequence, stop_id, shape_dist_traveled)],
+	`trip_shapes` maps a trip id to its shape id and `stop_coords` a stop id to (lat, lon).
+	Trips sharing a shape and a stop sequence are snapped only once.
+	"""
+	sequences = {}
+	for trip_id, stops in trip_stops.items():
+		shape_id = trip_shapes.get(trip_id)
+		if shape_id in shape_points:
+			sequences.setdefault(shape_id, set()).add(tuple((stop_id, dist) for _, stop_id, dist in sorted(stops)))
+
+	shapes = []
+	for shape_id, rows in sorted(shape_points.items()):
+		rows = sorted(rows)
+		coords = [(float(lat), float(lon)) for _, lat, lon, _ in rows]
+		dists = [float(dist or 0) for _, _, _, dist in rows]
+		calls = set()
+		for sequence in sequences.get(shape_id, ()):
+			calls.update(_snap(sequence, coords, dists, stop_coords))
+		calls = sorted(calls, key=lambda call: (call[1], call[0]))
+
+		points = array('d')
+		for lat, lon in coords:
+			points.append(lat)
+			points.append(lon)
+		shapes.append(ShapeData(
+			shape_id=shape_id,
+			points=points,
+			stop_ids=int32_array(stop_id for stop_id, _ in calls),
+			stop_points=int32_array(offset for _, offset in calls),
+		))
+	return shapes
+
+
+def _snap(sequence, coords, dists, stop_coords):
+	"""Yields (stop_id, point offset) for every call of one stop sequence along a shape."""
+	use_dists = any(dists) and any(dist for _, dist in sequence)
+	offset = 0
+	for stop_id, dist in sequence:
+		stop = stop_coords.get(stop_id)
+		if stop is None:
+			continue
+		matched = None
+		if use_dists:
+			candidate = _point_at_distance(dists, float(dist or 0))
+			if haversine(stop, coords[candidate], unit=Unit.METERS) <= MAX_SNAP_METERS:
+				matched = candidate
+		if matched is None:
+			# Search forward only, so the stops keep their order along the shape
+			matched = _nearest_point(stop, coords, offset)
+		offset = max(offset, matched)
+		yield stop_id, matched
+
+
+def _point_at_distance(dists, dist):
+	"""The point whose shape_dist_traveled is closest to `dist`."""
+	i = bisect_left(dists, dist)
+	if i == len(dists):
+		return i - 1
+	if i > 0 and dist - dists[i - 1] <= dists[i] - dist:
+		return i - 1
+	return i
+
+
+def _nearest_point(coords, points, start):
+	lat, lon = coords
+	scale = math.cos(math.radians(lat)) ** 2
+	best, best_distance = start, math.inf
+	for i in range(start, len(points)):
+		d_lat, d_lon = points[i][0] - lat, points[i][1] - lon
+		distance = d_lat * d_lat + d_lon * d_lon * scale
+		if distance < best_distance:
+			best, best_distance = i, distance
+	return best
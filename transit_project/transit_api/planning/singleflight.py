@@ -0,0 +1,94 @@
+"""
+Coalescing of identical concurrent computations ("single flight").
+
+When several requests ask for the same key at once, the first one (the leader)
+runs the computation and the others wait for its result instead of repeating the
+work. Followers wait a bounded time: if the leader has not finished by then they
+compute the result themselves. An exception raised by the leader is re-raised in
+every follower waiting on it.
+"""
+import threading
+
+from .stats import render_counters
+
+
+class _Call:
+	"""One in-flight computation and what its followers are waiting for."""
+	__slots__ = ('done', 'result', 'error')
+
+	def __init__(self):
+		self.done = threading.Event()
+		self.result = None
+		self.error = None
+
+
+class SingleFlight:
+	"""Runs at most one computation per key at a time, sharing its outcome with concurrent callers."""
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._calls = {}
+		self.reset_metrics()
+
+	def reset_metrics(self):
+		self.leaders = 0     # computations run on behalf of a group
+		self.collapsed = 0   # requests answered with another request's result
+		self.timeouts = 0    # followers that gave up waiting and computed themselves
+		self.errors = 0      # leader computations that raised
+
+	def do(self, key, compute, timeout=None):
+		"""
+		Returns (result, shared): the value of compute() for `key` and whether it was
+		computed by another caller. `timeout` bounds how long a follower waits (in
+		seconds; None waits for as long as the leader takes).
+		"""
+		with self._lock:
+			call = self._calls.get(key)
+			is_leader = call is None
+			if is_leader:
+				call = self._calls[key] = _Call()
+
+		if is_leader:
+			try:
+				call.result = compute()
+			except BaseException as e:
+				call.error = e
+				raise
+			finally:
+				with self._lock:
+					del self._calls[key]
+					self.leaders += 1
+					self.errors += call.error is not None
+				call.done.set()
+			return call.result, False
+
+		if not call.done.wait(timeout):
+			with self._lock:
+				self.timeouts += 1
+			return compute(), False
+		with self._lock:
+			self.collapsed += 1
+		if call.error is not None:
+			raise call.error
+		return call.result, True
+
+	def in_flight(self):
+		with self._lock:
+			return len(self._calls)
+
+	def render(self, prefix):
+		"""The counters in the Prometheus text format, named `<prefix>_...`."""
+		with self._lock:
+			counters = [
+				('leaders_total', 'Computations run for a group of identical requests.', self.leaders),
+				('collapsed_total', 'Requests answered with the result of an identical in-flight request.', self.collapsed),
+				('wait_timeouts_total', 'Requests that stopped waiting for an identical request and computed themselves.', self.timeouts),
+				('errors_total', 'Shared computations that raised an error.', self.errors),
+			]
+			in_flight = len(self._calls)
+		return render_counters(prefix, counters) + render_counters(
+			prefix, [('in_flight', 'Computations currently running.', in_flight)], 'gauge'
+		)
+
+
+# Shared by every /plan/ request in this process
+plan_flights = SingleFlight()
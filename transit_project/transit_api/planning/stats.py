@@ -0,0 +1,163 @@
+"""
+Planner instrumentation.
+
+A PlannerStats collects what one planning request spent: wall time per phase, DB
+queries (counted with a connection execute wrapper) and, for the A* planner, search
+expansion counts. PlanMetrics aggregates finished requests in-process and renders
+them in the Prometheus text exposition format for the /metrics/ endpoint.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+
+# Upper bounds (seconds) of the plan duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def render_counters(prefix, counters, kind='counter'):
+	"""
+	Renders [(name, description, value)] in the Prometheus text format as metrics of
+	type `kind` named `<prefix>_<name>`. A value may be a dict {'label="value"': value}
+	for one sample per label set; floats are written with six decimals.
+	"""
+	lines = []
+	for name, description, value in counters:
+		lines += [f'# HELP {prefix}_{name} {description}', f'# TYPE {prefix}_{name} {kind}']
+		samples = value.items() if isinstance(value, dict) else [(None, value)]
+		for labels, sample in samples:
+			sample = f'{sample:.6f}' if isinstance(sample, float) else sample
+			lines.append(f'{prefix}_{name}{{{labels}}} {sample}' if labels else f'{prefix}_{name} {sample}')
+	return '\n'.join(lines) + '\n' if lines else ''
+
+
+class PlannerStats:
+	"""Counters and timings of a single planning request."""
+	def __init__(self):
+		self.phases = {}       # phase name -> seconds, in the order phases first ran
+		self.iterations = []   # one dict per A* search run
+		self.nodes_pushed = 0
+		self.nodes_popped = 0
+		self.heap_peak = 0
+		self.db_queries = 0
+		self.db_seconds = 0.0
+
+	@contextmanager
+	def phase(self, name):
+		"""Adds the wall time of the block to `name`."""
+		started = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+	@contextmanager
+	def track_queries(self):
+		"""Counts and times every query run on the default connection inside the block."""
+		with connection.execute_wrapper(self._time_query):
+			yield
+
+	def _time_query(self, execute, sql, params, many, context):
+		started = time.perf_counter()
+		try:
+			return execute(sql, params, many, context)
+		finally:
+			self.db_queries += 1
+			self.db_seconds += time.perf_counter() - started
+
+	def record_iteration(self, seconds, pushed, popped, heap_peak):
+		self.iterations.append({'seconds': seconds, 'nodes_pushed': pushed, 'nodes_popped': popped})
+		self.nodes_pushed += pushed
+		self.nodes_popped += popped
+		self.heap_peak = max(self.heap_peak, heap_peak)
+
+	def as_dict(self):
+		return {
+			'phases_ms': {name: round(seconds * 1000, 3) for name, seconds in self.phases.items()},
+			'iterations': [
+				{'ms': round(it['seconds'] * 1000, 3), 'nodes_pushed': it['nodes_pushed'], 'nodes_popped': it['nodes_popped']}
+				for it in self.iterations
+			],
+			'nodes_pushed': self.nodes_pushed,
+			'nodes_popped': self.nodes_popped,
+			'heap_peak': self.heap_peak,
+			'db_queries': self.db_queries,
+			'db_ms': round(self.db_seconds * 1000, 3),
+		}
+
+	def server_timing(self):
+		"""The value of a Server-Timing header: one metric per phase plus the DB total."""
+		metrics = [f'{name};dur={seconds * 1000:.3f}' for name, seconds in self.phases.items()]
+		metrics.append(f'db;dur={self.db_seconds * 1000:.3f};desc="{self.db_queries} queries"')
+		return ', '.join(metrics)
+
+
+class PlanMetrics:
+	"""Process-wide totals of finished planning requests, safe to update from any thread."""
+	def __init__(self):
+		self._lock = threading.Lock()
+		self.reset()
+
+	def reset(self):
+		with self._lock:
+			self.requests = {}             # planner name -> count
+			self.buckets = [0] * len(DURATION_BUCKETS)
+			self.duration_sum = 0.0
+			self.duration_count = 0
+			self.phase_seconds = {}
+			self.nodes_pushed = 0
+			self.nodes_popped = 0
+			self.heap_peak = 0
+			self.db_queries = 0
+			self.db_seconds = 0.0
+
+	def record(self, planner, seconds, stats):
+		with self._lock:
+			self.requests[planner] = self.requests.get(planner, 0) + 1
+			for i, bound in enumerate(DURATION_BUCKETS):
+				if seconds <= bound:
+					self.buckets[i] += 1
+			self.duration_sum += seconds
+			self.duration_count += 1
+			for name, phase_seconds in stats.phases.items():
+				self.phase_seconds[name] = self.phase_seconds.get(name, 0.0) + phase_seconds
+			self.nodes_pushed += stats.nodes_pushed
+			self.nodes_popped += stats.nodes_popped
+			self.heap_peak = max(self.heap_peak, stats.heap_peak)
+			self.db_queries += stats.db_queries
+			self.db_seconds += stats.db_seconds
+
+	def render(self):
+		"""Renders the totals in the Prometheus text exposition format (version 0.0.4)."""
+		with self._lock:
+			text = render_counters('transit_plan', [
+				('requests_total', 'Planning requests served, by planner.',
+					{f'planner="{name}"': count for name, count in sorted(self.requests.items())}),
+			])
+			lines = [
+				'# HELP transit_plan_duration_seconds Wall time of planning requests.',
+				'# TYPE transit_plan_duration_seconds histogram',
+			]
+			lines += [f'transit_plan_duration_seconds_bucket{{le="{bound}"}} {count}' for bound, count in zip(DURATION_BUCKETS, self.buckets)]
+			lines += [
+				f'transit_plan_duration_seconds_bucket{{le="+Inf"}} {self.duration_count}',
+				f'transit_plan_duration_seconds_sum {self.duration_sum:.6f}',
+				f'transit_plan_duration_seconds_count {self.duration_count}',
+			]
+			text += '\n'.join(lines) + '\n'
+			text += render_counters('transit_plan', [
+				('phase_seconds_total', 'Wall time spent per planning phase.',
+					{f'phase="{name}"': seconds for name, seconds in sorted(self.phase_seconds.items())}),
+				('nodes_pushed_total', 'Search states pushed onto the A* heap.', self.nodes_pushed),
+				('nodes_popped_total', 'Search states expanded by A*.', self.nodes_popped),
+			])
+			text += render_counters('transit_plan', [('heap_peak', 'Largest A* heap seen since start.', self.heap_peak)], 'gauge')
+			text += render_counters('transit_plan', [
+				('db_queries_total', 'Database queries issued while planning.', self.db_queries),
+				('db_seconds_total', 'Time spent in database queries while planning.', self.db_seconds),
+			])
+		return text
+
+
+plan_metrics = PlanMetrics()
@@ -0,0 +1,689 @@
+import logging
+import math
+import os
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+from haversine import haversine, Unit
+
+from transit_api.models import FeedInfo, FeedTransfer, Route, RoutePattern, Shape, ShapeGeometry, Stop, StopTime, Trip
+from .constants import WALKING_SPEED_KPH, MAX_WALK_METERS
+from .patterns import SECONDS_PER_DAY, PatternData, build_patterns, int32_array
+from .plan_cache import plan_cache
+from .shapes import ShapeData, build_shapes
+
+INFINITY = float('inf')
+
+# Trip flags, one bit each in Timetable.trip_flags
+TRIP_WHEELCHAIR = 1  # wheelchair accessible
+TRIP_BIKES = 2       # bikes allowed
+ALL_TRIP_FLAGS = TRIP_WHEELCHAIR | TRIP_BIKES
+
+logger = logging.getLogger(__name__)
+
+
+def walk_seconds(coords1, coords2):
+	"""Walking time in whole seconds between two (lat, lon) tuples."""
+	dist_km = haversine(coords1, coords2, unit=Unit.KILOMETERS)
+	return int(math.ceil((dist_km / WALKING_SPEED_KPH) * 3600))
+
+
+def _grid_cell(coords, cell_lon):
+	cell_lat = MAX_WALK_METERS / 111_000
+	return (int(math.floor(coords[0] / cell_lat)), int(math.floor(coords[1] / cell_lon)))
+
+
+def inter_feed_transfers(stops, others):
+	"""
+	Walking transfers between the stops of one feed and those of the others, both ways:
+	stops and others are [(feed, stop_id, lat, lon)], the result [(from_feed,
+	from_stop_id, to_feed, to_stop_id, seconds)] for every pair within MAX_WALK_METERS.
+	"""
+	max_lat = max((abs(float(s[2])) for s in [*stops, *others]), default=0)
+	cell_lon = MAX_WALK_METERS / 111_000 / max(math.cos(math.radians(max_lat)), 0.01)
+	grid = {}
+	for feed, stop_id, lat, lon in others:
+		coords = (float(lat), float(lon))
+		grid.setdefault(_grid_cell(coords, cell_lon), []).append((feed, stop_id, coords))
+	transfers = []
+	for feed, stop_id, lat, lon in stops:
+		coords = (float(lat), float(lon))
+		row, col = _grid_cell(coords, cell_lon)
+		for r in range(row - 1, row + 2):
+			for c in range(col - 1, col + 2):
+				for other_feed, other_id, other_coords in grid.get((r, c), ()):
+					if haversine(coords, other_coords, unit=Unit.METERS) <= MAX_WALK_METERS:
+						seconds = walk_seconds(coords, other_coords)
+						transfers.append((feed, stop_id, other_feed, other_id, seconds))
+						transfers.append((other_feed, other_id, feed, stop_id, seconds))
+	return transfers
+
+
+def _int32_from_bytes(blob):
+	values = array('i')
+	values.frombytes(bytes(blob))
+	return values
+
+
+def _float64_from_bytes(blob):
+	values = array('d')
+	values.frombytes(bytes(blob))
+	return values
+
+
+def seconds_since_midnight(t):
+	"""Converts a datetime.time (or datetime) into seconds since midnight."""
+	return t.hour * 3600 + t.minute * 60 + t.second
+
+
+class Pattern:
+	"""
+	A group of trips of one route that visit exactly the same sequence of stops.
+
+	Times live in dense int32 matrices stored stop by stop: the slice for stop position
+	j holds the times of every trip at that stop, sorted because trips in a pattern
+	never overtake each other. "Next trip after t" is therefore a bisect over one slice.
+
+	The "next trip" lookups take `required` trip flags: trips lacking one of them are
+	stepped over with one bit test each. `restricted` has the flags some trip of the
+	pattern lacks, so patterns where every trip qualifies skip the tests altogether.
+	"""
+	__slots__ = ('index', 'route_id', 'stops', 'trips', 'arrivals', 'departures', 'trip_count', 'trip_flags', 'restricted')
+	cancelled = frozenset()  # positions of trips not running (see realtime.DelayedPattern)
+
+	def __init__(self, index, route_id, stops, trips, arrivals, departures):
+		self.index = index
+		self.route_id = route_id
+		self.stops = stops            # stop indices, in visiting order
+		self.trips = trips            # trip indices, in departure order
+		self.arrivals = arrivals      # arrivals[stop_pos * trip_count + trip_pos], seconds
+		self.departures = departures  # departures[stop_pos * trip_count + trip_pos], seconds
+		self.trip_count = len(trips)
+		self.set_trip_flags(bytes([ALL_TRIP_FLAGS]) * self.trip_count)
+
+	def set_trip_flags(self, trip_flags):
+		"""Sets the TRIP_* flags of the trips, by trip position."""
+		self.trip_flags = trip_flags
+		common = ALL_TRIP_FLAGS
+		for flags in set(trip_flags):
+			common &= flags
+		self.restricted = ALL_TRIP_FLAGS & ~common
+
+	def arrival(self, trip, position):
+		return self.arrivals[position * self.trip_count + trip]
+
+	def departure(self, trip, position):
+		return self.departures[position * self.trip_count + trip]
+
+	def earliest_trip(self, position, time, required=0):
+		"""Returns the position of the first trip with the `required` flags leaving `position` at or after `time`."""
+		lo = position * self.trip_count
+		hi = lo + self.trip_count
+		found = bisect_left(self.departures, time, lo, hi)
+		if required & self.restricted:
+			flags = self.trip_flags
+			while found < hi and flags[found - lo] & required != required:
+				found += 1
+		return found - lo if found < hi else None
+
+	def departures_from(self, position, time, required=0):
+		"""Yields the positions of the trips with the `required` flags leaving `position` at or after `time`, earliest first."""
+		first = self.earliest_trip(position, time, required)
+		if first is None:
+			return
+		flags = self.trip_flags if required & self.restricted else None
+		for trip in range(first, self.trip_count):
+			if flags is None or flags[trip] & required == required:
+				yield trip
+
+	def latest_trip(self, position, time, required=0):
+		"""Returns the position of the last trip with the `required` flags reaching `position` at or before `time`."""
+		lo = position * self.trip_count
+		found = bisect_right(self.arrivals, time, lo, lo + self.trip_count)
+		if required & self.restricted:
+			flags = self.trip_flags
+			while found > lo and flags[found - lo - 1] & required != required:
+				found -= 1
+		return found - lo - 1 if found > lo else None
+
+
+class Footpaths:
+	"""
+	Walking transfers of every stop in CSR layout: the transfers of stop s are
+	targets[offsets[s]:offsets[s + 1]] with the matching walking seconds.
+	"""
+	__slots__ = ('offsets', 'targets', 'seconds')
+
+	def __init__(self, offsets, targets, seconds):
+		self.offsets = offsets
+		self.targets = targets
+		self.seconds = seconds
+
+	@classmethod
+	def from_lists(cls, per_stop):
+		offsets, targets, seconds = int32_array([0]), int32_array(), int32_array()
+		for transfers in per_stop:
+			for target, walk in transfers:
+				targets.append(target)
+				seconds.append(walk)
+			offsets.append(len(targets))
+		return cls(offsets, targets, seconds)
+
+	def __getitem__(self, stop):
+		lo, hi = self.offsets[stop], self.offsets[stop + 1]
+		return zip(self.targets[lo:hi], self.seconds[lo:hi])
+
+
+class Shapes:
+	"""
+	Leg geometry in CSR layout: shape s has the lat/lon pairs
+	points[2 * point_offsets[s]:2 * point_offsets[s + 1]] and the stop indices
+	stops[stop_offsets[s]:stop_offsets[s + 1]], each sitting on the point (relative to
+	the shape) at the same position of stop_points.
+	"""
+	__slots__ = ('shape_ids', 'point_offsets', 'points', 'stop_offsets', 'stops', 'stop_points', '_stop_index')
+
+	def __init__(self, shape_ids, point_offsets, points, stop_offsets, stops, stop_points):
+		self.shape_ids = shape_ids
+		self.point_offsets = point_offsets
+		self.points = points
+		self.stop_offsets = stop_offsets
+		self.stops = stops
+		self.stop_points = stop_points
+		self._stop_index = {}
+
+	@classmethod
+	def from_data(cls, shapes, stop_index):
+		"""Packs [ShapeData] (keyed by GTFS stop ids) into one set of flat arrays."""
+		shape_ids, point_offsets, points = int32_array(), int32_array([0]), array('d')
+		stop_offsets, stops, stop_points = int32_array([0]), int32_array(), int32_array()
+		for shape in shapes:
+			shape_ids.append(shape.shape_id)
+			points.extend(shape.points)
+			point_offsets.append(len(points) // 2)
+			for stop_id, point in zip(shape.stop_ids, shape.stop_points):
+				if stop_id in stop_index:
+					stops.append(stop_index[stop_id])
+					stop_points.append(point)
+			stop_offsets.append(len(stops))
+		return cls(shape_ids, point_offsets, points, stop_offsets, stops, stop_points)
+
+	@classmethod
+	def concat(cls, parts):
+		"""Joins [(shapes, first stop index)] of several timetables into one."""
+		shape_ids, point_offsets, points = int32_array(), int32_array([0]), array('d')
+		stop_offsets, stops, stop_points = int32_array([0]), int32_array(), int32_array()
+		for shapes, stop_base in parts:
+			point_base, first_stop = point_offsets[-1], stop_offsets[-1]
+			shape_ids.extend(shapes.shape_ids)
+			point_offsets.extend(point_base + offset for offset in shapes.point_offsets[1:])
+			points.extend(shapes.points)
+			stop_offsets.extend(first_stop + offset for offset in shapes.stop_offsets[1:])
+			stops.extend(stop_base + stop for stop in shapes.stops)
+			stop_points.extend(shapes.stop_points)
+		return cls(shape_ids, point_offsets, points, stop_offsets, stops, stop_points)
+
+	def _stops_of(self, shape):
+		"""{stop index: [point offsets]} of one shape (memoized)."""
+		index = self._stop_index.get(shape)
+		if index is None:
+			index = {}
+			for i in range(self.stop_offsets[shape], self.stop_offsets[shape + 1]):
+				index.setdefault(self.stops[i], []).append(self.stop_points[i])
+			self._stop_index[shape] = index
+		return index
+
+	def path(self, shape, from_stop, to_stop):
+		"""The [(lat, lon)] of `shape` from one stop to the next visit of the other, or None."""
+		stops = self._stops_of(shape)
+		if from_stop not in stops or to_stop not in stops:
+			return None
+		start = stops[from_stop][0]
+		end = next((point for point in stops[to_stop] if point >= start), None)
+		if end is None:
+			return None
+		base = self.point_offsets[shape]
+		coords = self.points[2 * (base + start):2 * (base + end + 1)].tolist()
+		return list(zip(coords[0::2], coords[1::2]))
+
+
+class Timetable:
+	"""
+	A compact, index-based copy of the imported feed for the round-based planners.
+
+	Stops and trips are addressed by dense integer indices instead of their GTFS ids,
+	and every time is stored as seconds since midnight of the service day. The bulky
+	parts (pattern matrices, footpaths) are flat int32 sequences, so they can be plain
+	arrays or zero-copy views into a memory-mapped file (see compiled.py).
+	"""
+	def __init__(self, stop_ids, stop_names, stop_coords, route_names, trip_ids, trip_routes,
+			trip_headsigns, patterns, footpaths=None, feed_version=None, trip_shapes=None, shapes=None, trip_flags=None):
+		self.feed_version = feed_version
+		self.stop_ids = stop_ids
+		self.stop_names = stop_names
+		self.stop_coords = stop_coords  # [(lat, lon)]
+		self.route_names = route_names  # {route_id: short_name}
+
+		self.trip_ids = trip_ids
+		self.trip_routes = trip_routes
+		self.trip_headsigns = trip_headsigns
+		# Shape index (into self.shapes) of every trip, -1 when it has none
+		self.trip_shapes = trip_shapes if trip_shapes is not None else int32_array([-1] * len(trip_ids))
+		self.shapes = shapes if shapes is not None else Shapes.from_data([], {})
+		# TRIP_* flags of every trip; each pattern gets its trips' flags in trip order
+		self.trip_flags = trip_flags if trip_flags is not None else bytes([ALL_TRIP_FLAGS]) * len(trip_ids)
+
+		self.patterns = patterns
+		if bytes(self.trip_flags).count(ALL_TRIP_FLAGS) != len(trip_ids):
+			for pattern in patterns:
+				pattern.set_trip_flags(bytes(map(self.trip_flags.__getitem__, pattern.trips)))
+		self._direct_connections = {}
+		if footpaths is None:
+			footpaths = Footpaths.from_lists(
+				[(other, seconds) for other, seconds in self.nearby_stops(coords) if other != stop]
+				for stop, coords in enumerate(stop_coords)
+			)
+		self.footpaths = footpaths
+
+	def __getattr__(self, name):
+		"""
+		Builds the lookups derived from the arrays above on first use, so that loading a
+		(memory-mapped) timetable costs nothing per stop or trip until a search needs
+		them. Two threads may both build one; they get equal values and either is kept.
+		"""
+		if name == 'stop_index':
+			value = {stop_id: i for i, stop_id in enumerate(self.stop_ids)}
+		elif name == 'trip_index':
+			value = {trip_id: i for i, trip_id in enumerate(self.trip_ids)}
+		elif name in ('stop_patterns', 'trip_patterns'):
+			self._index_patterns()
+			return self.__dict__[name]
+		elif name in ('grid', 'cell_lat', 'cell_lon'):
+			self._build_grid()
+			return self.__dict__[name]
+		else:
+			raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+		self.__dict__[name] = value
+		return value
+
+	@classmethod
+	def build(cls, stops, routes, trips, patterns, feed_version=None, shapes=()):
+		"""
+		Builds a timetable from rows keyed by GTFS ids:
+		stops [(id, name, lat, lon)], routes [(id, short_name)],
+		trips [(id, route_id, headsign[, shape_id[, flags]])] (flags: TRIP_* bits,
+		all of them when absent), patterns [PatternData] and shapes [ShapeData].
+		"""
+		stop_index = {s[0]: i for i, s in enumerate(stops)}
+		shape_index = {shape.shape_id: i for i, shape in enumerate(shapes)}
+		trip_index = {t[0]: i for i, t in enumerate(trips)}
+		indexed = []
+		for data in patterns:
+			pattern_stops = [stop_index.get(stop_id) for stop_id in data.stop_ids]
+			pattern_trips = [trip_index.get(trip_id) for trip_id in data.trip_ids]
+			if None in pattern_stops or None in pattern_trips:
+				continue
+			indexed.append(Pattern(
+				index=len(indexed),
+				route_id=data.route_id,
+				stops=int32_array(pattern_stops),
+				trips=int32_array(pattern_trips),
+				arrivals=data.arrivals,
+				departures=data.departures,
+			))
+		return cls(
+			stop_ids=[s[0] for s in stops],
+			stop_names=[s[1] for s in stops],
+			stop_coords=[(float(s[2]), float(s[3])) for s in stops],
+			route_names=dict(routes),
+			trip_ids=[t[0] for t in trips],
+			trip_routes=[t[1] for t in trips],
+			trip_headsigns=[t[2] for t in trips],
+			patterns=indexed,
+			feed_version=feed_version,
+			trip_shapes=int32_array(shape_index.get(t[3], -1) if len(t) > 3 else -1 for t in trips),
+			shapes=Shapes.from_data(shapes, stop_index),
+			trip_flags=bytes(t[4] if len(t) > 4 else ALL_TRIP_FLAGS for t in trips),
+		)
+
+	@classmethod
+	def merge(cls, shards, transfers=(), feed_version=None):
+		"""
+		Joins the timetables of several feeds into one, adding the walking transfers
+		[(from_stop_id, to_stop_id, seconds)] between their stops. The pattern matrices
+		are shared with the shards, not copied.
+		"""
+		stop_ids, stop_names, stop_coords, route_names = [], [], [], {}
+		trip_ids, trip_routes, trip_headsigns, trip_flags = [], [], [], bytearray()
+		trip_shapes, patterns, footpaths, shape_parts = int32_array(), [], [], []
+		for shard in shards:
+			stop_base, trip_base = len(stop_ids), len(trip_ids)
+			shape_base = sum(len(shapes.shape_ids) for shapes, _ in shape_parts)
+			stop_ids += shard.stop_ids
+			stop_names += shard.stop_names
+			stop_coords += shard.stop_coords
+			route_names.update(shard.route_names)
+			trip_ids += shard.trip_ids
+			trip_routes += shard.trip_routes
+			trip_headsigns += shard.trip_headsigns
+			trip_flags += bytes(shard.trip_flags)
+			trip_shapes.extend(shape + shape_base if shape >= 0 else -1 for shape in shard.trip_shapes)
+			for pattern in shard.patterns:
+				patterns.append(Pattern(
+					index=len(patterns),
+					route_id=pattern.route_id,
+					stops=int32_array(stop_base + stop for stop in pattern.stops),
+					trips=int32_array(trip_base + trip for trip in pattern.trips),
+					arrivals=pattern.arrivals,
+					departures=pattern.departures,
+				))
+			footpaths += [[(stop_base + target, seconds) for target, seconds in shard.footpaths[stop]] for stop in range(len(shard.stop_ids))]
+			shape_parts.append((shard.shapes, stop_base))
+		stop_index = {stop_id: i for i, stop_id in enumerate(stop_ids)}
+		for from_stop_id, to_stop_id, seconds in transfers:
+			if from_stop_id in stop_index and to_stop_id in stop_index:
+				footpaths[stop_index[from_stop_id]].append((stop_index[to_stop_id], seconds))
+		return cls(
+			stop_ids=stop_ids,
+			stop_names=stop_names,
+			stop_coords=stop_coords,
+			route_names=route_names,
+			trip_ids=trip_ids,
+			trip_routes=trip_routes,
+			trip_headsigns=trip_headsigns,
+			patterns=patterns,
+			footpaths=Footpaths.from_lists(footpaths),
+			feed_version=feed_version,
+			trip_shapes=trip_shapes,
+			shapes=Shapes.concat(shape_parts),
+			trip_flags=bytes(trip_flags),
+		)
+
+	@classmethod
+	def from_db(cls, feed=None):
+		"""
+		Loads the timetable from the imported GTFS tables: of one feed, or of every feed.
+		Several feeds are loaded one by one and merged with the transfers between them
+		precomputed at import (FeedTransfer).
+
+		Patterns come from the RoutePattern rows written at import time; databases
+		imported before patterns existed fall back to grouping the StopTime rows here,
+		and likewise for the ShapeGeometry rows holding the leg geometry.
+		"""
+		if feed is None:
+			versions = list(FeedInfo.objects.values_list('feed', 'version'))
+			if len(versions) > 1:
+				return cls.merge(
+					[cls.from_db(feed) for feed, _ in sorted(versions)],
+					FeedTransfer.objects.values_list('from_stop_id', 'to_stop_id', 'seconds'),
+					feed_version=FeedInfo.combine_versions(versions),
+				)
+
+		def scoped(model):
+			return model.objects.filter(feed=feed) if feed is not None else model.objects.all()
+
+		stops = list(scoped(Stop).values_list('id', 'name', 'latitude', 'longitude'))
+		routes = list(scoped(Route).values_list('id', 'short_name'))
+		trips = [
+			(trip_id, route_id, headsign, shape_id, TRIP_WHEELCHAIR * accessible | TRIP_BIKES * bikes)
+			for trip_id, route_id, headsign, shape_id, accessible, bikes
+			in scoped(Trip).values_list('id', 'route_id', 'trip_headsign', 'shape_id', 'is_accessible', 'is_bikes')
+		]
+
+		patterns = [
+			PatternData(
+				route_id=row.route_id,
+				stop_ids=_int32_from_bytes(row.stop_ids),
+				trip_ids=_int32_from_bytes(row.trip_ids),
+				arrivals=_int32_from_bytes(row.arrivals),
+				departures=_int32_from_bytes(row.departures),
+			)
+			for row in scoped(RoutePattern).order_by('id')
+		]
+		if not patterns:
+			patterns = cls._patterns_from_stop_times(trips, scoped(StopTime))
+
+		shapes = [
+			ShapeData(
+				shape_id=row.shape_id,
+				points=_float64_from_bytes(row.points),
+				stop_ids=_int32_from_bytes(row.stop_ids),
+				stop_points=_int32_from_bytes(row.stop_points),
+			)
+			for row in scoped(ShapeGeometry).order_by('shape_id')
+		]
+		if not shapes and scoped(Shape).exists():
+			shapes = cls._shapes_from_db(stops, trips, scoped(Shape), scoped(StopTime))
+		version = scoped(FeedInfo).values_list('version', flat=True).first() if feed is not None else FeedInfo.current_version()
+		return cls.build(stops, routes, trips, patterns, feed_version=version, shapes=shapes)
+
+	@classmethod
+	def _patterns_from_stop_times(cls, trips, stop_times):
+		trip_stop_times = {}
+		rows = stop_times.order_by('trip_id', 'stop_sequence').values_list(
+			'trip_id', 'stop_sequence', 'stop_id', 'arrival_time', 'departure_time'
+		)
+		for trip_id, sequence, stop_id, arrival, departure in rows:
+			trip_stop_times.setdefault(trip_id, []).append(
+				(sequence, stop_id, seconds_since_midnight(arrival), seconds_since_midnight(departure))
+			)
+		for trip_id, stop_times in trip_stop_times.items():
+			trip_stop_times[trip_id] = cls._unwrap_times(stop_times)
+		return build_patterns(trip_stop_times, {trip_id: route_id for trip_id, route_id, *_ in trips})
+
+	@classmethod
+	def _shapes_from_db(cls, stops, trips, shape_rows, stop_times):
+		shape_points = {}
+		rows = shape_rows.values_list('shape_id', 'shape_pt_sequence', 'shape_pt_lat', 'shape_pt_lon', 'shape_dist_traveled')
+		for shape_id, sequence, lat, lon, dist in rows:
+			shape_points.setdefault(shape_id, []).append((sequence, lat, lon, dist))
+		trip_stops = {}
+		for trip_id, sequence, stop_id, dist in stop_times.values_list('trip_id', 'stop_sequence', 'stop_id', 'shape_dist_traveled'):
+			trip_stops.setdefault(trip_id, []).append((sequence, stop_id, dist))
+		return build_shapes(
+			shape_points,
+			trip_stops,
+			{trip[0]: trip[3] for trip in trips},
+			{stop_id: (float(lat), float(lon)) for stop_id, _, lat, lon in stops},
+		)
+
+	@staticmethod
+	def _unwrap_times(stop_times):
+		"""
+		The StopTime table wraps GTFS times past 24:00 back to the morning, so a trip
+		running over midnight appears to go back in time. Restore a monotonic clock.
+		"""
+		unwrapped = []
+		offset, last = 0, 0
+		for sequence, stop_id, arrival, departure in stop_times:
+			if arrival + offset < last:
+				offset += SECONDS_PER_DAY
+			arrival += offset
+			if departure + offset < arrival:
+				departure += SECONDS_PER_DAY
+			departure += offset
+			unwrapped.append((sequence, stop_id, arrival, departure))
+			last = departure
+		return unwrapped
+
+	def direct_connections(self, from_stop, to_stop):
+		"""
+		Returns [(pattern_index, board_position, alight_position)] for every pattern
+		riding from one stop to the other without a transfer (memoized).
+		"""
+		key = (from_stop, to_stop)
+		connections = self._direct_connections.get(key)
+		if connections is None:
+			connections = []
+			for pattern_index, board in self.stop_patterns[from_stop]:
+				stops = self.patterns[pattern_index].stops
+				for alight in range(board + 1, len(stops)):
+					if stops[alight] == to_stop:
+						connections.append((pattern_index, board, alight))
+						break
+			self._direct_connections[key] = connections
+		return connections
+
+	def leg_path(self, trip, from_stop, to_stop):
+		"""
+		The [(lat, lon)] polyline of a ride on `trip` between two stop indices: a slice of
+		the trip's shape, or the straight lines between the stops it calls at when the
+		trip has no shape (or the stops are not on it).
+		"""
+		shape = self.trip_shapes[trip]
+		if shape >= 0:
+			path = self.shapes.path(shape, from_stop, to_stop)
+			if path:
+				return path
+		pattern_index, _ = self.trip_patterns[trip]
+		stops = list(self.patterns[pattern_index].stops)
+		board = stops.index(from_stop)
+		alight = stops.index(to_stop, board + 1)
+		return [self.stop_coords[stop] for stop in stops[board:alight + 1]]
+
+	def _index_patterns(self):
+		"""Lists the (pattern, position) of every stop and the (pattern, trip position) of every trip."""
+		stop_patterns = [[] for _ in self.stop_ids]
+		trip_patterns = {}
+		for pattern in self.patterns:
+			for position, stop in enumerate(pattern.stops):
+				stop_patterns[stop].append((pattern.index, position))
+			for trip_pos, trip in enumerate(pattern.trips):
+				trip_patterns[trip] = (pattern.index, trip_pos)
+		self.stop_patterns = stop_patterns
+		self.trip_patterns = trip_patterns
+
+	def _build_grid(self):
+		"""Buckets stops into cells at least MAX_WALK_METERS wide for radius lookups."""
+		cell_lat = MAX_WALK_METERS / 111_000
+		max_lat = max((abs(lat) for lat, _ in self.stop_coords), default=0)
+		cell_lon = cell_lat / max(math.cos(math.radians(max_lat)), 0.01)
+		grid = {}
+		for stop, (lat, lon) in enumerate(self.stop_coords):
+			grid.setdefault((int(math.floor(lat / cell_lat)), int(math.floor(lon / cell_lon))), []).append(stop)
+		self.cell_lat, self.cell_lon, self.grid = cell_lat, cell_lon, grid
+
+	def _cell(self, coords):
+		return (int(math.floor(coords[0] / self.cell_lat)), int(math.floor(coords[1] / self.cell_lon)))
+
+	def nearby_stops(self, coords, max_meters=MAX_WALK_METERS):
+		"""Returns [(stop_index, walk_seconds)] for every stop within walking distance."""
+		row, col = self._cell(coords)
+		reach = max(1, int(math.ceil(max_meters / MAX_WALK_METERS)))
+		nearby = []
+		for r in range(row - reach, row + reach + 1):
+			for c in range(col - reach, col + reach + 1):
+				for stop in self.grid.get((r, c), ()):
+					stop_coords = self.stop_coords[stop]
+					if haversine(coords, stop_coords, unit=Unit.METERS) <= max_meters:
+						nearby.append((stop, walk_seconds(coords, stop_coords)))
+		return nearby
+
+
+_timetable = None
+_timetable_lock = threading.Lock()
+_shards = {}        # feed -> timetable of that feed alone
+_shard_sets = {}    # frozenset of feeds -> their shards merged
+_feed_extents = None
+
+
+def get_timetable(feeds=None):
+	"""
+	Returns the process-wide timetable, loading it on first use. With `feeds` (see
+	feeds_near), the timetable of just those feeds: one feed's shard, or the shards
+	merged with the precomputed transfers between them, each loaded once.
+	"""
+	global _timetable
+	if feeds is None:
+		if _timetable is None:
+			with _timetable_lock:
+				if _timetable is None:
+					_timetable = _load_timetable()
+		return _timetable
+
+	feeds = frozenset(feeds)
+	timetable = _shard_sets.get(feeds)
+	if timetable is None:
+		with _timetable_lock:
+			timetable = _shard_sets.get(feeds)
+			if timetable is None:
+				timetable = _shard_sets[feeds] = _load_shards(feeds)
+	return timetable
+
+
+def _load_shards(feeds):
+	for feed in feeds:
+		if feed not in _shards:
+			_shards[feed] = Timetable.from_db(feed)
+	if len(feeds) == 1:
+		return _shards[next(iter(feeds))]
+	ordered = sorted(feeds)
+	return Timetable.merge(
+		[_shards[feed] for feed in ordered],
+		FeedTransfer.objects.filter(from_feed__in=ordered, to_feed__in=ordered).values_list('from_stop_id', 'to_stop_id', 'seconds'),
+		feed_version=FeedInfo.combine_versions((feed, _shards[feed].feed_version) for feed in ordered),
+	)
+
+
+def feeds_near(*coords):
+	"""
+	The feeds with stops within walking distance of any of `coords`, so a query only
+	searches the shards around its ends. None when that is every imported feed (or
+	none at all): the full timetable is the one to search then.
+	"""
+	global _feed_extents
+	extents = _feed_extents
+	if extents is None:
+		with _timetable_lock:
+			if _feed_extents is None:
+				_feed_extents = list(FeedInfo.objects.values_list('feed', 'min_latitude', 'max_latitude', 'min_longitude', 'max_longitude'))
+			extents = _feed_extents
+	if len(extents) <= 1:
+		return None
+	margin_lat = MAX_WALK_METERS / 111_000
+	near = set()
+	for feed, min_lat, max_lat, min_lon, max_lon in extents:
+		if min_lat is None:
+			near.add(feed)  # imported before feeds had extents
+			continue
+		margin_lon = margin_lat / max(math.cos(math.radians(max(abs(min_lat), abs(max_lat)))), 0.01)
+		if any(min_lat - margin_lat <= lat <= max_lat + margin_lat and min_lon - margin_lon <= lon <= max_lon + margin_lon for lat, lon in coords):
+			near.add(feed)
+	if not near or len(near) == len(extents):
+		return None
+	return frozenset(near)
+
+
+def _load_timetable():
+	"""
+	Prefers the compiled file named by settings.TRANSIT_TIMETABLE_FILE (shared between
+	worker processes through mmap) and falls back to the database when the file is
+	missing, unreadable or was compiled from another feed.
+	"""
+	path = getattr(settings, 'TRANSIT_TIMETABLE_FILE', None)
+	if path and os.path.exists(path):
+		from .compiled import TimetableFileError, load_timetable, read_feed_version
+		try:
+			current = FeedInfo.current_version()
+			if read_feed_version(path) != current:
+				raise TimetableFileError(f"{path} does not match imported feed {current}; run compile_timetable")
+			return load_timetable(path)
+		except TimetableFileError as e:
+			logger.warning("Ignoring compiled timetable: %s", e)
+	return Timetable.from_db()
+
+
+def clear_timetable_cache():
+	"""
+	Forgets the cached timetables so the next call reloads them (e.g. after an import),
+	and the /plan/ results computed from it.
+	"""
+	global _timetable, _feed_extents
+	with _timetable_lock:
+		_timetable = None
+		_feed_extents = None
+		_shards.clear()
+		_shard_sets.clear()
+	plan_cache.clear()
@@ -0,0 +1,375 @@
+"""
+Transfer patterns: precomputed "which stops do optimal journeys change at" per
+source stop, so a query only evaluates a handful of direct connections.
+
+For every source stop a one-to-all range-RAPTOR over a sample of the service day
+(departures inside the sampled windows, at most one every `sample_seconds`) records,
+for each reachable target, the distinct leg sequences of its optimal journeys. A
+query then combines the patterns from its access stops to its egress stops and
+times each leg with a bisect into the route pattern that serves it; journeys that
+are only optimal at departures outside the sample are not found, and a query that
+finds none falls back to a RAPTOR search.
+
+File layout (little-endian): a header (magic, format version, stop count, feed
+version), stop_count + 1 int64 offsets into the body, then one zlib-compressed
+int32 chunk per source stop:
+  [target_count, (target, pattern_count, (leg_count, leg, ...)...)...]
+where each leg is (to_stop << 1) | kind, kind 0 = ride and 1 = walk.
+"""
+import logging
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from array import array
+from collections import defaultdict
+from collections.abc import Mapping
+from datetime import datetime, time
+from functools import lru_cache
+from multiprocessing import Pool
+
+from django.conf import settings
+
+from .constants import MAX_ROUNDS
+from .raptor import RaptorPlanner, _Journey, _pareto
+from .realtime import get_live_timetable
+from .timetable import INFINITY
+
+MAGIC = b'GTTPAT\0\0'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sII64s')
+RIDE, WALK = 0, 1
+MAX_RESULTS = 5
+# Departures sampled by default: the service day from 06:00 to 22:00, one every 30 minutes
+DEFAULT_WINDOWS = ((6 * 3600, 22 * 3600),)
+DEFAULT_SAMPLE_SECONDS = 30 * 60
+
+logger = logging.getLogger(__name__)
+
+
+class TransferPatternError(ValueError):
+	"""Raised when a transfer pattern file is missing or malformed."""
+
+
+# --- Precomputation ---
+
+class _OneToAllRaptor(RaptorPlanner):
+	"""Range-RAPTOR from a single stop to every stop, recording the leg sequence of each improvement."""
+	def __init__(self, timetable, source, windows=DEFAULT_WINDOWS, sample_seconds=DEFAULT_SAMPLE_SECONDS):
+		self.timetable = timetable
+		self.windows = windows
+		self.sample_seconds = sample_seconds
+		self.max_rounds = MAX_ROUNDS
+		self.required = 0  # patterns are precomputed over every trip
+		self.access = [(source, 0)]
+		self.egress = defaultdict(int)
+		self.found = defaultdict(set)
+
+	def run(self):
+		self._reset_labels()
+		for departure in self._sampled_departures():
+			self._run(departure)
+		return self.found
+
+	def _sampled_departures(self):
+		"""The departure times in the windows, latest first, at least sample_seconds apart."""
+		departures = sorted({
+			departure for start, end in self.windows for departure in self._departure_times(start, end)
+		}, reverse=True)
+		sampled = []
+		for departure in departures:
+			if not sampled or sampled[-1] - departure >= self.sample_seconds:
+				sampled.append(departure)
+		return sampled
+
+	def _check_target(self, k, marked):
+		for stop in marked:
+			journey = self._reconstruct(k, stop)
+			legs = []
+			for leg in journey.legs:
+				if leg[0] == 'ride':
+					pattern = self.timetable.patterns[leg[1]]
+					legs.append((pattern.stops[leg[4]] << 1) | RIDE)
+				elif leg[0] == 'walk':
+					legs.append((leg[2] << 1) | WALK)
+			self.found[stop].add(tuple(legs))
+		return None
+
+
+_worker_timetable = None
+_worker_sample = (DEFAULT_WINDOWS, DEFAULT_SAMPLE_SECONDS)
+
+
+def _init_worker(timetable, windows, sample_seconds):
+	global _worker_timetable, _worker_sample
+	_worker_timetable = timetable
+	_worker_sample = (windows, sample_seconds)
+
+
+def _compute_source(source):
+	"""Returns the encoded, compressed chunk for one source stop."""
+	found = _OneToAllRaptor(_worker_timetable, source, *_worker_sample).run()
+	values = array('i', [len(found)])
+	for target in sorted(found):
+		patterns = sorted(found[target])
+		values.extend((target, len(patterns)))
+		for legs in patterns:
+			values.append(len(legs))
+			values.extend(legs)
+	return zlib.compress(values.tobytes(), 6)
+
+
+def precompute(timetable, processes=None, progress=None, windows=DEFAULT_WINDOWS,
+		sample_seconds=DEFAULT_SAMPLE_SECONDS, chunksize=8):
+	"""
+	Computes the compressed chunk of every source stop over the departures sampled
+	from `windows` [(start, end)] (seconds since midnight of the service day),
+	spreading sources over a process pool `chunksize` stops at a time. `progress`,
+	if given, is called with the number of stops done after every `chunksize` stops.
+	"""
+	stop_count = len(timetable.stop_ids)
+	sample = (tuple(windows), sample_seconds)
+	if processes == 1:
+		_init_worker(timetable, *sample)
+		results = map(_compute_source, range(stop_count))
+		pool = None
+	else:
+		pool = Pool(processes=processes, initializer=_init_worker, initargs=(timetable, *sample))
+		results = pool.imap(_compute_source, range(stop_count), chunksize=chunksize)
+	chunks = []
+	try:
+		for chunk in results:
+			chunks.append(chunk)
+			if progress and (len(chunks) % chunksize == 0 or len(chunks) == stop_count):
+				progress(len(chunks))
+	finally:
+		if pool is not None:
+			pool.close()
+			pool.join()
+	return chunks
+
+
+def write_transfer_patterns(path, chunks, feed_version):
+	"""Writes the chunks to `path` (atomically) and returns the file size in bytes."""
+	offsets = array('q', [0])
+	for chunk in chunks:
+		offsets.append(offsets[-1] + len(chunk))
+	directory = os.path.dirname(os.path.abspath(path))
+	fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.transfer-patterns-')
+	try:
+		with os.fdopen(fd, 'wb') as f:
+			f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(chunks), (feed_version or '').encode()))
+			f.write(offsets.tobytes())
+			for chunk in chunks:
+				f.write(chunk)
+		os.replace(temp_path, path)
+	except BaseException:
+		if os.path.exists(temp_path):
+			os.remove(temp_path)
+		raise
+	return HEADER.size + len(offsets) * offsets.itemsize + offsets[-1]
+
+
+# --- Storage ---
+
+class TransferPatterns:
+	"""The precomputed transfer patterns of every source stop, decoded lazily per source."""
+	def __init__(self, feed_version, offsets, body):
+		self.feed_version = feed_version
+		self.offsets = offsets
+		self.body = body
+		self.patterns_from = lru_cache(maxsize=1024)(self._decode)
+
+	@classmethod
+	def load(cls, path):
+		try:
+			with open(path, 'rb') as f:
+				data = f.read()
+			magic, format_version, stop_count, version = HEADER.unpack_from(data, 0)
+		except (OSError, struct.error) as e:
+			raise TransferPatternError(f"cannot read {path}: {e}") from e
+		if magic != MAGIC or format_version != FORMAT_VERSION:
+			raise TransferPatternError(f"{path} is not a transfer pattern file of format {FORMAT_VERSION}")
+		offsets = array('q')
+		start = HEADER.size
+		offsets.frombytes(data[start:start + (stop_count + 1) * offsets.itemsize])
+		body = memoryview(data)[start + len(offsets) * offsets.itemsize:]
+		return cls(version.rstrip(b'\0').decode() or None, offsets, body)
+
+	def _decode(self, source):
+		"""Returns the {target: [legs]} of one source stop, legs decoded per target on lookup."""
+		values = array('i')
+		values.frombytes(zlib.decompress(self.body[self.offsets[source]:self.offsets[source + 1]]))
+		return SourcePatterns(values)
+
+
+class SourcePatterns(Mapping):
+	"""
+	The patterns of one source stop as a read-only {target: [legs]}. Only the start of
+	each target's run is indexed up front; a query asks for a few egress stops out of
+	hundreds of targets, so building every leg tuple would be wasted work.
+	"""
+	def __init__(self, values):
+		self.values = values
+		self.starts = {}
+		i = 1
+		for _ in range(values[0]):
+			self.starts[values[i]] = i + 1
+			i += 2
+			for _ in range(values[i - 1]):
+				i += 1 + values[i]
+
+	def __getitem__(self, target):
+		values, i = self.values, self.starts[target]
+		legs = []
+		for _ in range(values[i]):
+			length = values[i + 1]
+			legs.append(tuple(values[i + 2:i + 2 + length]))
+			i += 1 + length
+		return legs
+
+	def __contains__(self, target):
+		return target in self.starts
+
+	def __iter__(self):
+		return iter(self.starts)
+
+	def __len__(self):
+		return len(self.starts)
+
+
+_transfer_patterns = None
+_transfer_patterns_lock = threading.Lock()
+
+
+def get_transfer_patterns():
+	"""Returns the patterns named by settings.TRANSIT_TRANSFER_PATTERNS_FILE, or None if there are none."""
+	global _transfer_patterns
+	if _transfer_patterns is None:
+		path = getattr(settings, 'TRANSIT_TRANSFER_PATTERNS_FILE', None)
+		if not path or not os.path.exists(path):
+			return None
+		with _transfer_patterns_lock:
+			if _transfer_patterns is None:
+				try:
+					_transfer_patterns = TransferPatterns.load(path)
+				except TransferPatternError as e:
+					logger.warning("Ignoring transfer patterns: %s", e)
+					return None
+	return _transfer_patterns
+
+
+def clear_transfer_patterns_cache():
+	global _transfer_patterns
+	with _transfer_patterns_lock:
+		_transfer_patterns = None
+
+
+# --- Queries ---
+
+class TransferPatternPlanner(RaptorPlanner):
+	"""
+	Answers earliest-arrival queries from precomputed transfer patterns. When there
+	are no patterns, they were computed for another feed, `required` trip flags are
+	set (the patterns were computed over every trip) or no pattern gives a journey,
+	it falls back to a RAPTOR search leaving at the start time.
+	"""
+	def __init__(self, start_coords, end_coords, start_time, timetable=None, transfer_patterns=None, required=0):
+		# The patterns index the stops of the full timetable, not of a feed's shard
+		super().__init__(start_coords, end_coords, timetable=timetable or get_live_timetable(), required=required)
+		self.start_time_dt = start_time
+		self.transfer_patterns = transfer_patterns if transfer_patterns is not None else get_transfer_patterns()
+
+	@property
+	def is_usable(self):
+		return self.transfer_patterns is not None and self.transfer_patterns.feed_version == self.timetable.feed_version
+
+	def find_paths(self):
+		"""
+		Up to five Pareto-optimal itineraries (earlier arrival, fewer vehicles, later departure).
+
+		Leaving at one instant, a journey arriving after one already found with no more
+		vehicles cannot make the top five, so each pattern is dropped as soon as its
+		running arrival passes that bound. The rides shared by the patterns of several
+		access and egress stops are timed once (see _ride).
+		"""
+		if not self.is_usable or self.required:
+			return self._fall_back()
+		if not self.access or not self.egress:
+			return []
+
+		service_day = datetime.combine(self.start_time_dt.date(), time.min)
+		departure = int((self.start_time_dt - service_day).total_seconds())
+		self._rides = {}
+		earliest = {}  # rides -> earliest arrival of the journeys found
+		journeys = []
+		candidates = []
+		for source, access_walk in self.access:
+			patterns = self.transfer_patterns.patterns_from(source)
+			for target, egress_walk in self.egress.items():
+				for legs in patterns.get(target, ()):
+					rides = sum(1 for leg in legs if leg & 1 == RIDE)
+					candidates.append((rides, access_walk + egress_walk, source, access_walk, legs, target, egress_walk))
+		# Few rides and short walks first, so the bounds tighten early
+		candidates.sort(key=lambda c: c[:2])
+		for rides, _, source, access_walk, legs, target, egress_walk in candidates:
+			bound = min((arrival for count, arrival in earliest.items() if count <= rides), default=INFINITY)
+			journey = self._evaluate(source, access_walk, legs, target, egress_walk, departure, bound)
+			if journey is not None:
+				journeys.append(journey)
+				earliest[journey.rides] = min(earliest.get(journey.rides, INFINITY), journey.arrival)
+		if not journeys:
+			return self._fall_back()
+		best = sorted(_pareto(journeys), key=lambda j: (j.arrival, j.rides))[:MAX_RESULTS]
+		return [self._to_itinerary(journey, service_day) for journey in best]
+
+	def _fall_back(self):
+		itineraries = self.profile(self.start_time_dt, self.start_time_dt)
+		return sorted(itineraries, key=lambda it: (it.end_time, sum(leg.mode == 'transit' for leg in it.legs)))[:MAX_RESULTS]
+
+	def _evaluate(self, source, access_walk, legs, target, egress_walk, departure, bound=INFINITY):
+		"""
+		Times one transfer pattern leaving at `departure`; None if a leg has no service
+		or the journey cannot arrive by `bound` (egress included).
+		"""
+		now, at = departure + access_walk, source
+		timed = [('access', source, access_walk)]
+		for leg in legs:
+			to, kind = leg >> 1, leg & 1
+			if kind == WALK:
+				seconds = self._walk_seconds(at, to)
+				if seconds is None:
+					return None
+				timed.append(('walk', at, to, seconds))
+				now += seconds
+			else:
+				ride = self._ride(at, to, now)
+				if ride is None:
+					return None
+				now = ride[0]
+				timed.append(('ride',) + ride[1:])
+			if now + egress_walk > bound:
+				return None
+			at = to
+		timed.append(('egress', target, egress_walk))
+		return _Journey(self.timetable, timed)
+
+	def _ride(self, from_stop, to_stop, ready):
+		"""(arrival, pattern, trip, board, alight) of the earliest ride from one stop to another after `ready`."""
+		key = (from_stop, to_stop, ready)
+		if key not in self._rides:
+			best = None
+			for pattern_index, board, alight in self.timetable.direct_connections(from_stop, to_stop):
+				pattern = self.timetable.patterns[pattern_index]
+				trip = pattern.earliest_trip(board, ready)
+				if trip is not None and (best is None or pattern.arrival(trip, alight) < best[0]):
+					best = (pattern.arrival(trip, alight), pattern_index, trip, board, alight)
+			self._rides[key] = best
+		return self._rides[key]
+
+	def _walk_seconds(self, from_stop, to_stop):
+		for other, seconds in self.timetable.footpaths[from_stop]:
+			if other == to_stop:
+				return seconds
+		return None
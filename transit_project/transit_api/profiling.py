@@ -0,0 +1,175 @@
+"""
+Opt-in profiling of /plan/ requests, and the inputs to replay them.
+
+A slow plan cannot be reproduced from its URL alone: the search starts at
+datetime.now(), and reads whichever feed and real-time delays the process had at
+the time. With settings.TRANSIT_PROFILE_DIR set, a request is profiled with
+probability settings.TRANSIT_PROFILE_SAMPLE_RATE, or when it sends the header
+`X-Transit-Profile: <settings.TRANSIT_PROFILE_TOKEN>`. It then searches afresh
+(skipping the plan cache and coalescing) under cProfile, and two files are written:
+
+  <id>.prof   the pstats dump (python -m pstats, snakeviz, or flameprof for a flame graph)
+  <id>.json   the PlanInputs with the resolved times, the feed version, the trip
+              updates in force and the itineraries found
+
+The response carries the id in X-Transit-Profile-Id. `manage.py replay_plan <id>.json`
+runs the same search again against the same delays.
+"""
+import cProfile
+import hmac
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Tuple
+
+from django.conf import settings
+
+from .encoders import encode_itineraries
+from .planning.planner import TransitPlanner
+from .planning.raptor import RaptorPlanner
+from .planning.realtime import StopUpdate, TripUpdate, delay_overlay
+from .planning.timetable import get_timetable
+from .planning.transfer_patterns import TransferPatternPlanner
+
+# Planner modes of /plan/, in the order PlanTripView picks them
+MODES = ('arrive_by', 'profile', 'transfer_patterns', 'a_star')
+
+PROFILE_HEADER = 'X-Transit-Profile'
+PROFILE_ID_HEADER = 'X-Transit-Profile-Id'
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PlanInputs:
+	"""
+	Everything a /plan/ search depends on besides the feed and the delays: the
+	planner mode, the coordinates, the resolved times (arrive_by: the deadline;
+	profile: the window; otherwise the start time) and the required trip flags.
+	"""
+	mode: str
+	start_coords: Dict[str, float]
+	end_coords: Dict[str, float]
+	times: Tuple[datetime, ...]
+	required: int = 0
+
+	def start_planner(self):
+		"""Returns the planner and an iterable of its itineraries (lazy for A*)."""
+		if self.mode == 'arrive_by':
+			planner = RaptorPlanner(self.start_coords, self.end_coords, required=self.required)
+			return planner, planner.arrive_by(self.times[0])
+		if self.mode == 'profile':
+			planner = RaptorPlanner(self.start_coords, self.end_coords, required=self.required)
+			return planner, planner.profile(*self.times)
+		if self.mode == 'transfer_patterns':
+			planner = TransferPatternPlanner(self.start_coords, self.end_coords, self.times[0], required=self.required)
+			return planner, planner.find_paths()
+		planner = TransitPlanner(self.start_coords, self.end_coords, self.times[0], required=self.required)
+		return planner, planner.iter_paths()
+
+	def as_dict(self):
+		return {
+			'mode': self.mode,
+			'from': dict(self.start_coords),
+			'to': dict(self.end_coords),
+			'times': [t.isoformat() for t in self.times],
+			'required': self.required,
+		}
+
+	@classmethod
+	def from_dict(cls, data):
+		if data['mode'] not in MODES:
+			raise ValueError(f"unknown planner mode {data['mode']!r}")
+		return cls(
+			mode=data['mode'],
+			start_coords={'latitude': float(data['from']['latitude']), 'longitude': float(data['from']['longitude'])},
+			end_coords={'latitude': float(data['to']['latitude']), 'longitude': float(data['to']['longitude'])},
+			times=tuple(datetime.fromisoformat(t) for t in data['times']),
+			required=int(data.get('required', 0)),
+		)
+
+
+def should_profile(request):
+	"""Whether this /plan/ request is to be profiled (see the module docstring)."""
+	if not getattr(settings, 'TRANSIT_PROFILE_DIR', ''):
+		return False
+	token = getattr(settings, 'TRANSIT_PROFILE_TOKEN', '')
+	if token and hmac.compare_digest(request.headers.get(PROFILE_HEADER, '').encode(), token.encode()):
+		return True
+	rate = getattr(settings, 'TRANSIT_PROFILE_SAMPLE_RATE', 0)
+	return rate > 0 and random.random() < rate
+
+
+def dump_updates(updates):
+	"""The trip updates of a DelayOverlay as JSON-compatible rows."""
+	return [
+		{'trip_id': trip_id, 'cancelled': update.cancelled, 'delay': update.delay, 'stops': [list(stop) for stop in update.stops]}
+		for trip_id, update in sorted(updates.items())
+	]
+
+
+def load_updates(rows):
+	"""The inverse of dump_updates: {GTFS trip id: TripUpdate}."""
+	return {
+		int(row['trip_id']): TripUpdate(cancelled=row['cancelled'], delay=row['delay'], stops=[StopUpdate(*stop) for stop in row['stops']])
+		for row in rows
+	}
+
+
+def record_plan(inputs, plan, directory=None):
+	"""
+	Runs plan() (which returns (itineraries, stats)) under cProfile and writes the
+	dump and the recording to `directory` (default: settings.TRANSIT_PROFILE_DIR).
+	Returns (plan()'s result, profile id); the id is None when the files could not be
+	written, which is logged but does not fail the plan.
+	"""
+	directory = directory or settings.TRANSIT_PROFILE_DIR
+	profile_id = f'{datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}'
+	# The overlay swaps its dict on each apply, so this is the set planned against
+	updates = delay_overlay.updates
+	profiler = cProfile.Profile()
+	started = time.perf_counter()
+	profiler.enable()
+	try:
+		itineraries, stats = plan()
+	finally:
+		profiler.disable()
+	seconds = time.perf_counter() - started
+
+	try:
+		recording = {
+			'id': profile_id,
+			'recorded_at': datetime.now().isoformat(timespec='seconds'),
+			**inputs.as_dict(),
+			'feed_version': get_timetable().feed_version,
+			'realtime': dump_updates(updates),
+			'seconds': round(seconds, 6),
+			'stats': stats.as_dict(),
+			'itineraries': json.loads(encode_itineraries(itineraries)),
+		}
+		_write_recording(directory, profile_id, profiler, recording)
+	except Exception:
+		logger.exception("Could not write the profile of %s plan %s to %s", inputs.mode, profile_id, directory)
+		return (itineraries, stats), None
+	logger.info("Profiled %s plan %s in %.3fs", inputs.mode, profile_id, seconds)
+	return (itineraries, stats), profile_id
+
+
+def _write_recording(directory, profile_id, profiler, recording):
+	"""Writes <id>.prof and <id>.json, leaving neither behind when one fails."""
+	paths = [os.path.join(directory, f'{profile_id}.{extension}') for extension in ('prof', 'json')]
+	try:
+		os.makedirs(directory, exist_ok=True)
+		profiler.dump_stats(paths[0])
+		with open(paths[1], 'w') as f:
+			json.dump(recording, f, indent=2)
+	except BaseException:
+		for path in paths:
+			if os.path.exists(path):
+				os.remove(path)
+		raise
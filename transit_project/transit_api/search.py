@@ -0,0 +1,196 @@
+"""
+Stop name search for autocomplete.
+
+StopSearchIndex is built once per process from every stop's name and description.
+A prefix trie answers "which stops have a word starting with ..." with one walk
+down the trie (every node keeps the stops below it), and a trigram index over the
+vocabulary catches typos when a word matches no prefix. Candidates are ranked by how
+well they match the name, and only the best few are returned.
+"""
+import heapq
+import re
+import threading
+import unicodedata
+
+from transit_api.models import Stop
+from .http_cache import feed_version_cache
+from .serializers import StopSerializer
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+MIN_FUZZY_LENGTH = 3
+MIN_FUZZY_SIMILARITY = 0.5  # share of the query word's trigrams a fuzzy match must contain
+MAX_RANKED = 1000  # very broad queries ("s") rank only this many candidates, shortest names first
+# Query words that also match the spelled-out word ("stone rd" finds "Stone Road West")
+ABBREVIATIONS = {
+	'ave': 'avenue', 'blvd': 'boulevard', 'cres': 'crescent', 'ct': 'court', 'dr': 'drive',
+	'hwy': 'highway', 'ln': 'lane', 'pl': 'place', 'rd': 'road', 'st': 'street',
+}
+
+_WORD = re.compile(r'[a-z0-9]+')
+
+
+def normalize(text):
+	"""Lowercase ASCII words of `text`, accents folded ("Café" -> ["cafe"])."""
+	folded = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode()
+	return _WORD.findall(folded.lower())
+
+
+def trigrams(word):
+	"""The trigrams of a word padded with '$' at both ends, so short words still have some."""
+	padded = f'${word}$'
+	return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _TrieNode:
+	__slots__ = ('children', 'stops')
+
+	def __init__(self):
+		self.children = {}
+		self.stops = []  # entry indices of every stop with a word under this node, ascending
+
+
+class StopSearchIndex:
+	"""
+	An in-memory search index over `entries`: dicts with at least 'name' and 'desc',
+	returned as they are by search(). Entries are numbered shortest name first, so
+	every list of entry indices is also in tie-break order. `feed_version` is the
+	version of the feed the entries were read from.
+	"""
+	def __init__(self, entries, feed_version=None):
+		self.feed_version = feed_version
+		named = sorted(((' '.join(normalize(entry['name'])), position, entry) for position, entry in enumerate(entries)),
+			key=lambda item: (len(item[0]), item[0], item[1]))
+		self.entries = [entry for _, _, entry in named]
+		self.name_words = []
+		self.root = _TrieNode()
+		self.vocabulary = {}  # word -> entry indices
+		self.trigram_index = {}  # trigram -> words
+		for index, (name, _, entry) in enumerate(named):
+			name_words = name.split()
+			self.name_words.append((frozenset(name_words), name))
+			for word in set(name_words) | set(normalize(entry.get('desc'))):
+				self._insert(word, index)
+		for word in self.vocabulary:
+			for trigram in trigrams(word):
+				self.trigram_index.setdefault(trigram, []).append(word)
+
+	def _insert(self, word, index):
+		if word not in self.vocabulary:
+			self.vocabulary[word] = []
+		self.vocabulary[word].append(index)
+		node = self.root
+		for char in word:
+			node = node.children.setdefault(char, _TrieNode())
+			if not node.stops or node.stops[-1] != index:
+				node.stops.append(index)
+
+	def _prefix_matches(self, word):
+		node = self.root
+		for char in word:
+			node = node.children.get(char)
+			if node is None:
+				return []
+		return node.stops
+
+	def _similar_words(self, word):
+		"""{vocabulary word: similarity} of the words resembling `word`."""
+		if len(word) < MIN_FUZZY_LENGTH:
+			return {}
+		query = trigrams(word)
+		shared = {}
+		for trigram in query:
+			for candidate in self.trigram_index.get(trigram, ()):
+				shared[candidate] = shared.get(candidate, 0) + 1
+		return {
+			candidate: count / len(query)
+			for candidate, count in shared.items()
+			if count / len(query) >= MIN_FUZZY_SIMILARITY
+		}
+
+	def search(self, query, limit=DEFAULT_LIMIT):
+		"""
+		The best `limit` entries for `query`. Every word of the query has to match a
+		word of the stop, as a prefix or, failing that, approximately.
+		"""
+		words = normalize(query)
+		if not words or limit <= 0:
+			return []
+
+		matches, matchers = [], []
+		for word in words:
+			prefixes = (word, ABBREVIATIONS[word]) if word in ABBREVIATIONS else (word,)
+			lists = [self._prefix_matches(prefix) for prefix in prefixes]
+			similar = None
+			if not any(lists):
+				similar = self._similar_words(word)
+				lists = [self.vocabulary[similar_word] for similar_word in similar]
+			if not any(lists):
+				return []
+			matches.append(lists[0] if len(lists) == 1 else sorted(set().union(*lists)))
+			matchers.append((prefixes, similar))
+
+		# Walk the smallest list in index order, keeping the entries every other word matched too
+		matches.sort(key=len)
+		others = [set(other) for other in matches[1:]]
+		candidates = []
+		for index in matches[0]:
+			if all(index in other for other in others):
+				candidates.append(index)
+				if len(candidates) == MAX_RANKED:
+					break
+
+		phrase = ' '.join(words)
+		ranked = heapq.nsmallest(limit, candidates, key=lambda index: self._rank(index, matchers, phrase))
+		return [self.entries[index] for index in ranked]
+
+	def _rank(self, index, matchers, phrase):
+		"""
+		Sort key of a candidate: best score first, then the shorter name. Words found in
+		the name score more than words only found in the description, exact words more
+		than prefixes and prefixes more than approximate matches.
+		"""
+		name_words, name = self.name_words[index]
+		score = 0
+		for prefixes, similar in matchers:
+			if similar is None:
+				if any(prefix in name_words for prefix in prefixes):
+					score += 3
+				elif any(name_word.startswith(prefixes) for name_word in name_words):
+					score += 2
+				else:
+					score += 0.5
+			else:
+				in_name = [similar[name_word] for name_word in name_words if name_word in similar]
+				score += 1 + max(in_name) if in_name else 0.5 * max(similar.values())
+		if name.startswith(phrase):
+			score += 2
+		return (-score, index)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_stop_index():
+	"""
+	Returns the process-wide stop search index, building it on first use and again
+	once the feed version (read through http_cache.feed_version_cache) changes, so an
+	import in another process is picked up along with the ETags it changes.
+	"""
+	global _index
+	version = feed_version_cache.get()
+	index = _index
+	if index is None or index.feed_version != version:
+		with _index_lock:
+			if _index is None or _index.feed_version != version:
+				_index = StopSearchIndex(StopSerializer(Stop.objects.order_by('id'), many=True).data, version)
+			index = _index
+	return index
+
+
+def clear_stop_index():
+	"""Forgets the cached index so the next search rebuilds it (e.g. after an import)."""
+	global _index
+	with _index_lock:
+		_index = None
@@ -2,6 +2,8 @@
 
 from rest_framework import serializers
 
+from .models import Route, Shape, Stop, StopTime, Trip
+
 # Note: We use serializers.Serializer because RouteLeg and Itinerary are not Django models.
 
 class RouteLegSerializer(serializers.Serializer):
@@ -22,6 +24,9 @@ class RouteLegSerializer(serializers.Serializer):
 	# Use a SerializerMethodField to represent the 'duration' property
 	duration_minutes = serializers.SerializerMethodField()
 
+	# [[lat, lon], ...] polyline for drawing the leg on a map
+	path = serializers.ListField(child=serializers.ListField(child=serializers.FloatField()), allow_null=True)
+
 	def get_duration_minutes(self, obj):
 		"""Returns the leg duration in whole minutes."""
 		if not hasattr(obj, 'duration'):
@@ -45,4 +50,40 @@ class ItinerarySerializer(serializers.Serializer):
 		"""Returns the total itinerary duration in whole minutes."""
 		if not hasattr(obj, 'total_duration'):
 			return None
-		return round(obj.total_duration.total_seconds() / 60)
\ No newline at end of file
+		return round(obj.total_duration.total_seconds() / 60)
+
+
+class StopSerializer(serializers.ModelSerializer):
+	"""
+	Serializes a Stop for the /stops/ endpoints (the list and the name search).
+	"""
+	class Meta:
+		model = Stop
+		fields = ['id', 'code', 'name', 'desc', 'latitude', 'longitude']
+
+
+class RouteSerializer(serializers.ModelSerializer):
+	class Meta:
+		model = Route
+		fields = ['id', 'short_name', 'long_name', 'color']
+
+
+class TripSerializer(serializers.ModelSerializer):
+	class Meta:
+		model = Trip
+		fields = ['id', 'route_id', 'trip_headsign', 'direction_id', 'shape_id', 'is_accessible', 'is_bikes']
+
+
+class StopTimeSerializer(serializers.ModelSerializer):
+	class Meta:
+		model = StopTime
+		fields = [
+			'id', 'trip_id', 'stop_sequence', 'arrival_time', 'departure_time', 'stop_id',
+			'pick_up', 'drop_off', 'shape_dist_traveled', 'timepoint',
+		]
+
+
+class ShapeSerializer(serializers.ModelSerializer):
+	class Meta:
+		model = Shape
+		fields = ['id', 'shape_id', 'shape_pt_lat', 'shape_pt_lon', 'shape_pt_sequence', 'shape_dist_traveled']
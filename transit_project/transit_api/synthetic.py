@@ -0,0 +1,146 @@
+"""
+Synthetic GTFS feeds for stress tests.
+
+generate_feed writes routes.csv, stops.csv, trips.csv, stop_times.csv and
+shapes.csv in the route-data layout. Stops sit on a jittered grid at the stop
+density of the Guelph feed, so a bigger network covers a bigger area rather than
+packing more stops into the same streets. Routes are straight corridors across the
+grid, so they cross and offer transfers, and each runs in both directions from
+the start to the end of service, twice as often in the peaks.
+"""
+import csv
+import math
+import os
+import random
+
+# The shipped Guelph feed, which scale factors are relative to
+GUELPH_STOPS = 626
+GUELPH_ROUTES = 34
+CENTER = (43.545, -80.25)
+STOP_SPACING_KM = 0.4
+ROUTE_LENGTH_KM = 12.0
+BUS_SPEED_KPH = 25
+DWELL_SECONDS = 20
+PEAK_HOURS = ((7 * 3600, 9 * 3600), (16 * 3600, 18 * 3600))
+
+ROUTE_COLUMNS = ['route_id', 'agency_id', 'route_short_name', 'route_long_name', 'route_desc', 'route_type', 'route_url', 'route_color', 'route_text_color']
+STOP_COLUMNS = ['stop_id', 'stop_code', 'stop_name', 'stop_desc', 'stop_lat', 'stop_lon']
+TRIP_COLUMNS = ['route_id', 'service_id', 'trip_id', 'trip_headsign', 'trip_short_name', 'direction_id', 'block_id', 'shape_id', 'wheelchair_accessible', 'bikes_allowed']
+STOP_TIME_COLUMNS = ['trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence', 'pickup_type', 'drop_off_type', 'shape_dist_traveled', 'timepoint']
+SHAPE_COLUMNS = ['shape_id', 'shape_pt_lat', 'shape_pt_lon', 'shape_pt_sequence', 'shape_dist_traveled']
+
+
+def gtfs_time(seconds):
+	"""Formats seconds since service-day midnight as GTFS HH:MM:SS (hours may pass 23)."""
+	return f'{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}'
+
+
+def generate_feed(output_dir, stops=GUELPH_STOPS * 10, routes=GUELPH_ROUTES * 10, headway_minutes=15,
+		service_start=6 * 3600, service_end=23 * 3600, seed=0):
+	"""
+	Writes a feed to `output_dir` and returns its row counts. Stop times are streamed
+	to disk, so even 100x feeds are generated in bounded memory.
+	"""
+	rng = random.Random(seed)
+	os.makedirs(output_dir, exist_ok=True)
+	side = max(1, math.ceil(math.sqrt(stops)))
+	lon_km = 111.0 * math.cos(math.radians(CENTER[0]))
+
+	# --- Stops: a jittered grid, cell (row, col) holds stop 1000 + row * side + col ---
+	grid = {}
+	with open(os.path.join(output_dir, 'stops.csv'), 'w', newline='') as f:
+		writer = csv.writer(f)
+		writer.writerow(STOP_COLUMNS)
+		for index in range(stops):
+			row, col = divmod(index, side)
+			x = (col - side / 2 + rng.uniform(-0.25, 0.25)) * STOP_SPACING_KM
+			y = (row - side / 2 + rng.uniform(-0.25, 0.25)) * STOP_SPACING_KM
+			lat, lon = CENTER[0] + y / 111.0, CENTER[1] + x / lon_km
+			stop_id = 1000 + index
+			grid[row, col] = (stop_id, x, y, lat, lon)
+			writer.writerow([stop_id, stop_id, f'Street {col} at Avenue {row}', 'Synthetic stop', f'{lat:.6f}', f'{lon:.6f}'])
+
+	# --- Routes: straight corridors through the grid ---
+	corridors = []
+	for _ in range(routes):
+		for _ in range(20):
+			corridor = _corridor(rng, grid, side)
+			if len(corridor) >= 2:
+				corridors.append(corridor)
+				break
+
+	counts = {'stops': stops, 'routes': len(corridors), 'trips': 0, 'stop_times': 0, 'shape_points': 0}
+	with open(os.path.join(output_dir, 'routes.csv'), 'w', newline='') as routes_file, \
+			open(os.path.join(output_dir, 'trips.csv'), 'w', newline='') as trips_file, \
+			open(os.path.join(output_dir, 'stop_times.csv'), 'w', newline='') as stop_times_file, \
+			open(os.path.join(output_dir, 'shapes.csv'), 'w', newline='') as shapes_file:
+		route_writer, trip_writer = csv.writer(routes_file), csv.writer(trips_file)
+		stop_time_writer, shape_writer = csv.writer(stop_times_file), csv.writer(shapes_file)
+		route_writer.writerow(ROUTE_COLUMNS)
+		trip_writer.writerow(TRIP_COLUMNS)
+		stop_time_writer.writerow(STOP_TIME_COLUMNS)
+		shape_writer.writerow(SHAPE_COLUMNS)
+
+		trip_id = 100000
+		for number, corridor in enumerate(corridors, start=1):
+			route_id = 5000 + number
+			color = f'{rng.randrange(1 << 24):06X}'
+			route_writer.writerow([route_id, 1, number, f'Synthetic Line {number}', '', 3, '', color, 'FFFFFF'])
+			offset = rng.randrange(headway_minutes * 60)
+			for direction, calls in enumerate((corridor, corridor[::-1])):
+				shape_id = route_id * 2 + direction
+				distances, runtimes = _distances_and_runtimes(calls)
+				for sequence, ((_, _, _, lat, lon), distance) in enumerate(zip(calls, distances), start=1):
+					shape_writer.writerow([shape_id, f'{lat:.6f}', f'{lon:.6f}', sequence, f'{distance:.4f}'])
+				counts['shape_points'] += len(calls)
+
+				headsign = f'{number} Synthetic Line {number} {"Outbound" if direction == 0 else "Inbound"}'
+				for start in _departures(service_start + offset, service_end, headway_minutes * 60):
+					trip_id += 1
+					wheelchair, bikes = int(rng.random() < 0.9), int(rng.random() < 0.7)
+					trip_writer.writerow([route_id, 1, trip_id, headsign, '', direction, '', shape_id, wheelchair, bikes])
+					for sequence, ((stop_id, *_), distance, runtime) in enumerate(zip(calls, distances, runtimes), start=1):
+						arrival = start + runtime
+						departure = arrival + (DWELL_SECONDS if 1 < sequence < len(calls) else 0)
+						stop_time_writer.writerow([trip_id, gtfs_time(arrival), gtfs_time(departure), stop_id, sequence, 0, 0, f'{distance:.4f}', 1])
+					counts['trips'] += 1
+					counts['stop_times'] += len(calls)
+	return counts
+
+
+def _corridor(rng, grid, side):
+	"""Stops along a random straight line of up to ROUTE_LENGTH_KM, in visiting order."""
+	length = min(ROUTE_LENGTH_KM, side * STOP_SPACING_KM)
+	angle = rng.uniform(0, math.pi)
+	cx, cy = [(rng.uniform(0, side) - side / 2) * STOP_SPACING_KM for _ in range(2)]
+	dx, dy = math.cos(angle), math.sin(angle)
+	steps = int(length / (STOP_SPACING_KM / 2))
+	calls, seen = [], set()
+	for step in range(steps + 1):
+		along = -length / 2 + step * STOP_SPACING_KM / 2
+		col = round((cx + dx * along) / STOP_SPACING_KM + side / 2)
+		row = round((cy + dy * along) / STOP_SPACING_KM + side / 2)
+		stop = grid.get((row, col))
+		if stop is not None and stop[0] not in seen:
+			seen.add(stop[0])
+			calls.append(stop)
+	return calls
+
+
+def _distances_and_runtimes(calls):
+	"""Cumulative distance (km) and running time (s) from the first call to each call."""
+	distances, runtimes = [0.0], [0]
+	for (_, x1, y1, _, _), (_, x2, y2, _, _) in zip(calls, calls[1:]):
+		km = math.hypot(x2 - x1, y2 - y1)
+		distances.append(distances[-1] + km)
+		runtimes.append(runtimes[-1] + DWELL_SECONDS + math.ceil(km / BUS_SPEED_KPH * 3600))
+	return distances, runtimes
+
+
+def _departures(start, end, headway):
+	"""First-stop departure times: every `headway` seconds, every headway / 2 in the peaks."""
+	t = start
+	while t <= end:
+		yield t
+		in_peak = any(lo <= t < hi for lo, hi in PEAK_HOURS)
+		t += headway // 2 if in_peak else headway
@@ -0,0 +1,73 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from datetime import time
+
+from transit_api.models import *
+
+from transit_api.benchmarks import make_workload, percentile, run_benchmark
+from transit_api.planning.timetable import Timetable, clear_timetable_cache
+
+
+@override_settings(TRANSIT_TIMETABLE_FILE=None, TRANSIT_TRANSFER_PATTERNS_FILE=None)
+class PlannerBenchmarkTestCase(TestCase):
+	"""
+	Runs the benchmark suite on a three-stop route A -> B -> C served all day.
+	"""
+	def setUp(self):
+		Route.objects.create(id=1, short_name='R1', long_name='Northbound', color='FF0000')
+		for stop_id, lat in ((1, 43.500), (2, 43.530), (3, 43.560)):
+			Stop.objects.create(id=stop_id, code=stop_id, name=f'Stop {stop_id}', desc='', latitude=lat, longitude=-80.2)
+		for trip_id, hour in enumerate(range(6, 23), start=100):
+			Trip.objects.create(id=trip_id, route_id=1, trip_headsign='North', shape_id=0)
+			for sequence, (stop_id, minute) in enumerate(((1, 0), (2, 15), (3, 30)), start=1):
+				StopTime.objects.create(
+					trip_id=trip_id, stop_id=stop_id, stop_sequence=sequence,
+					arrival_time=time(hour, minute), departure_time=time(hour, minute), shape_dist_traveled=0
+				)
+		clear_timetable_cache()
+		self.timetable = Timetable.from_db()
+
+	def tearDown(self):
+		clear_timetable_cache()
+
+	def test_workload_is_reproducible(self):
+		queries = make_workload(self.timetable, 8, seed=7)
+		self.assertEqual(queries, make_workload(self.timetable, 8, seed=7))
+		self.assertNotEqual(queries, make_workload(self.timetable, 8, seed=8))
+		self.assertEqual({q['kind'] for q in queries}, {'stop_to_stop', 'random_points'})
+		self.assertEqual({q['period'] for q in queries}, {'peak', 'off_peak'})
+		json.dumps(queries)  # must be serialisable as-is
+
+	def test_percentile_uses_nearest_rank(self):
+		values = list(range(1, 101))
+		self.assertEqual(percentile(values, 0.50), 50)
+		self.assertEqual(percentile(values, 0.99), 99)
+		self.assertEqual(percentile([5], 0.95), 5)
+		self.assertIsNone(percentile([], 0.5))
+
+	def test_run_benchmark_summarises_each_engine(self):
+		queries = make_workload(self.timetable, 4)
+		result = run_benchmark('a_star', queries, self.timetable)
+		self.assertEqual(result['queries'], 4)
+		self.assertGreater(result['answered'], 0)
+		self.assertLessEqual(result['latency_ms']['p50'], result['latency_ms']['p99'])
+		self.assertGreater(result['expansions_per_query'], 0)
+		self.assertGreater(result['peak_memory_kib']['max'], 0)
+
+		result = run_benchmark('profile', queries, self.timetable, measure_memory=False)
+		self.assertIsNone(result['expansions_per_query'])
+		self.assertIsNone(result['peak_memory_kib'])
+
+	def test_command_writes_json(self):
+		with tempfile.TemporaryDirectory() as temp_dir:
+			path = os.path.join(temp_dir, 'bench.json')
+			call_command('bench_planner', queries=4, output=path, no_memory=True, stdout=StringIO())
+			with open(path) as f:
+				report = json.load(f)
+		self.assertEqual(report['feed']['stops'], 3)
+		self.assertEqual(report['workload'], {'seed': 0, 'queries': 4})
+		self.assertEqual(sorted(report['results']), ['a_star', 'profile'])
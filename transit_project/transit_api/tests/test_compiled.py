@@ -0,0 +1,102 @@
+import os
+import tempfile
+from datetime import datetime
+from django.test import TestCase, override_settings
+
+from transit_api.models import FeedInfo
+from transit_api.planning.compiled import (
+	HEADER, SECTION, SECTION_NAMES, TimetableFileError, _sections, load_timetable, read_feed_version, write_timetable
+)
+from transit_api.planning.raptor import RaptorPlanner
+from transit_api.planning.realtime import LiveTimetable
+from transit_api.tests.timetables import build_line_timetable
+from transit_api.planning.timetable import clear_timetable_cache, get_timetable
+
+
+class CompiledTimetableTestCase(TestCase):
+	"""
+	Round-trips the timetable through the binary file format.
+	"""
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.path = os.path.join(self.temp_dir.name, 'timetable.bin')
+		self.timetable = build_line_timetable()
+		write_timetable(self.timetable, self.path)
+		clear_timetable_cache()
+
+	def tearDown(self):
+		clear_timetable_cache()
+		self.temp_dir.cleanup()
+
+	def test_round_trip_preserves_timetable(self):
+		mapped = load_timetable(self.path)
+
+		self.assertEqual(mapped.feed_version, 'v1')
+		self.assertEqual(mapped.stop_ids, self.timetable.stop_ids)
+		self.assertEqual(list(mapped.stop_names), self.timetable.stop_names)
+		self.assertEqual(mapped.stop_coords, self.timetable.stop_coords)
+		self.assertEqual(mapped.route_names, self.timetable.route_names)
+		self.assertEqual(list(mapped.trip_headsigns), self.timetable.trip_headsigns)
+		for original, loaded in zip(self.timetable.patterns, mapped.patterns):
+			self.assertEqual(list(loaded.stops), list(original.stops))
+			self.assertEqual(list(loaded.departures), list(original.departures))
+			self.assertIsInstance(loaded.departures, memoryview)
+			self.assertEqual(loaded.earliest_trip(0, 29000), original.earliest_trip(0, 29000))
+		for stop in range(len(mapped.stop_ids)):
+			self.assertEqual(list(mapped.footpaths[stop]), list(self.timetable.footpaths[stop]))
+
+	def test_lookups_are_built_on_first_use(self):
+		mapped = load_timetable(self.path)
+		self.assertFalse({'stop_index', 'trip_index', 'stop_patterns', 'trip_patterns', 'grid'} & set(vars(mapped)))
+		self.assertEqual(mapped.stop_index, self.timetable.stop_index)
+		self.assertEqual(mapped.trip_patterns, self.timetable.trip_patterns)
+		self.assertEqual([stop for stop, _ in mapped.nearby_stops((43.551, -80.2))], [1, 2])
+		self.assertEqual((mapped.stop_names[-1], mapped.stop_names[1:3]), ('Stop D', ['Stop B', 'Stop C']))
+		live = LiveTimetable(mapped, mapped.patterns)
+		self.assertIs(live.stop_patterns, mapped.stop_patterns)
+
+	def test_planning_on_mapped_timetable(self):
+		start, end = {'latitude': '43.501', 'longitude': '-80.2'}, {'latitude': '43.601', 'longitude': '-80.2'}
+		window = (datetime(2025, 11, 17, 7, 55), datetime(2025, 11, 17, 8, 30))
+		expected = RaptorPlanner(start, end, timetable=self.timetable).profile(*window)
+		actual = RaptorPlanner(start, end, timetable=load_timetable(self.path)).profile(*window)
+		self.assertEqual(actual, expected)
+		self.assertGreaterEqual(len(actual), 1)
+
+	def test_version_mismatch_is_rejected(self):
+		self.assertEqual(read_feed_version(self.path), 'v1')
+		with self.assertRaises(TimetableFileError):
+			load_timetable(self.path, expected_version='v2')
+
+	def test_garbage_file_is_rejected(self):
+		with open(self.path, 'wb') as f:
+			f.write(b'not a timetable')
+		with self.assertRaises(TimetableFileError):
+			load_timetable(self.path)
+
+	def test_damaged_file_is_rejected(self):
+		with open(self.path, 'rb') as f:
+			data = f.read()
+		self.assertEqual([name for name, _ in _sections(self.timetable)], list(SECTION_NAMES))
+		damaged = {
+			'mid-section': data[:len(data) // 2],
+			'mid-table': data[:HEADER.size + SECTION.size * 3 + 5],
+			'missing section': HEADER.pack(*HEADER.unpack_from(data)[:2], len(SECTION_NAMES) - 1, b'v1') + data[HEADER.size:],
+		}
+		for case, content in damaged.items():
+			with self.subTest(case):
+				with open(self.path, 'wb') as f:
+					f.write(content)
+				with self.assertRaises(TimetableFileError):
+					load_timetable(self.path)
+
+	def test_get_timetable_uses_file_only_for_current_feed(self):
+		FeedInfo.objects.create(version='v1')
+		with override_settings(TRANSIT_TIMETABLE_FILE=self.path):
+			self.assertIsInstance(get_timetable().patterns[0].departures, memoryview)
+
+			FeedInfo.objects.update(version='v2')
+			clear_timetable_cache()
+			with self.assertLogs('transit_api.planning.timetable', level='WARNING'):
+				timetable = get_timetable()
+			self.assertEqual(timetable.feed_version, 'v2')
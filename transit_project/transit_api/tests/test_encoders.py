@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+from django.test import TestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+
+from transit_api import encoders
+from transit_api.encoders import encode_itineraries
+from transit_api.management.commands.bench_serialization import sample_itineraries
+from transit_api.planning.itinerary import Itinerary, RouteLeg
+from transit_api.serializers import ItinerarySerializer
+
+
+class ItineraryEncoderTestCase(TestCase):
+	"""
+	The encoder must render byte-for-byte what the DRF serializer path renders.
+	"""
+	def assertMatchesSerializer(self, itineraries):
+		expected = JSONRenderer().render(ItinerarySerializer(itineraries, many=True).data)
+		self.assertEqual(encode_itineraries(itineraries), expected)
+		with mock.patch.object(encoders, 'orjson', None):
+			self.assertEqual(encode_itineraries(itineraries), expected)
+
+	def test_typical_itineraries(self):
+		self.assertMatchesSerializer(sample_itineraries(3))
+
+	def test_empty_results(self):
+		self.assertMatchesSerializer([])
+
+	def test_unusual_times_and_names(self):
+		start = datetime(2025, 11, 17, 23, 59, 30, 250000)
+		aware = datetime(2025, 11, 18, 1, 5, tzinfo=dt_timezone(timedelta(hours=-5)))
+		self.assertMatchesSerializer([
+			Itinerary(legs=[RouteLeg('walk', start, start + timedelta(seconds=89), 'Café "Ünïcode"', 'Line\u2028break\tand\ttabs')]),
+			Itinerary(legs=[RouteLeg('transit', aware, aware + timedelta(minutes=7), 'Stop <A>', 'Stop \\ B', 42, '\U0001F68C Express', 3)]),
+		])
+
+	def test_leg_paths(self):
+		start = datetime(2025, 11, 17, 8, 0)
+		self.assertMatchesSerializer([Itinerary(legs=[
+			RouteLeg('walk', start, start + timedelta(minutes=3), 'A', 'B', path=[(43.5, -80.25), (43.50123, -80.2)]),
+			RouteLeg('transit', start, start + timedelta(minutes=9), 'B', 'C', '7', 'North', 2, path=[(43.1, -80.0), (43.123456, -80.000001), (-0.5, 0.0)]),
+		])])
+
+	@override_settings(USE_TZ=False)
+	def test_without_time_zone_support(self):
+		aware = datetime(2025, 11, 17, 8, 0, tzinfo=dt_timezone(timedelta(hours=2)))
+		self.assertMatchesSerializer(sample_itineraries(1) + [Itinerary(legs=[RouteLeg('walk', aware, aware, 'A', 'B')])])
@@ -0,0 +1,159 @@
+import csv
+import json
+import os
+import tempfile
+from datetime import datetime
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+
+from transit_api.models import FeedInfo, FeedTransfer, Route, Stop, StopTime, Trip
+from transit_api.planning.planner import TransitPlanner
+from transit_api.planning.raptor import RaptorPlanner
+from transit_api.planning.realtime import delay_overlay, refresh_delays, reset_realtime
+from transit_api.planning.timetable import Timetable, clear_timetable_cache, feeds_near, get_timetable
+
+OFFSET = 100_000_000
+
+
+def write_feed(directory, route_name, stops, departures):
+	"""
+	A one-route feed whose ids collide with every other feed written here: stops
+	[(lat, lon)] numbered from 1, and trip 10 calling at them every 10 minutes from
+	`departures` (HH:MM).
+	"""
+	os.makedirs(directory)
+	hour, minute = map(int, departures.split(':'))
+	files = {
+		'routes.csv': [['route_id', 'route_short_name', 'route_long_name', 'route_color'], ['1', route_name, route_name, 'FF0000']],
+		'stops.csv': [['stop_id', 'stop_code', 'stop_name', 'stop_desc', 'stop_lat', 'stop_lon']]
+			+ [[str(i), str(i), f'{route_name} stop {i}', '', str(lat), str(lon)] for i, (lat, lon) in enumerate(stops, 1)],
+		'trips.csv': [['route_id', 'trip_id', 'trip_headsign', 'direction_id', 'shape_id', 'wheelchair_accessible', 'bikes_allowed'], ['1', '10', route_name, '0', '5', '1', '1']],
+		'stop_times.csv': [['trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence', 'pickup_type', 'drop_off_type', 'shape_dist_traveled', 'timepoint']]
+			+ [['10', t, t, str(i), str(i), '0', '0', '', '1'] for i in range(1, len(stops) + 1) for t in [f'{hour + (minute + 10 * (i - 1)) // 60:02}:{(minute + 10 * (i - 1)) % 60:02}:00']],
+		'shapes.csv': [['shape_id', 'shape_pt_lat', 'shape_pt_lon', 'shape_pt_sequence', 'shape_dist_traveled']]
+			+ [['5', str(lat), str(lon), str(i), '0'] for i, (lat, lon) in enumerate(stops, 1)],
+	}
+	for name, rows in files.items():
+		with open(os.path.join(directory, name), 'w', newline='') as f:
+			csv.writer(f).writerows(rows)
+
+
+@override_settings(TRANSIT_TIMETABLE_FILE=None, TRANSIT_TRANSFER_PATTERNS_FILE=None, TRANSIT_REALTIME_FILE='', TRANSIT_REALTIME_SOURCE='')
+class MultiFeedTestCase(TestCase):
+	"""
+	Tests importing several feeds with colliding GTFS ids, and planning over the
+	shards of the feeds around a query.
+	"""
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		# The first feed ends ~55 m from where the second starts; the third is far away
+		self.import_feed('default', 'A1', [(43.500, -80.2), (43.550, -80.2)], '08:00')
+		self.import_feed('grt', 'B1', [(43.5505, -80.2), (43.600, -80.2)], '08:20')
+		self.import_feed('go', 'C1', [(44.000, -79.0), (44.050, -79.0)], '08:00')
+		reset_realtime()
+		clear_timetable_cache()
+
+	def tearDown(self):
+		self.temp_dir.cleanup()
+		clear_timetable_cache()
+
+	def import_feed(self, feed, *args):
+		directory = os.path.join(self.temp_dir.name, feed)
+		if not os.path.exists(directory):
+			write_feed(directory, *args)
+		call_command('import_transit_data', '--feed', feed, '--data-dir', directory, stdout=StringIO())
+
+	def test_ids_are_offset_per_feed(self):
+		self.assertEqual(dict(FeedInfo.objects.values_list('feed', 'id_offset')), {'default': 0, 'grt': OFFSET, 'go': 2 * OFFSET})
+		self.assertEqual(sorted(Stop.objects.filter(feed='grt').values_list('id', flat=True)), [OFFSET + 1, OFFSET + 2])
+		trip = Trip.objects.get(feed='grt')
+		self.assertEqual((trip.id, trip.route_id, trip.shape_id), (OFFSET + 10, OFFSET + 1, OFFSET + 5))
+		self.assertEqual(set(StopTime.objects.filter(feed='grt').values_list('trip_id', flat=True)), {OFFSET + 10})
+
+	def test_reimport_replaces_only_its_feed(self):
+		version = FeedInfo.current_version()
+		self.import_feed('grt')
+		self.assertEqual(Stop.objects.count(), 6)
+		self.assertEqual(Route.objects.filter(feed='grt').get().id, OFFSET + 1)
+		self.assertEqual(FeedInfo.objects.get(feed='grt').id_offset, OFFSET)
+		self.assertEqual(FeedTransfer.objects.count(), 2)
+		self.assertEqual(FeedInfo.current_version(), version)
+
+	def test_failed_reimport_keeps_the_previous_import(self):
+		directory = os.path.join(self.temp_dir.name, 'grt')
+		with open(os.path.join(directory, 'trips.csv'), 'a', newline='') as f:
+			csv.writer(f).writerow(['1', str(OFFSET), 'B1', '0', '5', '1', '1'])
+		with self.assertRaises(CommandError):
+			self.import_feed('grt')
+		self.assertEqual(Trip.objects.get(feed='grt').id, OFFSET + 10)
+		self.assertEqual(Stop.objects.filter(feed='grt').count(), 2)
+		self.assertEqual(FeedTransfer.objects.count(), 2)
+
+	def test_new_feeds_must_fit_in_int32(self):
+		FeedInfo.objects.filter(feed='go').update(id_offset=21 * OFFSET)
+		with self.assertRaises(CommandError):
+			self.import_feed('viarail', 'D1', [(45.000, -75.0), (45.050, -75.0)], '08:00')
+		self.assertFalse(FeedInfo.objects.filter(feed='viarail').exists())
+
+	def test_trip_updates_use_the_ids_of_their_feed(self):
+		path = os.path.join(self.temp_dir.name, 'updates.json')
+		entity = {'id': '1', 'trip_update': {'trip': {'trip_id': '10'}, 'stop_time_update': [
+			{'stop_id': '2', 'arrival': {'delay': 120}, 'departure': {'delay': 120}},
+		]}}
+		with open(path, 'w') as f:
+			json.dump({'entity': [entity]}, f)
+		try:
+			with self.settings(TRANSIT_REALTIME_FILE=path, TRANSIT_REALTIME_FEED='grt'):
+				change = refresh_delays(force=True)
+			self.assertEqual(change.trips, {OFFSET + 10})
+			self.assertEqual(delay_overlay.updates[OFFSET + 10].stops[0].stop_id, OFFSET + 2)
+			planner = RaptorPlanner({'latitude': '43.501', 'longitude': '-80.2'}, {'latitude': '43.601', 'longitude': '-80.2'})
+			itinerary, = planner.profile(datetime(2025, 11, 17, 7, 55), datetime(2025, 11, 17, 8, 5))
+			rides = [leg for leg in itinerary.legs if leg.mode == 'transit']
+			self.assertEqual(rides[1].end_time, datetime(2025, 11, 17, 8, 32))
+		finally:
+			reset_realtime()
+
+	def test_transfers_between_feeds_are_precomputed(self):
+		transfers = set(FeedTransfer.objects.values_list('from_feed', 'from_stop_id', 'to_feed', 'to_stop_id'))
+		self.assertEqual(transfers, {('default', 2, 'grt', OFFSET + 1), ('grt', OFFSET + 1, 'default', 2)})
+
+	def test_queries_pick_the_feeds_near_them(self):
+		self.assertEqual(feeds_near((43.501, -80.2), (43.52, -80.2)), {'default'})
+		self.assertEqual(feeds_near((43.501, -80.2), (43.601, -80.2)), {'default', 'grt'})
+		self.assertIsNone(feeds_near((43.501, -80.2), (44.049, -79.0), (43.601, -80.2)))
+		shard = get_timetable({'default', 'grt'})
+		self.assertIs(get_timetable(frozenset(['grt', 'default'])), shard)
+		self.assertEqual(sorted(shard.stop_ids), [1, 2, OFFSET + 1, OFFSET + 2])
+		self.assertEqual(len(get_timetable({'go'}).stop_ids), 2)
+
+	def test_full_timetable_merges_every_feed(self):
+		timetable = Timetable.from_db()
+		self.assertEqual(len(timetable.stop_ids), 6)
+		self.assertEqual(len(timetable.patterns), 3)
+		self.assertEqual(timetable.feed_version, FeedInfo.current_version())
+		stop = timetable.stop_index[2]
+		self.assertIn(timetable.stop_index[OFFSET + 1], [target for target, _ in timetable.footpaths[stop]])
+
+	def test_plan_crosses_feeds(self):
+		planner = RaptorPlanner({'latitude': '43.501', 'longitude': '-80.2'}, {'latitude': '43.601', 'longitude': '-80.2'})
+		self.assertEqual(len(planner.timetable.stop_ids), 4)
+		itinerary, = planner.profile(datetime(2025, 11, 17, 7, 55), datetime(2025, 11, 17, 8, 5))
+		rides = [leg for leg in itinerary.legs if leg.mode == 'transit']
+		self.assertEqual([(leg.route_short_name, leg.trip_id) for leg in rides], [('A1', 10), ('B1', OFFSET + 10)])
+		self.assertEqual(rides[1].end_time, datetime(2025, 11, 17, 8, 30))
+
+	def test_a_star_stays_within_its_shard(self):
+		shard = get_timetable({'default'})
+		# The origin is next to the first grt stop too, which the shard does not have
+		with self.assertNumQueries(0):
+			planner = TransitPlanner({'latitude': '43.5503', 'longitude': '-80.2'}, {'latitude': '43.4995', 'longitude': '-80.2'}, datetime(2025, 11, 17, 7, 55), timetable=shard)
+			itineraries = planner.find_five_paths()
+		self.assertEqual([stop_id for stop_id, _ in planner.nearby_start_stops], [2])
+		self.assertEqual(itineraries, [])  # A1 only runs the other way
+
+		planner = TransitPlanner({'latitude': '43.4995', 'longitude': '-80.2'}, {'latitude': '43.5503', 'longitude': '-80.2'}, datetime(2025, 11, 17, 7, 55), timetable=shard)
+		rides = [leg for leg in planner.find_five_paths()[0].legs if leg.mode == 'transit']
+		self.assertEqual([(leg.route_short_name, leg.end_location_name) for leg in rides], [('A1', 'A1 stop 2')])
@@ -0,0 +1,89 @@
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from transit_api.http_cache import ResponseCache, clear_http_cache, response_cache
+from transit_api.models import FeedInfo, Route, Stop
+from transit_api.search import clear_stop_index
+
+
+class ResponseCacheTestCase(TestCase):
+	"""
+	Tests the byte bound of the rendered response LRU.
+	"""
+	def test_least_recently_used_bodies_are_dropped(self):
+		cache = ResponseCache()
+		cache.put('a', b'x' * 40, 'application/json', 100)
+		cache.put('b', b'x' * 40, 'application/json', 100)
+		cache.get('a')
+		cache.put('c', b'x' * 40, 'application/json', 100)
+		self.assertIsNone(cache.get('b'))
+		self.assertEqual(cache.get('a'), (b'x' * 40, 'application/json'))
+		self.assertEqual((len(cache), cache.size), (2, 80))
+		cache.put('d', b'x' * 101, 'application/json', 100)  # larger than the whole cache
+		self.assertEqual(len(cache), 2)
+
+
+@override_settings(TRANSIT_HTTP_CACHE_SECONDS=300, TRANSIT_FEED_VERSION_SECONDS=60, TRANSIT_RESPONSE_CACHE_BYTES=1024 * 1024)
+class FeedCachedViewTestCase(TestCase):
+	"""
+	Tests the ETag, conditional GET and response cache of the read-only endpoints.
+	"""
+	def setUp(self):
+		FeedInfo.objects.create(version='a' * 64)
+		Route.objects.create(id=1, short_name='R1', long_name='Northbound', color='FF0000')
+		Stop.objects.create(id=1, code=1, name='Gordon at Edinburgh', desc='', latitude=43.5, longitude=-80.2)
+		clear_http_cache()
+		clear_stop_index()
+		response_cache.reset_metrics()
+		self.client = APIClient()
+
+	def tearDown(self):
+		clear_http_cache()
+		clear_stop_index()
+
+	def test_responses_carry_the_feed_version(self):
+		response = self.client.get('/api/v1/routes/', HTTP_ACCEPT='application/json')
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response['ETag'], '"aaaaaaaaaaaaaaaa-json"')
+		self.assertIn('max-age=300', response['Cache-Control'])
+		self.assertIn('Accept', response['Vary'])
+		self.assertEqual(response.json(), [{'id': 1, 'short_name': 'R1', 'long_name': 'Northbound', 'color': 'FF0000'}])
+
+	def test_if_none_match_is_answered_without_queries(self):
+		etag = self.client.get('/api/v1/stops/1/', HTTP_ACCEPT='application/json')['ETag']
+		with self.assertNumQueries(0):
+			response = self.client.get('/api/v1/stops/1/', HTTP_ACCEPT='application/json', HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 304)
+		self.assertEqual(response['ETag'], etag)
+		self.assertEqual(response_cache.not_modified, 1)
+		self.assertEqual(self.client.get('/api/v1/stops/1/', HTTP_ACCEPT='application/json', HTTP_IF_NONE_MATCH='"stale-json"').status_code, 200)
+
+	def test_rendered_bodies_are_reused_until_the_feed_changes(self):
+		first = self.client.get('/api/v1/stops/', {'b': '2', 'a': '1'}, HTTP_ACCEPT='application/json')
+		with self.assertNumQueries(0):
+			second = self.client.get('/api/v1/stops/', {'a': '1', 'b': '2'}, HTTP_ACCEPT='application/json')
+		self.assertEqual(second.content, first.content)
+		self.assertEqual(response_cache.hits, 1)
+
+		Stop.objects.create(id=2, code=2, name='Stone Road Mall', desc='', latitude=43.52, longitude=-80.22)
+		FeedInfo.objects.update(version='b' * 64)
+		clear_http_cache()
+		third = self.client.get('/api/v1/stops/', HTTP_ACCEPT='application/json')
+		self.assertEqual(len(third.json()), 2)
+		self.assertEqual(self.client.get('/api/v1/stops/', HTTP_ACCEPT='application/json', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+	def test_search_is_cached(self):
+		response = self.client.get('/api/v1/stops/search/', {'q': 'gord'}, HTTP_ACCEPT='application/json')
+		self.assertEqual([stop['id'] for stop in response.json()], [1])
+		self.assertEqual(self.client.get('/api/v1/stops/search/', {'q': 'gord'}, HTTP_IF_NONE_MATCH=response['ETag'], HTTP_ACCEPT='application/json').status_code, 304)
+
+	def test_errors_are_not_cached(self):
+		self.assertEqual(self.client.get('/api/v1/routes/2/', HTTP_ACCEPT='application/json').status_code, 404)
+		self.assertEqual(len(response_cache), 0)
+
+	def test_no_caching_before_an_import(self):
+		FeedInfo.objects.all().delete()
+		clear_http_cache()
+		response = self.client.get('/api/v1/trips/', HTTP_ACCEPT='application/json')
+		self.assertEqual(response.status_code, 200)
+		self.assertNotIn('ETag', response)
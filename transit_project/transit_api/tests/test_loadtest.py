@@ -0,0 +1,165 @@
+import json
+import os
+import socket
+import tempfile
+import threading
+import time as clock
+from datetime import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from urllib.parse import urlsplit
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from transit_api.models import *
+
+from transit_api.loadtest import make_http_workload, run_load
+from transit_api.planning.timetable import Timetable, clear_timetable_cache
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+	"""
+	Answers like the API without doing any work: /plan/ chunked, the other endpoints
+	with a Content-Length, route 2 with a 500, /slow/ late and /close/ by closing
+	the connection after the response.
+	"""
+	protocol_version = 'HTTP/1.1'
+
+	def do_GET(self):
+		self.server.paths.append(self.path)
+		path = urlsplit(self.path).path
+		if path == '/api/v1/slow/':
+			clock.sleep(0.5)
+		status = 500 if path == '/api/v1/routes/2/' else 200
+		body = b'[{"id":1}]'
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		if path == '/api/v1/plan/':
+			self.send_header('Transfer-Encoding', 'chunked')
+			self.end_headers()
+			for chunk in (body[:4], body[4:]):
+				self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+			self.wfile.write(b'0\r\n\r\n')
+			return
+		if path == '/api/v1/close/':
+			self.send_header('Connection', 'close')
+			self.close_connection = True
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, *args):
+		pass
+
+
+class StandInServer(ThreadingHTTPServer):
+	daemon_threads = True
+
+	def handle_error(self, request, client_address):
+		pass  # a client that timed out hung up on /slow/
+
+
+class StandInServerMixin:
+	def setUp(self):
+		super().setUp()
+		self.server = StandInServer(('127.0.0.1', 0), StandInHandler)
+		self.server.paths = []
+		threading.Thread(target=self.server.serve_forever, daemon=True).start()
+		self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+
+	def tearDown(self):
+		self.server.shutdown()
+		self.server.server_close()
+		super().tearDown()
+
+
+class LoadRunnerTestCase(StandInServerMixin, SimpleTestCase):
+	"""
+	Tests the asyncio clients and the per-endpoint summary against a stand-in server.
+	"""
+	def test_summary_per_endpoint(self):
+		requests = (
+			[{'endpoint': 'plan', 'path': '/api/v1/plan/?from_lat=1'}] * 6
+			+ [{'endpoint': 'routes', 'path': '/api/v1/routes/1/'}] * 3
+			+ [{'endpoint': 'routes', 'path': '/api/v1/routes/2/'}]
+			+ [{'endpoint': 'stops', 'path': '/api/v1/close/'}] * 2
+		)
+		summary = run_load(self.url, requests, concurrency=3)
+		self.assertEqual(summary['concurrency'], 3)
+		self.assertEqual(summary['total']['requests'], 12)
+		self.assertEqual(set(summary['endpoints']), {'plan', 'routes', 'stops'})
+		self.assertEqual(summary['endpoints']['plan']['errors'], 0)
+		routes = summary['endpoints']['routes']
+		self.assertEqual((routes['requests'], routes['errors'], routes['error_rate'], routes['error_kinds']), (4, 1, 0.25, {'HTTP 500': 1}))
+		self.assertEqual(summary['endpoints']['stops']['errors'], 0)
+		latency = summary['total']['latency_ms']
+		self.assertLessEqual(latency['p50'], latency['p90'])
+		self.assertLessEqual(latency['p99'], latency['max'])
+		self.assertGreater(summary['total']['throughput_rps'], 0)
+		self.assertEqual(len(self.server.paths), 12)
+		json.dumps(summary)  # must be serialisable as-is
+
+	def test_timeouts_and_refused_connections_are_errors(self):
+		summary = run_load(self.url, [{'endpoint': 'plan', 'path': '/api/v1/slow/'}], concurrency=1, timeout=0.1)
+		self.assertEqual(summary['total']['error_kinds'], {'timeout': 1})
+		with socket.socket() as unused:
+			unused.bind(('127.0.0.1', 0))
+			port = unused.getsockname()[1]
+		summary = run_load(f'http://127.0.0.1:{port}', [{'endpoint': 'stops', 'path': '/api/v1/stops/'}], concurrency=1)
+		self.assertEqual(summary['total']['error_kinds'], {'ConnectionRefusedError': 1})
+
+
+@override_settings(TRANSIT_TIMETABLE_FILE=None, TRANSIT_TRANSFER_PATTERNS_FILE=None)
+class LoadTestCommandTestCase(StandInServerMixin, TestCase):
+	"""
+	Tests the workload mix and load_test against a stand-in server.
+	"""
+	def setUp(self):
+		super().setUp()
+		Route.objects.create(id=1, short_name='R1', long_name='Northbound', color='FF0000')
+		for stop_id, lat in ((1, 43.500), (2, 43.530), (3, 43.560)):
+			Stop.objects.create(id=stop_id, code=stop_id, name=f'Gordon {stop_id}', desc='', latitude=lat, longitude=-80.2)
+		for trip_id, hour in enumerate(range(6, 23), start=100):
+			Trip.objects.create(id=trip_id, route_id=1, trip_headsign='North', shape_id=0)
+			for sequence, (stop_id, minute) in enumerate(((1, 0), (2, 15), (3, 30)), start=1):
+				StopTime.objects.create(
+					trip_id=trip_id, stop_id=stop_id, stop_sequence=sequence,
+					arrival_time=time(hour, minute), departure_time=time(hour, minute), shape_dist_traveled=0
+				)
+		clear_timetable_cache()
+		self.timetable = Timetable.from_db()
+
+	def tearDown(self):
+		clear_timetable_cache()
+		super().tearDown()
+
+	def test_workload_is_reproducible(self):
+		requests = make_http_workload(self.timetable, 200, seed=3)
+		self.assertEqual(requests, make_http_workload(self.timetable, 200, seed=3))
+		counts = {endpoint: sum(r['endpoint'] == endpoint for r in requests) for endpoint in ('plan', 'stops', 'routes')}
+		self.assertTrue(80 < counts['plan'] < 120 and counts['stops'] > 30 and counts['routes'] > 20)
+		plan = next(r['path'] for r in requests if r['endpoint'] == 'plan')
+		self.assertRegex(plan, r'^/api/v1/plan/\?from_lat=.*&depart_before=2025-11-17T')
+		self.assertIn('/api/v1/stops/search/?q=gord', [r['path'] for r in requests])
+		self.assertEqual({r['endpoint'] for r in make_http_workload(self.timetable, 20, mix={'routes': 1})}, {'routes'})
+
+	def test_command_reports_every_level(self):
+		out = StringIO()
+		with tempfile.TemporaryDirectory() as temp_dir:
+			output = os.path.join(temp_dir, 'load.json')
+			call_command(
+				'load_test', '--url', self.url, '--concurrency', '1', '--concurrency', '4', '--requests', '30',
+				'--warmup', '5', '--output', output, stdout=out
+			)
+			with open(output) as f:
+				report = json.load(f)
+		self.assertEqual([level['concurrency'] for level in report['levels']], [1, 4])
+		self.assertEqual([level['total']['requests'] for level in report['levels']], [30, 30])
+		self.assertEqual(len(self.server.paths), 65)
+		self.assertIn('Concurrency 4: 30 requests', out.getvalue())
+		self.assertIn('    plan:', out.getvalue())
+
+	def test_invalid_mix_is_rejected(self):
+		with self.assertRaises(CommandError):
+			call_command('load_test', '--url', self.url, '--mix', 'plan=1,trips=1', stdout=StringIO())
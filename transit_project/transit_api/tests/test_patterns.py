@@ -0,0 +1,112 @@
+import os
+import csv
+import tempfile
+from datetime import datetime
+from django.core.management import call_command
+from django.test import TestCase
+
+from transit_api.models import RoutePattern
+from transit_api.planning.patterns import build_patterns, gtfs_time_seconds
+from transit_api.planning.planner import TransitPlanner
+from transit_api.planning.timetable import Timetable
+
+
+class BuildPatternsTestCase(TestCase):
+	"""
+	Tests for the import-time pattern stage.
+	"""
+	def test_trips_sharing_stops_share_a_pattern(self):
+		trip_stop_times = {
+			1: [(1, 10, 100, 100), (2, 20, 200, 200)],
+			2: [(1, 10, 400, 400), (2, 20, 500, 500)],
+			3: [(1, 10, 50, 50), (2, 30, 150, 150)],
+		}
+		patterns = build_patterns(trip_stop_times, {1: 7, 2: 7, 3: 7})
+
+		self.assertEqual(len(patterns), 2)
+		shared = [p for p in patterns if len(p.trip_ids) == 2][0]
+		self.assertEqual(list(shared.stop_ids), [10, 20])
+		self.assertEqual(list(shared.trip_ids), [1, 2])
+		# Stored stop by stop: all departures from stop 10, then all from stop 20
+		self.assertEqual(list(shared.departures), [100, 400, 200, 500])
+		self.assertEqual(shared.departures.itemsize, 4)
+
+	def test_overtaking_trip_gets_its_own_pattern(self):
+		trip_stop_times = {
+			1: [(1, 10, 100, 100), (2, 20, 900, 900)],  # slow
+			2: [(1, 10, 200, 200), (2, 20, 300, 300)],  # leaves later, arrives first
+		}
+		patterns = build_patterns(trip_stop_times, {1: 7, 2: 7})
+		self.assertEqual(len(patterns), 2)
+		for pattern in patterns:
+			self.assertEqual(list(pattern.stop_ids), [10, 20])
+
+	def test_gtfs_time_past_midnight(self):
+		self.assertEqual(gtfs_time_seconds('25:10:05'), 25 * 3600 + 10 * 60 + 5)
+
+
+class PatternTimetableTestCase(TestCase):
+	"""
+	Imports a small feed and plans on the patterns it produces.
+	"""
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.data_dir = self.temp_dir.name
+		self._write_csv('routes.csv', [
+			['route_id', 'route_short_name', 'route_long_name', 'route_color'],
+			['1', 'R1', 'Northbound', 'FF0000'],
+			['2', 'R2', 'Uptown', '00FF00'],
+		])
+		self._write_csv('stops.csv', [
+			['stop_id', 'stop_code', 'stop_name', 'stop_desc', 'stop_lat', 'stop_lon'],
+			['1', '1', 'Stop A', '', '43.500', '-80.2'],
+			['2', '2', 'Stop B', '', '43.550', '-80.2'],
+			['3', '3', 'Stop C', '', '43.552', '-80.2'],
+			['4', '4', 'Stop D', '', '43.600', '-80.2'],
+		])
+		stop_times = [['trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence', 'pickup_type', 'drop_off_type', 'shape_dist_traveled', 'timepoint']]
+		trips = [['route_id', 'trip_id', 'trip_headsign', 'direction_id', 'shape_id', 'wheelchair_accessible', 'bikes_allowed']]
+		for trip_id, minute in ((100, 0), (101, 10), (102, 20)):
+			trips.append(['1', str(trip_id), 'To B', '0', '1', '1', '0'])
+			stop_times.append([str(trip_id), f'08:{minute:02}:00', f'08:{minute:02}:00', '1', '1', '0', '0', '0', '1'])
+			stop_times.append([str(trip_id), f'08:{minute + 10:02}:00', f'08:{minute + 10:02}:00', '2', '2', '0', '0', '1.5', '1'])
+		for trip_id, minute in ((200, 15), (201, 30)):
+			trips.append(['2', str(trip_id), 'To D', '0', '2', '1', '0'])
+			stop_times.append([str(trip_id), f'08:{minute:02}:00', f'08:{minute:02}:00', '3', '1', '0', '0', '0', '1'])
+			stop_times.append([str(trip_id), f'08:{minute + 10:02}:00', f'08:{minute + 10:02}:00', '4', '2', '0', '0', '1.5', '1'])
+		self._write_csv('stop_times.csv', stop_times)
+		self._write_csv('trips.csv', trips)
+		self._write_csv('shapes.csv', [['shape_id', 'shape_pt_lat', 'shape_pt_lon', 'shape_pt_sequence', 'shape_dist_traveled']])
+
+		call_command('import_transit_data', data_dir=self.data_dir, stdout=open(os.devnull, 'w'))
+
+	def tearDown(self):
+		self.temp_dir.cleanup()
+
+	def _write_csv(self, filename, rows):
+		with open(os.path.join(self.data_dir, filename), 'w', newline='') as f:
+			csv.writer(f).writerows(rows)
+
+	def test_import_writes_patterns(self):
+		self.assertEqual(RoutePattern.objects.count(), 2)
+		timetable = Timetable.from_db()
+		pattern = timetable.patterns[0]
+		self.assertEqual(pattern.trip_count, 3)
+		self.assertEqual(pattern.earliest_trip(0, 8 * 3600 + 5 * 60), 1)
+		self.assertIsNone(pattern.earliest_trip(0, 9 * 3600))
+		self.assertEqual(pattern.latest_trip(1, 8 * 3600 + 25 * 60), 1)
+
+	def test_transit_planner_uses_patterns(self):
+		start_coords = {'latitude': '43.501', 'longitude': '-80.2'}
+		end_coords = {'latitude': '43.601', 'longitude': '-80.2'}
+		planner = TransitPlanner(start_coords, end_coords, datetime(2025, 11, 17, 7, 55), timetable=Timetable.from_db())
+
+		with self.assertNumQueries(0):
+			itineraries = planner.find_five_paths()
+
+		self.assertGreaterEqual(len(itineraries), 1)
+		legs = itineraries[0].legs
+		self.assertEqual([leg.mode for leg in legs], ['walk', 'transit', 'walk', 'transit', 'walk'])
+		self.assertEqual(legs[1].route_short_name, 'R1')
+		self.assertEqual(legs[3].route_short_name, 'R2')
+		self.assertEqual(legs[3].end_location_name, 'Stop D')
@@ -0,0 +1,115 @@
+import json
+import os
+import pstats
+import tempfile
+from datetime import time
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from transit_api.models import *
+from transit_api.planning.realtime import delay_overlay, parse_trip_updates, reset_realtime
+from transit_api.planning.timetable import clear_timetable_cache
+
+
+@override_settings(
+	TRANSIT_TIMETABLE_FILE=None, TRANSIT_TRANSFER_PATTERNS_FILE=None, TRANSIT_REALTIME_FILE='', TRANSIT_REALTIME_SOURCE='',
+	TRANSIT_PROFILE_SAMPLE_RATE=0.0, TRANSIT_PROFILE_TOKEN='secret', TRANSIT_PLAN_CACHE_SIZE=100, TRANSIT_PLAN_CACHE_SECONDS=60,
+)
+class PlanProfilingTestCase(TestCase):
+	"""
+	Tests profiling /plan/ requests and replaying their recordings.
+	"""
+	def setUp(self):
+		FeedInfo.objects.create(version='a' * 64)
+		Route.objects.create(id=1, short_name='R1', long_name='Northbound', color='FF0000')
+		for stop_id, lat in ((1, 43.500), (2, 43.550), (3, 43.600)):
+			Stop.objects.create(id=stop_id, code=stop_id, name=f'Stop {stop_id}', desc='', latitude=lat, longitude=-80.2)
+		for trip_id, minute in ((100, 0), (101, 20)):
+			Trip.objects.create(id=trip_id, route_id=1, trip_headsign='To C', shape_id=0)
+			for sequence in (1, 2, 3):
+				at = time(8, minute + 10 * (sequence - 1))
+				StopTime.objects.create(trip_id=trip_id, stop_id=sequence, stop_sequence=sequence, arrival_time=at, departure_time=at, shape_dist_traveled=0)
+		reset_realtime()
+		clear_timetable_cache()
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.settings_override = override_settings(TRANSIT_PROFILE_DIR=self.temp_dir.name)
+		self.settings_override.enable()
+		self.client = APIClient()
+
+	def tearDown(self):
+		self.settings_override.disable()
+		self.temp_dir.cleanup()
+		reset_realtime()
+		clear_timetable_cache()
+
+	def plan(self, **headers):
+		return self.client.get('/api/v1/plan/', {
+			'from_lat': '43.501', 'from_lon': '-80.2', 'to_lat': '43.601', 'to_lon': '-80.2',
+			'depart_after': '2025-11-17T07:55:00', 'depart_before': '2025-11-17T08:25:00',
+		}, **headers)
+
+	def recording_path(self, response):
+		return os.path.join(self.temp_dir.name, response['X-Transit-Profile-Id'] + '.json')
+
+	def test_only_requested_or_sampled_plans_are_profiled(self):
+		self.assertNotIn('X-Transit-Profile-Id', self.plan())
+		self.assertNotIn('X-Transit-Profile-Id', self.plan(HTTP_X_TRANSIT_PROFILE='guess'))
+		self.assertEqual(os.listdir(self.temp_dir.name), [])
+		with self.settings(TRANSIT_PROFILE_SAMPLE_RATE=1.0):
+			self.assertIn('X-Transit-Profile-Id', self.plan())
+		with self.settings(TRANSIT_PROFILE_TOKEN=''):
+			self.assertNotIn('X-Transit-Profile-Id', self.plan(HTTP_X_TRANSIT_PROFILE=''))
+
+	def test_profiled_request_writes_the_dump_and_its_inputs(self):
+		self.plan()  # cached, which a profiled request does not use
+		response = self.plan(HTTP_X_TRANSIT_PROFILE='secret')
+		self.assertEqual(response.status_code, 200)
+		profile_id = response['X-Transit-Profile-Id']
+		self.assertGreater(pstats.Stats(os.path.join(self.temp_dir.name, profile_id + '.prof')).total_calls, 0)
+		with open(self.recording_path(response)) as f:
+			recording = json.load(f)
+		self.assertEqual(recording['id'], profile_id)
+		self.assertEqual(recording['mode'], 'profile')
+		self.assertEqual(recording['from'], {'latitude': 43.501, 'longitude': -80.2})
+		self.assertEqual(recording['times'], ['2025-11-17T07:55:00', '2025-11-17T08:25:00'])
+		self.assertEqual((recording['required'], recording['feed_version'], recording['realtime']), (0, 'a' * 64, []))
+		self.assertEqual(recording['itineraries'], response.json())
+		self.assertNotIn('cached', recording['stats']['phases_ms'])
+
+	def test_plan_survives_a_failed_recording(self):
+		not_a_directory = os.path.join(self.temp_dir.name, 'file')
+		open(not_a_directory, 'w').close()
+		with self.settings(TRANSIT_PROFILE_DIR=not_a_directory), self.assertLogs('transit_api.profiling', 'ERROR'):
+			response = self.plan(HTTP_X_TRANSIT_PROFILE='secret')
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.json(), self.plan().json())
+		self.assertNotIn('X-Transit-Profile-Id', response)
+
+	def test_replay_uses_the_recorded_delays(self):
+		entity = {'id': '100', 'trip_update': {'trip': {'trip_id': '100'}, 'delay': 300}}
+		delay_overlay.apply(parse_trip_updates({'entity': [entity]}))
+		response = self.plan(HTTP_X_TRANSIT_PROFILE='secret')
+		with open(self.recording_path(response)) as f:
+			self.assertEqual(json.load(f)['realtime'], [{'trip_id': 100, 'cancelled': False, 'delay': 300, 'stops': []}])
+
+		reset_realtime()
+		profile = os.path.join(self.temp_dir.name, 'replay.prof')
+		out = StringIO()
+		call_command('replay_plan', self.recording_path(response), '--repeat', '2', '--profile', profile, stdout=out)
+		self.assertIn('08:03:39 -> 08:26:21  R1', out.getvalue())
+		self.assertIn('Same itineraries as recorded', out.getvalue())
+		self.assertEqual(len(delay_overlay.updates), 1)
+		self.assertTrue(os.path.exists(profile))
+
+	def test_replay_checks_the_feed_version(self):
+		response = self.plan(HTTP_X_TRANSIT_PROFILE='secret')
+		FeedInfo.objects.update(version='b' * 64)
+		clear_timetable_cache()
+		with self.assertRaises(CommandError):
+			call_command('replay_plan', self.recording_path(response), stdout=StringIO())
+		err = StringIO()
+		call_command('replay_plan', self.recording_path(response), '--force', stdout=StringIO(), stderr=err)
+		self.assertIn('Warning', err.getvalue())
@@ -0,0 +1,180 @@
+from django.test import TestCase
+from datetime import datetime, time
+from rest_framework.test import APIClient
+
+from transit_api.models import *
+
+from transit_api.planning.raptor import RaptorPlanner, _Journey, _pareto
+from transit_api.planning.timetable import Timetable, clear_timetable_cache
+from transit_api.tests.timetables import build_timetable
+
+
+class RaptorPlannerTestCase(TestCase):
+	"""
+	Tests for the round-based planner on a small line network:
+	A --R1--> B ~walk~ C --R2--> D, plus a slow direct R3 from A to D.
+	"""
+	def setUp(self):
+		Route.objects.create(id=1, short_name='R1', long_name='Northbound', color='FF0000')
+		Route.objects.create(id=2, short_name='R2', long_name='Uptown', color='00FF00')
+		Route.objects.create(id=3, short_name='R3', long_name='Express', color='0000FF')
+
+		self.stops = {}
+		for stop_id, name, lat in [(1, 'Stop A', 43.500), (2, 'Stop B', 43.550), (3, 'Stop C', 43.552), (4, 'Stop D', 43.600)]:
+			self.stops[name] = Stop.objects.create(id=stop_id, code=stop_id, name=name, desc='', latitude=lat, longitude=-80.2)
+
+		trip_id = 100
+		# R1: A -> B every 10 minutes from 8:00, 10 minutes ride
+		for minute in (0, 10, 20, 30):
+			self._add_trip(trip_id, 1, 'To B', [(1, time(8, minute)), (2, time(8, minute + 10))])
+			trip_id += 1
+		# R2: C -> D every 15 minutes from 8:15, 10 minutes ride
+		for hour, minute in ((8, 15), (8, 30), (8, 45), (9, 0)):
+			self._add_trip(trip_id, 2, 'To D', [(3, time(hour, minute)), (4, time(hour, minute + 10))])
+			trip_id += 1
+		# R3: A -> D directly, but slowly
+		self._add_trip(trip_id, 3, 'Express to D', [(1, time(8, 5)), (4, time(9, 30))])
+
+		self.start_coords = {'latitude': '43.501', 'longitude': '-80.2'}  # Near Stop A
+		self.end_coords = {'latitude': '43.601', 'longitude': '-80.2'}    # Near Stop D
+		clear_timetable_cache()
+
+	def _add_trip(self, trip_id, route_id, headsign, calls):
+		Trip.objects.create(id=trip_id, route_id=route_id, trip_headsign=headsign, shape_id=0)
+		for sequence, (stop_id, at) in enumerate(calls, start=1):
+			StopTime.objects.create(
+				trip_id=trip_id, stop_id=stop_id, stop_sequence=sequence,
+				arrival_time=at, departure_time=at, shape_dist_traveled=0
+			)
+
+	def test_timetable_groups_trips_into_patterns(self):
+		timetable = Timetable.from_db()
+		self.assertEqual(len(timetable.patterns), 3)
+		sizes = sorted(len(pattern.trips) for pattern in timetable.patterns)
+		self.assertEqual(sizes, [1, 4, 4])
+
+	def test_profile_returns_every_optimal_departure(self):
+		planner = RaptorPlanner(self.start_coords, self.end_coords, timetable=Timetable.from_db())
+		itineraries = planner.profile(datetime(2025, 11, 17, 7, 55), datetime(2025, 11, 17, 8, 30))
+
+		transfers = [it for it in itineraries if len(it.legs) == 5]
+		self.assertEqual(
+			[leg.start_time.time() for it in transfers for leg in it.legs if leg.mode == 'transit' and leg.route_short_name == 'R1'],
+			[time(8, 0), time(8, 10), time(8, 30)]
+		)
+		# Leaving at 8:20 is dominated: the 8:30 bus still makes the 8:45 connection
+		self.assertEqual([it.end_time.strftime('%H:%M') for it in transfers], ['08:26', '08:41', '08:56'])
+
+		# The slow direct ride is kept: it is the only option without a transfer
+		direct = [it for it in itineraries if len(it.legs) == 3]
+		self.assertEqual(len(direct), 1)
+		self.assertEqual(direct[0].legs[1].route_short_name, 'R3')
+
+		for itinerary in itineraries:
+			self.assertEqual(itinerary.legs[0].start_location_name, 'Your Location')
+			self.assertEqual(itinerary.legs[-1].end_location_name, 'Your Destination')
+			for leg, following in zip(itinerary.legs, itinerary.legs[1:]):
+				self.assertLessEqual(leg.end_time, following.start_time)
+
+	def test_profile_outside_service_is_empty(self):
+		planner = RaptorPlanner(self.start_coords, self.end_coords, timetable=Timetable.from_db())
+		self.assertEqual(planner.profile(datetime(2025, 11, 17, 12, 0), datetime(2025, 11, 17, 13, 0)), [])
+
+	def test_plan_view_profile_query(self):
+		response = APIClient().get('/api/v1/plan/', {
+			'from_lat': '43.501', 'from_lon': '-80.2', 'to_lat': '43.601', 'to_lon': '-80.2',
+			'depart_after': '2025-11-17T07:55:00', 'depart_before': '2025-11-17T08:30:00',
+		})
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(len(response.json()), 4)
+
+	def test_plan_view_rejects_inverted_window(self):
+		response = APIClient().get('/api/v1/plan/', {
+			'from_lat': '43.501', 'from_lon': '-80.2', 'to_lat': '43.601', 'to_lon': '-80.2',
+			'depart_after': '09:00', 'depart_before': '08:00',
+		})
+		self.assertEqual(response.status_code, 400)
+
+	def test_arrive_by_leaves_as_late_as_possible(self):
+		planner = RaptorPlanner(self.start_coords, self.end_coords, timetable=Timetable.from_db())
+		itineraries = planner.arrive_by(datetime(2025, 11, 17, 8, 45))
+
+		self.assertEqual(len(itineraries), 1)
+		itinerary = itineraries[0]
+		self.assertEqual([leg.mode for leg in itinerary.legs], ['walk', 'transit', 'walk', 'transit', 'walk'])
+		# The 8:30 from C is the last connection that makes it; the 8:10 from A feeds it
+		self.assertEqual(itinerary.legs[1].start_time.time(), time(8, 10))
+		self.assertEqual(itinerary.legs[3].start_time.time(), time(8, 30))
+		self.assertLessEqual(itinerary.end_time, datetime(2025, 11, 17, 8, 45))
+
+	def test_arrive_by_offers_fewer_transfers_when_possible(self):
+		planner = RaptorPlanner(self.start_coords, self.end_coords, timetable=Timetable.from_db())
+		itineraries = planner.arrive_by(datetime(2025, 11, 17, 9, 35))
+
+		routes = [[leg.route_short_name for leg in it.legs if leg.mode == 'transit'] for it in itineraries]
+		self.assertIn(['R3'], routes)
+		self.assertIn(['R1', 'R2'], routes)
+		for itinerary in itineraries:
+			self.assertLessEqual(itinerary.end_time, datetime(2025, 11, 17, 9, 35))
+
+	def test_plan_view_arrive_by(self):
+		response = APIClient().get('/api/v1/plan/', {
+			'from_lat': '43.501', 'from_lon': '-80.2', 'to_lat': '43.601', 'to_lon': '-80.2',
+			'arrive_by': '2025-11-17T08:45:00',
+		})
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(len(response.json()), 1)
+		self.assertEqual(response.json()[0]['legs'][1]['route_short_name'], 'R1')
+
+	def test_plan_view_single_instant_window(self):
+		response = APIClient().get('/api/v1/plan/', {
+			'from_lat': '43.501', 'from_lon': '-80.2', 'to_lat': '43.601', 'to_lon': '-80.2',
+			'depart_after': '2025-11-17T08:08:00', 'depart_before': '2025-11-17T08:08:00',
+		})
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(response.json())
+		self.assertEqual({it['legs'][0]['start_time'] for it in response.json()}, {'2025-11-17T08:08:00Z'})
+
+
+class ParetoTestCase(TestCase):
+	"""_pareto keeps the journeys no other one beats on departure, arrival and vehicles."""
+	def _journey(self, departure, arrival, rides):
+		journey = _Journey.__new__(_Journey)
+		journey.legs, journey.departure, journey.arrival, journey.rides = (), departure, arrival, rides
+		return journey
+
+	def test_dominated_and_duplicate_journeys_are_dropped(self):
+		journeys = [self._journey(*criteria) for criteria in [
+			(100, 200, 1),  # kept
+			(100, 200, 1),  # the same journey again
+			(100, 210, 1),  # later arrival, same departure
+			(90, 200, 2),   # earlier departure, more vehicles
+			(100, 190, 2),  # earlier, but with one more vehicle: kept
+			(110, 220, 1),  # leaves later: kept
+			(110, 230, 3),  # beaten by the one above
+		]]
+		self.assertEqual([j.key for j in _pareto(journeys)], [(100, 190, 2), (100, 200, 1), (110, 220, 1)])
+
+
+class RaptorProfileWindowTestCase(TestCase):
+	"""
+	Tests that profile results leave inside the window when a run reaches the
+	destination through a later trip at another access stop:
+	A --R1 8:00--> D (slow) and E --R2 8:20--> D (fast), A and E both near the origin.
+	"""
+	def setUp(self):
+		stops = [(1, 'Stop A', 43.500, -80.2), (2, 'Stop E', 43.502, -80.2), (3, 'Stop D', 43.600, -80.2)]
+		trips = [(100, 1, 'To D'), (200, 2, 'To D')]
+		patterns = [(1, [1, 3], [100], [28800, 32400]), (2, [2, 3], [200], [30000, 31200])]
+		self.timetable = build_timetable(trips, patterns, stops=stops, routes=[(1, 'R1'), (2, 'R2')])
+		self.planner = RaptorPlanner({'latitude': '43.501', 'longitude': '-80.2'}, {'latitude': '43.601', 'longitude': '-80.2'}, timetable=self.timetable)
+
+	def test_departures_are_clipped_to_the_window(self):
+		itinerary, = self.planner.profile(datetime(2025, 11, 17, 7, 55), datetime(2025, 11, 17, 8, 5))
+		self.assertEqual(itinerary.start_time, datetime(2025, 11, 17, 8, 5))
+		self.assertEqual([leg.route_short_name for leg in itinerary.legs if leg.mode == 'transit'], ['R2'])
+		self.assertLessEqual(itinerary.legs[0].end_time, itinerary.legs[1].start_time)
+
+	def test_single_instant_window(self):
+		itinerary, = self.planner.profile(datetime(2025, 11, 17, 8, 3), datetime(2025, 11, 17, 8, 3))
+		self.assertEqual((itinerary.start_time, itinerary.end_time.strftime('%H:%M')), (datetime(2025, 11, 17, 8, 3), '08:41'))
@@ -0,0 +1,222 @@
+import json
+import os
+import tempfile
+from datetime import datetime, time
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from transit_api.models import *
+
+from transit_api.planning.plan_cache import plan_cache
+from transit_api.planning.planner import TransitPlanner
+from transit_api.planning.raptor import RaptorPlanner
+from transit_api.planning.realtime import (
+	DelayedPattern, DelayOverlay, FileSource, StopUpdate, TripDelay, TripUpdate, parse_trip_updates, reset_realtime,
+)
+from transit_api.planning.timetable import clear_timetable_cache
+from transit_api.tests.timetables import build_timetable
+
+
+def trip_update(trip_id, *stop_delays, delay=None, cancelled=False):
+	"""A FeedMessage entity delaying `trip_id` by (stop_sequence, seconds) pairs."""
+	update = {'trip': {'trip_id': str(trip_id)}, 'stop_time_update': [
+		{'stop_sequence': sequence, 'arrival': {'delay': seconds}, 'departure': {'delay': seconds}}
+		for sequence, seconds in stop_delays
+	]}
+	if delay is not None:
+		update['delay'] = delay
+	if cancelled:
+		update['trip']['schedule_relationship'] = 'CANCELED'
+	return {'id': str(trip_id), 'trip_update': update}
+
+
+def feed(*entities):
+	return {'header': {'gtfs_realtime_version': '2.0'}, 'entity': list(entities)}
+
+
+class StubSource:
+	"""Hands out `feed` once, as a file source does for each new version of its file."""
+	feed = None
+
+	def fetch(self):
+		fetched, StubSource.feed = StubSource.feed, None
+		return fetched
+
+
+class DelayOverlayTestCase(TestCase):
+	"""
+	Tests parsing trip updates and reading the timetable through the delay overlay.
+	"""
+	def setUp(self):
+		# A -> B -> C, leaving A at 8:00, 8:20 and 8:40 and taking 10 minutes per stop
+		self.timetable = build_timetable([(100, 1, 'To C'), (101, 1, 'To C'), (102, 1, 'To C')])
+		self.overlay = DelayOverlay()
+
+	def apply(self, *entities):
+		return self.overlay.apply(parse_trip_updates(feed(*entities)), base=self.timetable)
+
+	def test_parse_accepts_proto_and_json_field_names(self):
+		camel = {'entity': [{'id': '1', 'tripUpdate': {
+			'trip': {'tripId': '100'},
+			'stopTimeUpdate': [{'stopSequence': 2, 'stopId': '2', 'arrival': {'delay': 60}}],
+		}}]}
+		expected = {100: TripUpdate(cancelled=False, delay=None, stops=(StopUpdate(2, 2, 60, 60),))}
+		self.assertEqual(parse_trip_updates(camel), expected)
+		self.assertEqual(parse_trip_updates(feed(trip_update(100, (2, 60)))), {100: TripUpdate(False, None, (StopUpdate(2, None, 60, 60),))})
+		self.assertTrue(parse_trip_updates(feed(trip_update(101, cancelled=True)))[101].cancelled)
+
+	def test_delay_propagates_downstream(self):
+		delay = TripDelay.resolve(TripUpdate(False, None, (StopUpdate(2, None, 120, 180),)), [0, 1, 2], {})
+		self.assertEqual(list(delay.arrivals), [0, 120, 120])
+		self.assertEqual(list(delay.departures), [0, 180, 180])
+		# A stop id is looked up in the trip's stops, and a later update overrides an earlier one
+		update = TripUpdate(False, 60, (StopUpdate(None, 3, 0, 0),))
+		delay = TripDelay.resolve(update, [0, 1, 2], {1: 0, 2: 1, 3: 2})
+		self.assertEqual(list(delay.arrivals), [60, 60, 0])
+		self.assertIsNone(TripDelay.resolve(TripUpdate(False, 0, ()), [0, 1, 2], {}))
+
+	def test_overlay_shares_the_timetable(self):
+		change = self.apply(trip_update(100, (1, 300)))
+		self.assertEqual(change.trips, {100})
+		self.assertFalse(change.earlier)
+		live = self.overlay.timetable(base=self.timetable)
+		pattern = live.patterns[0]
+		self.assertIsInstance(pattern, DelayedPattern)
+		self.assertIs(pattern.base, self.timetable.patterns[0])
+		self.assertIs(live.stop_patterns, self.timetable.stop_patterns)
+		self.assertEqual(pattern.departure(0, 0), 28800 + 300)
+		self.assertEqual(pattern.arrival(0, 2), 28800 + 1200 + 300)
+		self.assertEqual(pattern.arrival(1, 2), 28800 + 2400)
+		# The static timetable is untouched
+		self.assertEqual(self.timetable.patterns[0].departure(0, 0), 28800)
+
+	def test_next_trip_lookups_follow_delays(self):
+		# 8:00 runs 25 minutes late and so leaves after 8:20; 8:40 is cancelled
+		self.apply(trip_update(100, (1, 1500)), trip_update(102, cancelled=True))
+		pattern = self.overlay.timetable(base=self.timetable).patterns[0]
+		self.assertEqual(pattern.earliest_trip(0, 28800), 1)
+		self.assertEqual(pattern.earliest_trip(0, 28800 + 1201), 0)
+		self.assertIsNone(pattern.earliest_trip(0, 28800 + 1501))
+		self.assertEqual(pattern.latest_trip(2, 28800 + 3600), 0)  # 8:45 at C
+		self.assertEqual(pattern.latest_trip(2, 28800 + 2699), 1)
+		self.assertEqual(pattern.cancelled, {2})
+
+	def test_updates_apply_incrementally(self):
+		self.apply(trip_update(100, (1, 300)))
+		first = self.overlay.timetable(base=self.timetable)
+		self.assertEqual(self.apply(trip_update(100, (1, 300))).trips, set())
+		change = self.apply(trip_update(100, (1, 120)), trip_update(101, (2, 60)))
+		self.assertEqual(change.trips, {100, 101})
+		self.assertTrue(change.earlier)  # 100 now leaves earlier than under the old update
+		second = self.overlay.timetable(base=self.timetable)
+		self.assertIsNot(second, first)
+		self.assertEqual(first.patterns[0].departure(0, 0), 28800 + 300)  # in-flight searches keep their view
+		self.assertEqual(second.patterns[0].departure(0, 0), 28800 + 120)
+		# Dropping every update gives back the static timetable
+		self.overlay.apply({}, base=self.timetable)
+		self.assertIs(self.overlay.timetable(base=self.timetable), self.timetable)
+		self.assertEqual(self.overlay.delayed_trips(), (0, 0))
+
+	def test_differential_feed_merges(self):
+		self.apply(trip_update(100, (1, 300)))
+		self.overlay.apply(parse_trip_updates(feed(trip_update(101, (1, 60)))), replace=False, base=self.timetable)
+		self.assertEqual(set(self.overlay.updates), {100, 101})
+		self.assertEqual(self.overlay.delayed_trips(), (2, 0))
+
+	def test_planner_rides_the_delayed_trip(self):
+		self.apply(trip_update(100, (1, 300)))
+		planner = RaptorPlanner({'latitude': '43.501', 'longitude': '-80.2'}, {'latitude': '43.601', 'longitude': '-80.2'}, timetable=self.overlay.timetable(base=self.timetable))
+		itinerary, = planner.profile(datetime(2025, 11, 17, 7, 55), datetime(2025, 11, 17, 8, 10))
+		ride = itinerary.legs[1]
+		self.assertEqual((ride.start_time.time(), ride.end_time.time()), (time(8, 5), time(8, 25)))
+		self.assertEqual(ride.trip_id, 100)
+
+	def test_overtaken_trips_are_not_skipped(self):
+		# 8:00 runs 25 minutes late, so 8:20 overtakes it
+		self.apply(trip_update(100, (1, 1500)))
+		live = self.overlay.timetable(base=self.timetable)
+		self.assertEqual(list(live.patterns[0].departures_from(0, 28800)), [1, 0, 2])
+		self.assertEqual(list(self.timetable.patterns[0].departures_from(0, 28800 + 1)), [1, 2])
+
+		start, end = {'latitude': '43.501', 'longitude': '-80.2'}, {'latitude': '43.601', 'longitude': '-80.2'}
+		itineraries = RaptorPlanner(start, end, timetable=live).profile(datetime(2025, 11, 17, 8, 0), datetime(2025, 11, 17, 8, 30))
+		self.assertEqual([(it.legs[1].trip_id, it.legs[1].start_time.time()) for it in itineraries], [(101, time(8, 20)), (100, time(8, 25))])
+		departures = TransitPlanner(start, end, datetime(2025, 11, 17, 8, 0), timetable=live)._get_departures(1, datetime(2025, 11, 17, 8, 0))
+		self.assertEqual([(call.trip_id, call.departure_time) for call in departures], [(101, time(8, 20)), (100, time(8, 25)), (102, time(8, 40))])
+
+	def test_file_source_reads_changed_files_only(self):
+		with tempfile.TemporaryDirectory() as temp_dir:
+			path = os.path.join(temp_dir, 'trip_updates.json')
+			with open(path, 'w') as f:
+				json.dump(feed(trip_update(100, (1, 60))), f)
+			source = FileSource(path)
+			self.assertEqual(list(parse_trip_updates(source.fetch())), [100])
+			self.assertIsNone(source.fetch())
+			self.assertIsNone(FileSource(os.path.join(temp_dir, 'missing.json')).fetch())
+
+
+@override_settings(
+	TRANSIT_TIMETABLE_FILE=None, TRANSIT_TRANSFER_PATTERNS_FILE=None, TRANSIT_REALTIME_FILE='',
+	TRANSIT_REALTIME_SOURCE='transit_api.tests.test_realtime.StubSource', TRANSIT_REALTIME_POLL_SECONDS=0,
+	TRANSIT_PLAN_CACHE_SIZE=100, TRANSIT_PLAN_CACHE_SECONDS=60,
+)
+class RealtimePlanTestCase(TestCase):
+	"""
+	Tests /plan/ with delays from a stub source, and the invalidation of cached plans.
+	"""
+	def setUp(self):
+		Route.objects.create(id=1, short_name='R1', long_name='Northbound', color='FF0000')
+		for stop_id, lat in ((1, 43.500), (2, 43.550), (3, 43.600)):
+			Stop.objects.create(id=stop_id, code=stop_id, name=f'Stop {stop_id}', desc='', latitude=lat, longitude=-80.2)
+		for trip_id, minute in ((100, 0), (101, 20), (102, 40)):
+			Trip.objects.create(id=trip_id, route_id=1, trip_headsign='To C', shape_id=0)
+			for sequence in (1, 2, 3):
+				at = time(8 + (minute + 10 * (sequence - 1)) // 60, (minute + 10 * (sequence - 1)) % 60)
+				StopTime.objects.create(trip_id=trip_id, stop_id=sequence, stop_sequence=sequence, arrival_time=at, departure_time=at, shape_dist_traveled=0)
+		StubSource.feed = None
+		reset_realtime()
+		clear_timetable_cache()
+		plan_cache.reset_metrics()
+		self.client = APIClient()
+
+	def tearDown(self):
+		StubSource.feed = None
+		reset_realtime()
+		clear_timetable_cache()
+
+	def plan(self, depart_after, depart_before):
+		response = self.client.get('/api/v1/plan/', {
+			'from_lat': '43.501', 'from_lon': '-80.2', 'to_lat': '43.601', 'to_lon': '-80.2',
+			'depart_after': depart_after, 'depart_before': depart_before,
+		})
+		self.assertEqual(response.status_code, 200)
+		return [(leg['start_time'][11:16], leg['end_time'][11:16]) for leg in response.json()[0]['legs'] if leg['mode'] == 'transit']
+
+	def test_plans_use_current_delays(self):
+		StubSource.feed = feed(trip_update(100, (2, 240)))
+		self.assertEqual(self.plan('07:55', '08:05'), [('08:00', '08:24')])
+		self.assertIn('transit_realtime_trips{state="delayed"} 1', self.client.get('/api/v1/metrics/').content.decode())
+
+	def test_update_drops_every_plan(self):
+		self.assertEqual(self.plan('07:55', '08:05'), [('08:00', '08:20')])  # rides 100
+		self.assertEqual(self.plan('08:35', '08:45'), [('08:40', '09:00')])  # rides 102
+		self.assertEqual(self.plan('07:55', '08:05'), [('08:00', '08:20')])
+		self.assertEqual((plan_cache.hits, len(plan_cache)), (1, 2))
+
+		StubSource.feed = feed(trip_update(100, (3, 300)))
+		self.assertEqual(self.plan('07:55', '08:05'), [('08:00', '08:25')])
+		self.assertEqual((plan_cache.hits, plan_cache.invalidated), (1, 2))
+
+	def test_delay_creates_a_faster_connection(self):
+		# 101 is the only departure in the window, until 100 is delayed into it
+		self.assertEqual(self.plan('08:05', '08:25'), [('08:20', '08:40')])
+		StubSource.feed = feed(trip_update(100, delay=600))
+		self.assertEqual(self.plan('08:05', '08:25'), [('08:10', '08:30')])
+
+	def test_earlier_trips_drop_every_plan(self):
+		StubSource.feed = feed(trip_update(100, (1, 300)))
+		self.plan('07:55', '08:10')
+		self.plan('08:35', '08:45')
+		StubSource.feed = feed()  # 100 back on time
+		self.assertEqual(self.plan('07:55', '08:10'), [('08:00', '08:20')])
+		self.assertEqual(plan_cache.invalidated, 2)
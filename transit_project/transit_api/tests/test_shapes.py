@@ -0,0 +1,127 @@
+import os
+import tempfile
+from datetime import datetime
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from transit_api.models import ShapeGeometry, Trip
+from transit_api.planning.compiled import load_timetable, write_timetable
+from transit_api.planning.raptor import RaptorPlanner
+from transit_api.planning.shapes import build_shapes
+from transit_api.planning.timetable import Timetable, clear_timetable_cache
+from transit_api.synthetic import generate_feed
+from transit_api.tests.timetables import build_timetable
+
+
+# A straight shape running north along -80.2 with a point every ~110 m
+SHAPE_POINTS = {7: [(i + 1, 43.500 + i * 0.001, -80.2, i * 0.111) for i in range(11)]}
+STOP_COORDS = {1: (43.500, -80.2), 2: (43.5051, -80.2), 3: (43.510, -80.2)}
+SHAPE_STOPS = [(stop_id, f'Stop {stop_id}', lat, lon) for stop_id, (lat, lon) in STOP_COORDS.items()]
+
+
+def build_shaped_timetable():
+	"""A -> B -> C on one trip that follows shape 7."""
+	shapes = build_shapes(SHAPE_POINTS, {100: [(1, 1, 0), (2, 2, 0.555), (3, 3, 1.11)]}, {100: 7}, STOP_COORDS)
+	return build_timetable([(100, 1, 'North', 7)], [(1, [1, 2, 3], [100], [28800, 29100, 29400])], stops=SHAPE_STOPS, shapes=shapes)
+
+
+class ShapeIndexTestCase(TestCase):
+	"""
+	Tests the import-time (shape, stop) -> point index and slicing legs out of it.
+	"""
+	def tearDown(self):
+		clear_timetable_cache()
+
+	def test_stops_snap_by_shape_distance(self):
+		shape, = build_shapes(SHAPE_POINTS, {100: [(1, 1, 0), (2, 2, 0.555), (3, 3, 1.11)]}, {100: 7}, STOP_COORDS)
+		self.assertEqual(list(shape.stop_ids), [1, 2, 3])
+		self.assertEqual(list(shape.stop_points), [0, 5, 10])
+		self.assertEqual(len(shape.points), 22)
+
+	def test_stops_snap_to_nearest_point_without_distances(self):
+		shape, = build_shapes(SHAPE_POINTS, {100: [(1, 1, 0), (2, 2, 0), (3, 3, 0)]}, {100: 7}, STOP_COORDS)
+		self.assertEqual(list(shape.stop_points), [0, 5, 10])
+
+	def test_loop_shape_keeps_both_visits(self):
+		# Out and back over the same points: stop 1 is on the first and the last point
+		points = SHAPE_POINTS[7] + [(12 + i, 43.509 - i * 0.001, -80.2, 1.221 + i * 0.111) for i in range(10)]
+		shape, = build_shapes({7: points}, {100: [(1, 1, 0), (2, 3, 1.11), (3, 1, 2.22)]}, {100: 7}, STOP_COORDS)
+		self.assertEqual(list(zip(shape.stop_ids, shape.stop_points)), [(1, 0), (3, 10), (1, 20)])
+
+	def test_leg_path_is_a_slice_of_the_shape(self):
+		timetable = build_shaped_timetable()
+		a, b, c = (timetable.stop_index[stop_id] for stop_id in (1, 2, 3))
+		path = timetable.leg_path(0, a, b)
+		self.assertEqual(path, [(43.500 + i * 0.001, -80.2) for i in range(6)])
+		self.assertEqual(len(timetable.leg_path(0, b, c)), 6)
+
+	def test_leg_path_without_shape_joins_the_stops(self):
+		timetable = build_timetable([(100, 1, 'North')], [(1, [1, 2, 3], [100], [0, 1, 2])], stops=SHAPE_STOPS)
+		self.assertEqual(timetable.leg_path(0, 0, 2), [STOP_COORDS[1], STOP_COORDS[2], STOP_COORDS[3]])
+
+	def test_itineraries_carry_paths(self):
+		timetable = build_shaped_timetable()
+		planner = RaptorPlanner({'latitude': '43.4995', 'longitude': '-80.2'}, {'latitude': '43.5105', 'longitude': '-80.2'}, timetable=timetable)
+		itinerary, = planner.profile(datetime(2025, 11, 17, 7, 55), datetime(2025, 11, 17, 8, 0))
+		walk, ride, egress = itinerary.legs
+		self.assertEqual(walk.path, [(43.4995, -80.2), (43.5, -80.2)])
+		self.assertEqual(len(ride.path), 11)
+		self.assertEqual(egress.path[-1], (43.5105, -80.2))
+
+	def test_compiled_file_keeps_geometry(self):
+		timetable = build_shaped_timetable()
+		with tempfile.TemporaryDirectory() as temp_dir:
+			path = os.path.join(temp_dir, 'timetable.bin')
+			write_timetable(timetable, path)
+			mapped = load_timetable(path)
+			self.assertEqual(mapped.leg_path(0, 0, 2), timetable.leg_path(0, 0, 2))
+
+
+@override_settings(TRANSIT_TIMETABLE_FILE=None, TRANSIT_TRANSFER_PATTERNS_FILE=None)
+class ImportedGeometryTestCase(TestCase):
+	"""
+	Imports a synthetic feed and checks that /plan/ returns the shapes' geometry.
+	"""
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		generate_feed(self.temp_dir.name, stops=60, routes=4, headway_minutes=60, service_start=6 * 3600, service_end=9 * 3600, seed=3)
+		call_command('import_transit_data', data_dir=self.temp_dir.name, stdout=open(os.devnull, 'w'))
+		clear_timetable_cache()
+
+	def tearDown(self):
+		self.temp_dir.cleanup()
+		clear_timetable_cache()
+
+	def test_every_shape_is_indexed(self):
+		self.assertEqual(ShapeGeometry.objects.count(), Trip.objects.values('shape_id').distinct().count())
+		timetable = Timetable.from_db()
+		# Synthetic shapes have one point per stop, so every leg is exactly its stops
+		for pattern in timetable.patterns:
+			trip = pattern.trips[0]
+			expected = [timetable.stop_coords[stop] for stop in pattern.stops]
+			path = timetable.leg_path(trip, pattern.stops[0], pattern.stops[-1])
+			self.assertEqual([(round(lat, 5), round(lon, 5)) for lat, lon in path], [(round(lat, 5), round(lon, 5)) for lat, lon in expected])
+
+	def test_fallback_rebuilds_geometry_from_shape_rows(self):
+		expected = Timetable.from_db()
+		ShapeGeometry.objects.all().delete()
+		rebuilt = Timetable.from_db()
+		pattern = expected.patterns[0]
+		args = (pattern.trips[0], pattern.stops[0], pattern.stops[-1])
+		self.assertEqual(len(rebuilt.leg_path(*args)), len(expected.leg_path(*args)))
+
+	def test_plan_response_includes_leg_paths(self):
+		timetable = Timetable.from_db()
+		pattern = timetable.patterns[0]
+		(from_lat, from_lon), (to_lat, to_lon) = timetable.stop_coords[pattern.stops[0]], timetable.stop_coords[pattern.stops[-1]]
+		response = APIClient().get('/api/v1/plan/', {
+			'from_lat': from_lat, 'from_lon': from_lon, 'to_lat': to_lat, 'to_lon': to_lon,
+			'depart_after': '06:00', 'depart_before': '08:00',
+		})
+		self.assertEqual(response.status_code, 200)
+		itineraries = response.json()
+		self.assertGreaterEqual(len(itineraries), 1)
+		for leg in itineraries[0]['legs']:
+			self.assertGreaterEqual(len(leg['path']), 2)
+			self.assertEqual(len(leg['path'][0]), 2)
@@ -0,0 +1,104 @@
+import threading
+import time
+from django.test import SimpleTestCase
+
+from transit_api.planning.singleflight import SingleFlight
+
+
+class SingleFlightTestCase(SimpleTestCase):
+	"""
+	Tests request coalescing with real threads.
+	"""
+	def setUp(self):
+		self.flights = SingleFlight()
+		self.release = threading.Event()
+		self.calls = 0
+
+	def _slow(self, value=None, error=None):
+		def compute():
+			self.calls += 1
+			self.release.wait(5)
+			if error is not None:
+				raise error
+			return value
+		return compute
+
+	def _start_followers(self, count, key, compute, timeout=5):
+		"""Starts `count` threads calling do(key) after a leader is already in flight."""
+		outcomes = []
+		def follow():
+			try:
+				outcomes.append(self.flights.do(key, compute, timeout=timeout))
+			except Exception as e:
+				outcomes.append(e)
+		threads = [threading.Thread(target=follow) for _ in range(count)]
+		for thread in threads:
+			thread.start()
+		time.sleep(0.1)  # let every follower reach the wait
+		return threads, outcomes
+
+	def _lead(self, key, compute):
+		outcome = []
+		def lead():
+			try:
+				outcome.append(self.flights.do(key, compute))
+			except Exception as e:
+				outcome.append(e)
+		leader = threading.Thread(target=lead)
+		leader.start()
+		while self.flights.in_flight() == 0:
+			time.sleep(0.001)
+		return leader, outcome
+
+	def test_identical_requests_share_one_computation(self):
+		compute = self._slow(value=['itinerary'])
+		leader, led = self._lead('key', compute)
+		threads, outcomes = self._start_followers(4, 'key', compute)
+		self.release.set()
+		for thread in threads + [leader]:
+			thread.join()
+
+		self.assertEqual(self.calls, 1)
+		self.assertEqual(led, [(['itinerary'], False)])
+		self.assertEqual(outcomes, [(['itinerary'], True)] * 4)
+		self.assertEqual((self.flights.leaders, self.flights.collapsed), (1, 4))
+		self.assertEqual(self.flights.in_flight(), 0)
+
+	def test_errors_reach_every_waiter(self):
+		compute = self._slow(error=ValueError('no service'))
+		leader, led = self._lead('key', compute)
+		threads, outcomes = self._start_followers(2, 'key', compute)
+		self.release.set()
+		for thread in threads + [leader]:
+			thread.join()
+
+		self.assertEqual(self.calls, 1)
+		for outcome in led + outcomes:
+			self.assertIsInstance(outcome, ValueError)
+		self.assertEqual(self.flights.errors, 1)
+
+		# The failed call is forgotten, so the next request computes again
+		self.assertEqual(self.flights.do('key', lambda: 'recovered'), ('recovered', False))
+
+	def test_waiting_is_bounded(self):
+		leader, _ = self._lead('key', self._slow(value='slow'))
+		threads, outcomes = self._start_followers(1, 'key', lambda: 'own', timeout=0.01)
+		threads[0].join()
+		self.assertEqual(outcomes, [('own', False)])
+		self.assertEqual(self.flights.timeouts, 1)
+		self.release.set()
+		leader.join()
+
+	def test_different_keys_do_not_wait(self):
+		leader, _ = self._lead('a', self._slow(value='a'))
+		self.assertEqual(self.flights.do('b', lambda: 'b'), ('b', False))
+		self.release.set()
+		leader.join()
+		self.assertEqual(self.flights.collapsed, 0)
+
+	def test_metrics_render(self):
+		self.flights.do('key', lambda: None)
+		text = self.flights.render('transit_plan_coalescing')
+		self.assertIn('transit_plan_coalescing_leaders_total 1', text)
+		self.assertIn('transit_plan_coalescing_collapsed_total 0', text)
+		self.assertIn('# TYPE transit_plan_coalescing_in_flight gauge', text)
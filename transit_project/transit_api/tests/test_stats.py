@@ -0,0 +1,98 @@
+from django.test import TestCase, override_settings
+from datetime import datetime, time
+from rest_framework.test import APIClient
+
+from transit_api.models import *
+
+from transit_api.planning.planner import TransitPlanner
+from transit_api.planning.stats import PlannerStats, plan_metrics, render_counters
+from transit_api.planning.timetable import clear_timetable_cache
+
+
+@override_settings(TRANSIT_TIMETABLE_FILE=None, TRANSIT_TRANSFER_PATTERNS_FILE=None)
+class PlannerStatsTestCase(TestCase):
+	"""
+	Tests the planner instrumentation and how /plan/ and /metrics/ expose it,
+	on a single route A -> B.
+	"""
+	def setUp(self):
+		Route.objects.create(id=1, short_name='R1', long_name='Northbound', color='FF0000')
+		Stop.objects.create(id=1, code=1, name='Stop A', desc='', latitude=43.500, longitude=-80.2)
+		Stop.objects.create(id=2, code=2, name='Stop B', desc='', latitude=43.550, longitude=-80.2)
+		for trip_id, minute in ((100, 0), (101, 20)):
+			Trip.objects.create(id=trip_id, route_id=1, trip_headsign='To B', shape_id=0)
+			StopTime.objects.create(trip_id=trip_id, stop_id=1, stop_sequence=1, arrival_time=time(8, minute), departure_time=time(8, minute), shape_dist_traveled=0)
+			StopTime.objects.create(trip_id=trip_id, stop_id=2, stop_sequence=2, arrival_time=time(8, minute + 10), departure_time=time(8, minute + 10), shape_dist_traveled=0)
+
+		self.start_coords = {'latitude': '43.501', 'longitude': '-80.2'}
+		self.end_coords = {'latitude': '43.551', 'longitude': '-80.2'}
+		self.query = {'from_lat': '43.501', 'from_lon': '-80.2', 'to_lat': '43.551', 'to_lon': '-80.2'}
+		clear_timetable_cache()
+		plan_metrics.reset()
+
+	def tearDown(self):
+		clear_timetable_cache()
+
+	def test_planner_counts_search_work(self):
+		planner = TransitPlanner(self.start_coords, self.end_coords, datetime(2025, 11, 17, 7, 55))
+		paths = planner.find_five_paths()
+		stats = planner.stats
+
+		self.assertGreaterEqual(len(paths), 1)
+		self.assertEqual(len(stats.iterations), min(len(paths) + 1, 5))
+		self.assertGreater(stats.nodes_popped, 0)
+		self.assertGreaterEqual(stats.nodes_pushed, stats.nodes_popped)
+		self.assertGreater(stats.heap_peak, 0)
+		self.assertEqual(stats.nodes_popped, sum(it['nodes_popped'] for it in stats.iterations))
+		self.assertEqual(list(stats.phases), ['timetable', 'nearby_stops', 'search', 'reconstruct'])
+		self.assertGreater(stats.db_queries, 0)  # the timetable load
+
+		# Once the timetable is cached nothing is queried
+		planner = TransitPlanner(self.start_coords, self.end_coords, datetime(2025, 11, 17, 7, 55))
+		planner.find_five_paths()
+		self.assertEqual(planner.stats.db_queries, 0)
+
+	def test_stats_render_server_timing(self):
+		stats = PlannerStats()
+		with stats.phase('search'):
+			pass
+		stats.db_queries, stats.db_seconds = 2, 0.0015
+		self.assertRegex(stats.server_timing(), r'^search;dur=\d+\.\d{3}, db;dur=1\.500;desc="2 queries"$')
+
+	def test_render_counters(self):
+		text = render_counters('transit_x', [('hits_total', 'Hits.', 3), ('by_kind', 'By kind.', {'kind="a"': 0.5, 'kind="b"': 2})], 'gauge')
+		self.assertEqual(text.splitlines(), [
+			'# HELP transit_x_hits_total Hits.', '# TYPE transit_x_hits_total gauge', 'transit_x_hits_total 3',
+			'# HELP transit_x_by_kind By kind.', '# TYPE transit_x_by_kind gauge',
+			'transit_x_by_kind{kind="a"} 0.500000', 'transit_x_by_kind{kind="b"} 2',
+		])
+		self.assertEqual(render_counters('transit_x', []), '')
+
+	def test_plan_view_reports_stats(self):
+		client = APIClient()
+		response = client.get('/api/v1/plan/', self.query)
+		self.assertEqual(response.status_code, 200)
+		self.assertIsInstance(response.json(), list)
+		self.assertIn('search;dur=', response['Server-Timing'])
+		self.assertIn('encode;dur=', response['Server-Timing'])
+
+		response = client.get('/api/v1/plan/', dict(self.query, debug='stats'))
+		body = response.json()
+		self.assertIsInstance(body['itineraries'], list)
+		self.assertIn('nodes_popped', body['stats'])
+		self.assertIn('db_queries', body['stats'])
+
+	def test_metrics_endpoint_aggregates_requests(self):
+		client = APIClient()
+		client.get('/api/v1/plan/', self.query)
+		client.get('/api/v1/plan/', dict(self.query, arrive_by='08:30'))
+
+		response = client.get('/api/v1/metrics/')
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+		text = response.content.decode()
+		self.assertIn('transit_plan_requests_total{planner="a_star"} 1', text)
+		self.assertIn('transit_plan_requests_total{planner="arrive_by"} 1', text)
+		self.assertIn('transit_plan_duration_seconds_count 2', text)
+		self.assertIn('# TYPE transit_plan_nodes_popped_total counter', text)
+		self.assertIn('transit_plan_coalescing_collapsed_total', text)
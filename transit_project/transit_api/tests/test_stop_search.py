@@ -0,0 +1,100 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from transit_api.http_cache import feed_version_cache
+from transit_api.models import FeedInfo, Stop
+from transit_api.search import MAX_LIMIT, StopSearchIndex, clear_stop_index, normalize
+
+
+STOPS = [
+	(1, 'Gordon at Edinburgh northbound', 'Gordon Street'),
+	(2, 'Gordon at Edinburgh southbound', 'Gordon Street'),
+	(3, 'Edinburgh at Koch northbound', 'Edinburgh Road South'),
+	(4, 'Stone Road Mall Platform 1', ''),
+	(5, 'University Centre North Loop Platform 7', ''),
+	(6, 'Gordon at Kortright southbound', 'Gordon Street'),
+	(7, 'Fixed Gear Brewing Co', 'Edinburgh Road South'),
+	(8, 'Café Montréal', ''),
+]
+
+
+class StopSearchIndexTestCase(TestCase):
+	"""
+	Tests matching and ranking of the in-memory stop search index.
+	"""
+	def setUp(self):
+		self.index = StopSearchIndex({'id': stop_id, 'name': name, 'desc': desc} for stop_id, name, desc in STOPS)
+
+	def ids(self, query, limit=10):
+		return [entry['id'] for entry in self.index.search(query, limit)]
+
+	def test_normalize_folds_case_accents_and_punctuation(self):
+		self.assertEqual(normalize("Café Montréal, St. Joseph's"), ['cafe', 'montreal', 'st', 'joseph', 's'])
+
+	def test_prefix_of_every_word(self):
+		self.assertEqual(self.ids('gord edin'), [1, 2])
+		self.assertEqual(self.ids('univ'), [5])
+		self.assertEqual(self.ids('cafe mont'), [8])
+
+	def test_name_matches_rank_above_description_matches(self):
+		# Stop 7 only mentions Edinburgh in its description
+		self.assertEqual(self.ids('edinburgh'), [3, 1, 2, 7])
+
+	def test_typos_fall_back_to_trigrams(self):
+		self.assertEqual(self.ids('kortrite'), [6])
+		self.assertEqual(self.ids('edinbrugh')[0], 3)
+		self.assertEqual(self.ids('xyzzy'), [])
+
+	def test_abbreviations_match_spelled_out_words(self):
+		self.assertEqual(self.ids('stone rd'), [4])
+
+	def test_limit(self):
+		self.assertEqual(len(self.ids('gordon', limit=2)), 2)
+		self.assertEqual(self.ids('', limit=2), [])
+
+
+class StopSearchViewTestCase(TestCase):
+	"""
+	Tests the /stops/search/ endpoint.
+	"""
+	def setUp(self):
+		for stop_id, name, desc in STOPS:
+			Stop.objects.create(id=stop_id, code=stop_id, name=name, desc=desc, latitude=43.5, longitude=-80.2)
+		clear_stop_index()
+		self.client = APIClient()
+
+	def tearDown(self):
+		clear_stop_index()
+
+	def test_returns_ranked_stops(self):
+		response = self.client.get('/api/v1/stops/search/', {'q': 'gordon edinburgh'})
+		self.assertEqual(response.status_code, 200)
+		body = response.json()
+		self.assertEqual([stop['id'] for stop in body], [1, 2])
+		# Same fields as the stop list, so the client can use either
+		self.assertEqual(body[0], self.client.get('/api/v1/stops/1/').json())
+
+	def test_limit_is_capped(self):
+		response = self.client.get('/api/v1/stops/search/', {'q': 'g', 'limit': '1'})
+		self.assertEqual(len(response.json()), 1)
+		response = self.client.get('/api/v1/stops/search/', {'q': 'g', 'limit': str(MAX_LIMIT * 10)})
+		self.assertEqual(response.status_code, 200)
+
+	def test_missing_or_invalid_parameters(self):
+		self.assertEqual(self.client.get('/api/v1/stops/search/').status_code, 400)
+		self.assertEqual(self.client.get('/api/v1/stops/search/', {'q': 'gordon', 'limit': 'ten'}).status_code, 400)
+
+	def test_index_is_built_once(self):
+		self.client.get('/api/v1/stops/search/', {'q': 'gordon'})
+		with self.assertNumQueries(0):
+			self.client.get('/api/v1/stops/search/', {'q': 'stone'})
+
+	def test_index_follows_the_feed_version(self):
+		FeedInfo.objects.create(version='v1')
+		feed_version_cache.clear()
+		self.assertEqual(self.client.get('/api/v1/stops/search/', {'q': 'depot'}).json(), [])
+		# Another process imports a new feed; this one only sees the version change
+		Stop.objects.create(id=9, code=9, name='Depot', desc='', latitude=43.5, longitude=-80.2)
+		FeedInfo.objects.update(version='v2')
+		feed_version_cache.clear()
+		self.assertEqual([stop['id'] for stop in self.client.get('/api/v1/stops/search/', {'q': 'depot'}).json()], [9])
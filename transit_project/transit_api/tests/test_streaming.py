@@ -0,0 +1,94 @@
+import json
+from django.test import TestCase, override_settings
+from datetime import datetime, time
+from rest_framework.test import APIClient
+
+from transit_api.models import *
+
+from transit_api.encoders import encode_itinerary
+from transit_api.planning.planner import TransitPlanner
+from transit_api.planning.raptor import RaptorPlanner
+from transit_api.planning.timetable import clear_timetable_cache
+
+
+@override_settings(TRANSIT_TIMETABLE_FILE=None, TRANSIT_TRANSFER_PATTERNS_FILE=None)
+class StreamingPlanTestCase(TestCase):
+	"""
+	Tests the streamed /plan/ responses (NDJSON and Server-Sent Events) on a single
+	route A -> B with departures at 8:00, 8:20 and 8:40.
+	"""
+	def setUp(self):
+		Route.objects.create(id=1, short_name='R1', long_name='Northbound', color='FF0000')
+		Stop.objects.create(id=1, code=1, name='Stop A', desc='', latitude=43.500, longitude=-80.2)
+		Stop.objects.create(id=2, code=2, name='Stop B', desc='', latitude=43.550, longitude=-80.2)
+		for trip_id, minute in ((100, 0), (101, 20), (102, 40)):
+			Trip.objects.create(id=trip_id, route_id=1, trip_headsign='To B', shape_id=0)
+			StopTime.objects.create(trip_id=trip_id, stop_id=1, stop_sequence=1, arrival_time=time(8, minute), departure_time=time(8, minute), shape_dist_traveled=0)
+			StopTime.objects.create(trip_id=trip_id, stop_id=2, stop_sequence=2, arrival_time=time(8, minute + 10), departure_time=time(8, minute + 10), shape_dist_traveled=0)
+
+		self.start_coords = {'latitude': '43.501', 'longitude': '-80.2'}
+		self.end_coords = {'latitude': '43.551', 'longitude': '-80.2'}
+		self.query = {
+			'from_lat': '43.501', 'from_lon': '-80.2', 'to_lat': '43.551', 'to_lon': '-80.2',
+			'depart_after': '07:55', 'depart_before': '08:45',
+		}
+		clear_timetable_cache()
+
+	def tearDown(self):
+		clear_timetable_cache()
+
+	def expected_lines(self):
+		today = datetime.now().date()
+		planner = RaptorPlanner(self.start_coords, self.end_coords)
+		itineraries = planner.profile(datetime.combine(today, time(7, 55)), datetime.combine(today, time(8, 45)))
+		return [encode_itinerary(itinerary) for itinerary in itineraries]
+
+	def test_ndjson_emits_one_line_per_itinerary(self):
+		response = APIClient().get('/api/v1/plan/', dict(self.query, stream='ndjson'))
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+		self.assertEqual(response['Cache-Control'], 'no-cache')
+		chunks = list(response.streaming_content)
+		expected = self.expected_lines()
+		self.assertEqual(len(expected), 3)
+		self.assertEqual(chunks, [line + b'\n' for line in expected])
+		self.assertEqual(len(json.loads(chunks[0])['legs']), 3)  # walk, ride, walk
+
+	def test_sse_emits_itinerary_and_done_events(self):
+		response = APIClient().get('/api/v1/plan/', dict(self.query, stream='sse'))
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response['Content-Type'], 'text/event-stream')
+		chunks = list(response.streaming_content)
+		expected = self.expected_lines()
+		self.assertEqual(chunks[:-1], [b'event: itinerary\ndata: ' + line + b'\n\n' for line in expected])
+		self.assertEqual(chunks[-1], b'event: done\ndata: {"count":3}\n\n')
+
+	def test_accept_header_selects_stream_format(self):
+		client = APIClient()
+		response = client.get('/api/v1/plan/', self.query, HTTP_ACCEPT='text/event-stream')
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response['Content-Type'], 'text/event-stream')
+		self.assertTrue(response.streaming)
+
+		response = client.get('/api/v1/plan/', self.query, HTTP_ACCEPT='application/x-ndjson')
+		self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+
+		# Ordinary clients still get the buffered JSON array
+		response = client.get('/api/v1/plan/', self.query)
+		self.assertFalse(response.streaming)
+		self.assertEqual(len(response.json()), 3)
+
+	def test_unknown_stream_format_is_rejected(self):
+		response = APIClient().get('/api/v1/plan/', dict(self.query, stream='xml'))
+		self.assertEqual(response.status_code, 400)
+		self.assertIn('stream must be one of', response.json()['error'])
+
+	def test_iter_paths_matches_find_five_paths(self):
+		start = datetime(2025, 11, 17, 7, 55)
+		expected = TransitPlanner(self.start_coords, self.end_coords, start).find_five_paths()
+		planner = TransitPlanner(self.start_coords, self.end_coords, start)
+		paths = planner.iter_paths()
+		first = next(paths)
+		# The first itinerary is available before the later searches have run
+		self.assertEqual(len(planner.stats.iterations), 1)
+		self.assertEqual([first] + list(paths), expected)
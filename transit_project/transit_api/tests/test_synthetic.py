@@ -0,0 +1,63 @@
+import csv
+import os
+import tempfile
+from django.core.management import call_command
+from django.test import TestCase
+
+from transit_api.models import Route, Shape, Stop, StopTime, Trip
+from transit_api.planning.timetable import Timetable, clear_timetable_cache
+from transit_api.synthetic import generate_feed, gtfs_time
+
+
+class SyntheticFeedTestCase(TestCase):
+	"""
+	Generates a small synthetic feed and imports it.
+	"""
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.data_dir = self.temp_dir.name
+		self.counts = generate_feed(self.data_dir, stops=60, routes=4, headway_minutes=60, service_start=6 * 3600, service_end=9 * 3600, seed=3)
+
+	def tearDown(self):
+		self.temp_dir.cleanup()
+		clear_timetable_cache()
+
+	def _rows(self, name):
+		with open(os.path.join(self.data_dir, name), newline='') as f:
+			return list(csv.DictReader(f))
+
+	def test_feed_matches_requested_size(self):
+		self.assertEqual(len(self._rows('stops.csv')), 60)
+		self.assertEqual(len(self._rows('routes.csv')), self.counts['routes'])
+		self.assertEqual(len(self._rows('trips.csv')), self.counts['trips'])
+		self.assertEqual(len(self._rows('stop_times.csv')), self.counts['stop_times'])
+		self.assertEqual(self.counts['routes'], 4)
+
+	def test_stop_times_are_ordered_in_time(self):
+		trips = {}
+		for row in self._rows('stop_times.csv'):
+			trips.setdefault(row['trip_id'], []).append(row)
+		for rows in trips.values():
+			times = [t for row in rows for t in (row['arrival_time'], row['departure_time'])]
+			self.assertEqual(times, sorted(times))
+			self.assertEqual([int(row['stop_sequence']) for row in rows], list(range(1, len(rows) + 1)))
+
+	def test_same_seed_gives_same_feed(self):
+		with tempfile.TemporaryDirectory() as other:
+			generate_feed(other, stops=60, routes=4, headway_minutes=60, service_start=6 * 3600, service_end=9 * 3600, seed=3)
+			for name in ('stops.csv', 'trips.csv', 'stop_times.csv'):
+				with open(os.path.join(self.data_dir, name)) as a, open(os.path.join(other, name)) as b:
+					self.assertEqual(a.read(), b.read())
+
+	def test_gtfs_time_passes_midnight(self):
+		self.assertEqual(gtfs_time(25 * 3600 + 61), '25:01:01')
+
+	def test_feed_imports(self):
+		call_command('import_transit_data', data_dir=self.data_dir, stdout=open(os.devnull, 'w'))
+		self.assertEqual(Stop.objects.count(), 60)
+		self.assertEqual(Route.objects.count(), 4)
+		self.assertEqual(Trip.objects.count(), self.counts['trips'])
+		self.assertEqual(StopTime.objects.count(), self.counts['stop_times'])
+		self.assertEqual(Shape.objects.count(), self.counts['shape_points'])
+		# Two directions per route, every trip of a direction sharing one pattern
+		self.assertEqual(len(Timetable.from_db().patterns), 8)
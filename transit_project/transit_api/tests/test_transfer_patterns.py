@@ -0,0 +1,107 @@
+import os
+import tempfile
+from datetime import datetime, timedelta
+from unittest import mock
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from transit_api import views
+from transit_api.profiling import PlanInputs
+
+from transit_api.planning.raptor import RaptorPlanner
+from transit_api.planning.timetable import TRIP_WHEELCHAIR
+from transit_api.planning.transfer_patterns import (
+	TransferPatternError, TransferPatternPlanner, TransferPatterns, precompute, write_transfer_patterns
+)
+from transit_api.tests.timetables import build_line_timetable
+
+
+class TransferPatternTestCase(TestCase):
+	"""
+	Precomputes transfer patterns on the A --R1--> B ~walk~ C --R2--> D line and
+	checks queries against a live RAPTOR search.
+	"""
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.path = os.path.join(self.temp_dir.name, 'transfer_patterns.bin')
+		self.timetable = build_line_timetable()
+		write_transfer_patterns(self.path, precompute(self.timetable, processes=1), self.timetable.feed_version)
+		self.patterns = TransferPatterns.load(self.path)
+
+		self.start_coords = {'latitude': '43.501', 'longitude': '-80.2'}  # Near Stop A
+		self.end_coords = {'latitude': '43.601', 'longitude': '-80.2'}    # Near Stop D
+
+	def tearDown(self):
+		self.temp_dir.cleanup()
+
+	def test_patterns_record_transfer_stops(self):
+		stop = self.timetable.stop_index
+		patterns = self.patterns.patterns_from(stop[1])
+
+		self.assertEqual(self.patterns.feed_version, 'v1')
+		# A -> D: ride to B, walk to C, ride to D
+		self.assertEqual(patterns[stop[4]], [((stop[2] << 1) | 0, (stop[3] << 1) | 1, (stop[4] << 1) | 0)])
+		# Nothing runs back towards A
+		self.assertNotIn(stop[1], self.patterns.patterns_from(stop[4]))
+
+	def test_query_matches_raptor_earliest_arrival(self):
+		for start_time in (datetime(2025, 11, 17, 7, 55), datetime(2025, 11, 17, 8, 5)):
+			planner = TransferPatternPlanner(
+				self.start_coords, self.end_coords, start_time, timetable=self.timetable, transfer_patterns=self.patterns
+			)
+			self.assertTrue(planner.is_usable)
+			itineraries = planner.find_paths()
+			expected = RaptorPlanner(self.start_coords, self.end_coords, timetable=self.timetable).profile(start_time, start_time + timedelta(hours=1))
+
+			self.assertEqual(len(itineraries), 1)
+			self.assertEqual(itineraries[0].end_time, min(it.end_time for it in expected))
+			self.assertEqual([leg.mode for leg in itineraries[0].legs], ['walk', 'transit', 'walk', 'transit', 'walk'])
+
+	def test_precompute_samples_the_windows(self):
+		stop = self.timetable.stop_index
+		# The only departures from A are at 08:00 and 08:10
+		chunks = precompute(self.timetable, processes=1, windows=[(9 * 3600, 10 * 3600)])
+		self.assertEqual(TransferPatterns(None, self.patterns.offsets, b''.join(chunks)).patterns_from(stop[1]), {})
+		done = []
+		chunks = precompute(self.timetable, processes=1, progress=done.append, windows=[(7 * 3600, 9 * 3600)], sample_seconds=0, chunksize=3)
+		self.assertIn(stop[4], TransferPatterns(None, self.patterns.offsets, b''.join(chunks)).patterns_from(stop[1]))
+		self.assertEqual(done, [3, 4])
+
+	def test_required_flags_fall_back_to_raptor(self):
+		start_time = datetime(2025, 11, 17, 7, 55)
+		timetable = build_line_timetable(trip_flags={100: 0, 101: 0})
+		planner = TransferPatternPlanner(
+			self.start_coords, self.end_coords, start_time, timetable=timetable, transfer_patterns=self.patterns, required=TRIP_WHEELCHAIR
+		)
+		self.assertEqual(planner.find_paths(), [])
+		planner.required = 0
+		self.assertEqual(len(planner.find_paths()), 1)
+
+	def test_query_after_service_is_empty(self):
+		planner = TransferPatternPlanner(
+			self.start_coords, self.end_coords, datetime(2025, 11, 17, 12, 0), timetable=self.timetable, transfer_patterns=self.patterns
+		)
+		self.assertEqual(planner.find_paths(), [])
+
+	def test_patterns_for_another_feed_are_not_used(self):
+		planner = TransferPatternPlanner(
+			self.start_coords, self.end_coords, datetime(2025, 11, 17, 7, 55),
+			timetable=build_line_timetable(feed_version='v2'), transfer_patterns=self.patterns
+		)
+		self.assertFalse(planner.is_usable)
+
+	def test_garbage_file_is_rejected(self):
+		with open(self.path, 'wb') as f:
+			f.write(b'not transfer patterns')
+		with self.assertRaises(TransferPatternError):
+			TransferPatterns.load(self.path)
+
+	@override_settings(TRANSIT_TIMETABLE_FILE=None, TRANSIT_REALTIME_FILE='', TRANSIT_REALTIME_SOURCE='')
+	def test_plan_view_uses_patterns_only_when_enabled(self):
+		params = {'from_lat': '43.501', 'from_lon': '-80.2', 'to_lat': '43.601', 'to_lon': '-80.2'}
+		with mock.patch.object(views, 'get_transfer_patterns', return_value=self.patterns), \
+				mock.patch.object(PlanInputs, 'start_planner', autospec=True, return_value=(object(), [])) as start_planner:
+			for enabled, mode in ((False, 'a_star'), (True, 'transfer_patterns')):
+				with self.subTest(enabled=enabled), override_settings(TRANSIT_TRANSFER_PATTERNS_DEFAULT=enabled):
+					self.assertEqual(APIClient().get('/api/v1/plan/', params).status_code, 200)
+					self.assertEqual(start_planner.call_args[0][0].mode, mode)
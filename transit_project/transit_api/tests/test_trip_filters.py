@@ -0,0 +1,148 @@
+import csv
+import os
+import tempfile
+from datetime import datetime, time
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from transit_api.models import *
+
+from transit_api.planning.compiled import load_timetable, write_timetable
+from transit_api.planning.planner import TransitPlanner
+from transit_api.planning.raptor import RaptorPlanner
+from transit_api.planning.realtime import DelayOverlay, parse_trip_updates, reset_realtime
+from transit_api.planning.timetable import TRIP_BIKES, TRIP_WHEELCHAIR, clear_timetable_cache
+from transit_api.tests.test_feeds import write_feed
+from transit_api.tests.timetables import build_timetable
+
+ORIGIN = {'latitude': '43.501', 'longitude': '-80.2'}
+DESTINATION = {'latitude': '43.601', 'longitude': '-80.2'}
+
+
+def build_flagged_timetable():
+	"""
+	A -> B -> C, leaving A at 8:00 (not accessible, bikes), 8:20 (accessible, no bikes)
+	and 8:40 (both) and taking 10 minutes per stop.
+	"""
+	return build_timetable([(100, 1, 'To C', 0, TRIP_BIKES), (101, 1, 'To C', 0, TRIP_WHEELCHAIR), (102, 1, 'To C', 0, TRIP_WHEELCHAIR | TRIP_BIKES)])
+
+
+class TripFlagsTestCase(TestCase):
+	"""
+	Tests the trip flags of the timetable and the "next trip" lookups filtered by them.
+	"""
+	def setUp(self):
+		self.timetable = build_flagged_timetable()
+
+	def test_lookups_skip_trips_without_the_required_flags(self):
+		pattern = self.timetable.patterns[0]
+		self.assertEqual(pattern.restricted, TRIP_WHEELCHAIR | TRIP_BIKES)
+		self.assertEqual(pattern.earliest_trip(0, 28800), 0)
+		self.assertEqual(pattern.earliest_trip(0, 28800, TRIP_WHEELCHAIR), 1)
+		self.assertEqual(pattern.earliest_trip(0, 28800, TRIP_WHEELCHAIR | TRIP_BIKES), 2)
+		self.assertIsNone(pattern.earliest_trip(0, 28800 + 2401, TRIP_WHEELCHAIR))
+		self.assertEqual(pattern.latest_trip(2, 28800 + 3600, TRIP_BIKES), 2)
+		self.assertEqual(pattern.latest_trip(2, 28800 + 2999, TRIP_BIKES), 0)
+		self.assertIsNone(pattern.latest_trip(2, 28800 + 1799, TRIP_WHEELCHAIR))
+
+	def test_trips_allow_everything_by_default(self):
+		timetable = build_timetable([(100, 1, 'To B')], [(1, [1, 2], [100], [0, 60])])
+		self.assertEqual(timetable.patterns[0].restricted, 0)
+		self.assertEqual(timetable.patterns[0].earliest_trip(0, 0, TRIP_WHEELCHAIR | TRIP_BIKES), 0)
+
+	def test_flags_survive_compiling(self):
+		with tempfile.TemporaryDirectory() as temp_dir:
+			path = os.path.join(temp_dir, 'timetable.bin')
+			write_timetable(self.timetable, path)
+			loaded = load_timetable(path)
+			self.assertEqual(bytes(loaded.trip_flags), bytes(self.timetable.trip_flags))
+			self.assertEqual(loaded.patterns[0].earliest_trip(0, 28800, TRIP_WHEELCHAIR), 1)
+
+	def test_delayed_pattern_keeps_filtering(self):
+		overlay = DelayOverlay()
+		# 8:20 runs 30 minutes late, after 8:40
+		entity = {'id': '101', 'trip_update': {'trip': {'trip_id': '101'}, 'delay': 1800}}
+		overlay.apply(parse_trip_updates({'entity': [entity]}), base=self.timetable)
+		pattern = overlay.timetable(base=self.timetable).patterns[0]
+		self.assertEqual(pattern.earliest_trip(0, 28800, TRIP_WHEELCHAIR), 2)
+		self.assertEqual(pattern.earliest_trip(0, 28800 + 2401, TRIP_WHEELCHAIR), 1)
+		self.assertIsNone(pattern.earliest_trip(0, 28800 + 2401, TRIP_BIKES))
+		self.assertEqual(pattern.latest_trip(2, 28800 + 4800, TRIP_BIKES), 2)
+
+	def test_planners_ride_only_matching_trips(self):
+		planner = RaptorPlanner(ORIGIN, DESTINATION, timetable=self.timetable, required=TRIP_WHEELCHAIR)
+		itineraries = planner.profile(datetime(2025, 11, 17, 7, 55), datetime(2025, 11, 17, 8, 50))
+		self.assertEqual([itinerary.legs[1].trip_id for itinerary in itineraries], [101, 102])
+		planner = RaptorPlanner(ORIGIN, DESTINATION, timetable=self.timetable, required=TRIP_BIKES)
+		itinerary, = planner.arrive_by(datetime(2025, 11, 17, 8, 50))
+		self.assertEqual(itinerary.legs[1].trip_id, 100)
+
+
+@override_settings(TRANSIT_TIMETABLE_FILE=None, TRANSIT_TRANSFER_PATTERNS_FILE=None, TRANSIT_REALTIME_FILE='', TRANSIT_REALTIME_SOURCE='')
+class TripFilterPlanTestCase(TestCase):
+	"""
+	Tests the wheelchair/bikes options of /plan/ on trips from the database.
+	"""
+	def setUp(self):
+		Route.objects.create(id=1, short_name='R1', long_name='Northbound', color='FF0000')
+		for stop_id, lat in ((1, 43.500), (2, 43.550), (3, 43.600)):
+			Stop.objects.create(id=stop_id, code=stop_id, name=f'Stop {stop_id}', desc='', latitude=lat, longitude=-80.2)
+		for trip_id, minute, accessible, bikes in ((100, 0, False, True), (101, 20, True, False), (102, 40, True, True)):
+			Trip.objects.create(id=trip_id, route_id=1, trip_headsign='To C', shape_id=0, is_accessible=accessible, is_bikes=bikes)
+			for sequence in (1, 2, 3):
+				at = time(8 + (minute + 10 * (sequence - 1)) // 60, (minute + 10 * (sequence - 1)) % 60)
+				StopTime.objects.create(trip_id=trip_id, stop_id=sequence, stop_sequence=sequence, arrival_time=at, departure_time=at, shape_dist_traveled=0)
+		reset_realtime()
+		clear_timetable_cache()
+		self.client = APIClient()
+
+	def tearDown(self):
+		clear_timetable_cache()
+
+	def plan(self, **params):
+		return self.client.get('/api/v1/plan/', {
+			'from_lat': '43.501', 'from_lon': '-80.2', 'to_lat': '43.601', 'to_lon': '-80.2',
+			'depart_after': '07:55', 'depart_before': '08:45', **params,
+		})
+
+	def departures(self, **params):
+		response = self.plan(**params)
+		self.assertEqual(response.status_code, 200)
+		return [leg['start_time'][11:16] for itinerary in response.json() for leg in itinerary['legs'] if leg['mode'] == 'transit']
+
+	def test_filters_exclude_trips(self):
+		self.assertEqual(self.departures(), ['08:00', '08:20', '08:40'])
+		self.assertEqual(self.departures(wheelchair='1'), ['08:20', '08:40'])
+		self.assertEqual(self.departures(bikes='1'), ['08:00', '08:40'])
+		self.assertEqual(self.departures(wheelchair='1', bikes='1'), ['08:40'])
+
+	def test_invalid_filter_is_rejected(self):
+		self.assertEqual(self.plan(wheelchair='yes').status_code, 400)
+
+	def test_a_star_rides_only_matching_trips(self):
+		planner = TransitPlanner(ORIGIN, DESTINATION, datetime(2025, 11, 17, 7, 55), required=TRIP_WHEELCHAIR)
+		itinerary = next(iter(planner.iter_paths()))
+		ride, = [leg for leg in itinerary.legs if leg.mode == 'transit']
+		self.assertEqual((ride.trip_id, ride.end_time.time()), (101, time(8, 40)))
+
+
+class TripFlagImportTestCase(TestCase):
+	"""
+	Tests reading wheelchair_accessible and bikes_allowed, where 0 (or empty) is
+	"no information", 1 "yes" and 2 "no".
+	"""
+	def test_only_1_sets_the_flag(self):
+		with tempfile.TemporaryDirectory() as temp_dir:
+			directory = os.path.join(temp_dir, 'feed')
+			write_feed(directory, 'R1', [(43.5, -80.2), (43.6, -80.2)], '08:00')
+			with open(os.path.join(directory, 'trips.csv'), 'w', newline='') as f:
+				csv.writer(f).writerows([['route_id', 'trip_id', 'trip_headsign', 'direction_id', 'shape_id', 'wheelchair_accessible', 'bikes_allowed']] + [
+					['1', str(trip_id), 'R1', '0', '5', wheelchair, bikes]
+					for trip_id, wheelchair, bikes in ((10, '0', ''), (11, '1', '1'), (12, '2', '2'))
+				])
+			call_command('import_transit_data', '--data-dir', directory, stdout=StringIO())
+
+		flags = {trip.id: (trip.is_accessible, trip.is_bikes) for trip in Trip.objects.all()}
+		self.assertEqual(flags, {10: (False, False), 11: (True, True), 12: (False, False)})
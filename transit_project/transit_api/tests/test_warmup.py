@@ -0,0 +1,85 @@
+import threading
+from datetime import time
+from unittest import mock
+from django.test import TestCase, override_settings
+
+from transit_api import warmup
+from transit_api.models import *
+from transit_api.planning.timetable import clear_timetable_cache, get_timetable
+from transit_api.search import clear_stop_index, get_stop_index
+from transit_api.warmup import run_warmup, start_warmup, warmup_state
+
+
+@override_settings(TRANSIT_TIMETABLE_FILE=None, TRANSIT_TRANSFER_PATTERNS_FILE=None)
+class WarmupTestCase(TestCase):
+	"""
+	Tests the startup warmup and the health/readiness endpoints reporting it.
+	"""
+	def setUp(self):
+		Route.objects.create(id=1, short_name='R1', long_name='Northbound', color='FF0000')
+		Stop.objects.create(id=1, code=1, name='Stop A', desc='', latitude=43.500, longitude=-80.2)
+		Stop.objects.create(id=2, code=2, name='Stop B', desc='', latitude=43.550, longitude=-80.2)
+		Trip.objects.create(id=100, route_id=1, trip_headsign='To B', shape_id=0)
+		StopTime.objects.create(trip_id=100, stop_id=1, stop_sequence=1, arrival_time=time(8, 0), departure_time=time(8, 0), shape_dist_traveled=0)
+		StopTime.objects.create(trip_id=100, stop_id=2, stop_sequence=2, arrival_time=time(8, 10), departure_time=time(8, 10), shape_dist_traveled=0)
+		clear_timetable_cache()
+		clear_stop_index()
+		warmup_state.reset()
+
+	def tearDown(self):
+		clear_timetable_cache()
+		clear_stop_index()
+		warmup_state.reset()
+
+	def test_warmup_preloads_planner_data(self):
+		self.assertTrue(run_warmup())
+		report = warmup_state.as_dict()
+		self.assertEqual(report['status'], 'ready')
+		self.assertEqual(list(report['steps']), ['timetable', 'transfer_patterns', 'stop_index'])
+		self.assertGreater(report['steps']['timetable']['seconds'], 0)
+		self.assertIsInstance(report['rss_kib'], int)
+
+		# Nothing is loaded from the database any more
+		with self.assertNumQueries(0):
+			self.assertEqual(len(get_timetable().stop_ids), 2)
+			self.assertEqual(get_stop_index().search('stop b')[0]['id'], 2)
+
+	def test_readiness_follows_warmup(self):
+		# No warmup configured: ready straight away
+		self.assertEqual(self.client.get('/api/v1/ready/').status_code, 200)
+		self.assertEqual(self.client.get('/api/v1/health/').json(), {'status': 'ok'})
+
+		started, release = threading.Event(), threading.Event()
+
+		def slow_step():
+			started.set()
+			release.wait(5)
+
+		with mock.patch.object(warmup, 'STEPS', (('slow', slow_step),)):
+			start_warmup('background')
+			started.wait(5)
+			response = self.client.get('/api/v1/ready/')
+			self.assertEqual(response.status_code, 503)
+			self.assertEqual(response.json()['status'], 'warming')
+			self.assertEqual(self.client.get('/api/v1/health/').status_code, 200)
+
+			release.set()
+			next(t for t in threading.enumerate() if t.name == 'transit-warmup').join(5)
+		response = self.client.get('/api/v1/ready/')
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(list(response.json()['steps']), ['slow'])
+		self.assertIn('transit_warmup_ready 1', self.client.get('/api/v1/metrics/').content.decode())
+
+	def test_failed_warmup_is_not_ready(self):
+		def broken():
+			raise RuntimeError('no tables')
+
+		with mock.patch.object(warmup, 'STEPS', (('broken', broken),)), self.assertLogs('transit_api.warmup', level='ERROR'):
+			self.assertFalse(run_warmup())
+		response = self.client.get('/api/v1/ready/')
+		self.assertEqual(response.status_code, 503)
+		self.assertEqual(response.json()['error'], 'RuntimeError: no tables')
+
+	def test_unknown_mode_is_rejected(self):
+		with self.assertRaises(ValueError):
+			start_warmup('eager')
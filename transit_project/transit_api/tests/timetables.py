@@ -0,0 +1,42 @@
+"""
+Small timetables built without the database, shared by the planner tests.
+"""
+from transit_api.planning.patterns import PatternData, int32_array
+from transit_api.planning.timetable import ALL_TRIP_FLAGS, Timetable
+
+# A, B and C about 5.5 km apart on a line running north along -80.2
+LINE_STOPS = [(1, 'Stop A', 43.500, -80.2), (2, 'Stop B', 43.550, -80.2), (3, 'Stop C', 43.600, -80.2)]
+
+
+def line_times(stop_count, trip_count, first=28800, headway=1200, between_stops=600):
+	"""Times, stop by stop, of trips leaving the first stop every `headway` seconds from `first`."""
+	return [first + headway * trip + between_stops * stop for stop in range(stop_count) for trip in range(trip_count)]
+
+
+def build_timetable(trips, patterns=None, stops=LINE_STOPS, routes=((1, 'R1'),), feed_version='v1', shapes=()):
+	"""
+	A Timetable of `stops` and `trips`, rows as Timetable.build takes them, with
+	`patterns` [(route_id, stop_ids, trip_ids, times)] whose times (stop by stop)
+	are both the arrivals and the departures. Without patterns, the trips run along
+	every stop in order: 8:00, 8:20, 8:40... from the first, 10 minutes per stop.
+	"""
+	if patterns is None:
+		patterns = [(trips[0][1], [s[0] for s in stops], [t[0] for t in trips], line_times(len(stops), len(trips)))]
+	patterns = [
+		PatternData(route_id, int32_array(stop_ids), int32_array(trip_ids), int32_array(times), int32_array(times))
+		for route_id, stop_ids, trip_ids, times in patterns
+	]
+	return Timetable.build(stops, list(routes), trips, patterns, feed_version=feed_version, shapes=shapes)
+
+
+def build_line_timetable(feed_version='v1', trip_flags=None):
+	"""A --R1--> B ~walk~ C --R2--> D; `trip_flags` {trip_id: flags} overrides ALL_TRIP_FLAGS."""
+	stops = [(1, 'Stop A', 43.500, -80.2), (2, 'Stop B', 43.550, -80.2), (3, 'Stop C', 43.552, -80.2), (4, 'Stop D', 43.600, -80.2)]
+	trips = [(100, 1, 'To B'), (101, 1, 'To B'), (200, 2, 'To D'), (201, 2, 'To D')]
+	if trip_flags:
+		trips = [trip + (0, trip_flags.get(trip[0], ALL_TRIP_FLAGS)) for trip in trips]
+	patterns = [
+		(1, [1, 2], [100, 101], line_times(2, 2, headway=600)),
+		(2, [3, 4], [200, 201], line_times(2, 2, first=29700, headway=900)),
+	]
+	return build_timetable(trips, patterns, stops=stops, routes=[(1, 'R1'), (2, 'R2')], feed_version=feed_version)
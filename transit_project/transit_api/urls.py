@@ -12,4 +12,7 @@ router.register(r'trips', TripViewSet)
 urlpatterns = [
 	path('', include(router.urls)),
 	path('plan/', PlanTripView.as_view(), name='plan-trip'),
+	path('metrics/', MetricsView.as_view(), name='metrics'),
+	path('health/', HealthView.as_view(), name='health'),
+	path('ready/', ReadinessView.as_view(), name='ready'),
 ]
\ No newline at end of file
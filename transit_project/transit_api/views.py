@@ -1,32 +1,120 @@
+import json
+import logging
+from time import perf_counter
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.views import View
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.negotiation import DefaultContentNegotiation
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_time
+
 from .models import *
 from .planning.planner import *
 from .planning.itinerary import *
+from .planning.plan_cache import plan_cache
+from .planning.realtime import delay_overlay, refresh_delays
+from .planning.singleflight import plan_flights
+from .planning.stats import PlannerStats, plan_metrics
+from .planning.timetable import TRIP_BIKES, TRIP_WHEELCHAIR
+from .planning.transfer_patterns import get_transfer_patterns
+from .encoders import encode_itineraries, encode_itinerary
+from .http_cache import FeedCachedMixin, feed_cached, response_cache
+from .profiling import PROFILE_ID_HEADER, PlanInputs, record_plan, should_profile
+from .search import DEFAULT_LIMIT, MAX_LIMIT, get_stop_index
+from .warmup import warmup_state
 from .serializers import *
 
+logger = logging.getLogger(__name__)
+
 # Create your views here.
 
-class RouteViewSet(viewsets.ReadOnlyModelViewSet):
+class RouteViewSet(FeedCachedMixin, viewsets.ReadOnlyModelViewSet):
 	queryset = Route.objects.all()
+	serializer_class = RouteSerializer
 
-class StopViewSet(viewsets.ReadOnlyModelViewSet):
+class StopViewSet(FeedCachedMixin, viewsets.ReadOnlyModelViewSet):
 	queryset = Stop.objects.all()
+	serializer_class = StopSerializer
+
+	@action(detail=False)
+	@feed_cached
+	def search(self, request):
+		"""
+		Autocomplete: the stops whose name or description matches `q`, best first.
+		Every word of q matches as a prefix ("gord edin"), or approximately when it
+		matches no prefix ("edinbrugh"). `limit` caps the results (default 10, at most 50).
+		"""
+		query = request.query_params.get('q', '').strip()
+		if not query:
+			return Response({"error": "Missing required query parameter: 'q'"}, status=status.HTTP_400_BAD_REQUEST)
+		try:
+			limit = min(max(int(request.query_params.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+		except ValueError as e:
+			return Response({"error": f"Invalid format for query parameter: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+		return Response(get_stop_index().search(query, limit))
 
-class TripViewSet(viewsets.ReadOnlyModelViewSet):
+class TripViewSet(FeedCachedMixin, viewsets.ReadOnlyModelViewSet):
 	queryset = Trip.objects.all()
+	serializer_class = TripSerializer
 
-class StopTimeViewSet(viewsets.ReadOnlyModelViewSet):
+class StopTimeViewSet(FeedCachedMixin, viewsets.ReadOnlyModelViewSet):
 	queryset = StopTime.objects.all()
+	serializer_class = StopTimeSerializer
 
-class ShapesViewSet(viewsets.ReadOnlyModelViewSet):
+class ShapesViewSet(FeedCachedMixin, viewsets.ReadOnlyModelViewSet):
 	queryset = Shape.objects.all()
+	serializer_class = ShapeSerializer
 
 # Gemini 2.5 Pro
 
+PROFILE_WINDOW = timedelta(hours=1)
+MAX_PROFILE_WINDOW = timedelta(hours=4)
+COORDINATE_DECIMALS = 5  # ~1 m; requests this close together share one search
+STREAM_FORMATS = {'ndjson': 'application/x-ndjson', 'sse': 'text/event-stream'}
+
+def _parse_coords(lat, lon):
+	return {'latitude': round(float(lat), COORDINATE_DECIMALS), 'longitude': round(float(lon), COORDINATE_DECIMALS)}
+
+def _parse_time_param(value, now):
+	"""
+	Parses an ISO datetime or a bare HH:MM[:SS] (taken on the same day as `now`).
+	Returns None for a missing value and raises ValueError for a malformed one.
+	"""
+	if not value:
+		return None
+	parsed = parse_datetime(value)
+	if parsed is None:
+		parsed_time = parse_time(value)
+		if parsed_time is None:
+			raise ValueError(f"'{value}' is not a valid date/time")
+		return datetime.combine(now.date(), parsed_time)
+	if timezone.is_aware(parsed):
+		parsed = timezone.make_naive(parsed)
+	return parsed
+
+def _parse_flag_param(params, name):
+	"""Parses an optional 0/1 query parameter."""
+	value = params.get(name, '0')
+	if value not in ('0', '1'):
+		raise ValueError(f"{name} must be 0 or 1")
+	return int(value)
+
+class _StreamingContentNegotiation(DefaultContentNegotiation):
+	"""Lets Accept: text/event-stream / application/x-ndjson through; the view answers those itself."""
+	def select_renderer(self, request, renderers, format_suffix=None):
+		try:
+			return super().select_renderer(request, renderers, format_suffix)
+		except NotAcceptable:
+			return renderers[0], renderers[0].media_type
+
 class PlanTripView(APIView):
 	"""
 	An API endpoint for planning a transit trip.
@@ -36,20 +124,71 @@ class PlanTripView(APIView):
 	- from_lon: Longitude of the starting point (e.g., -74.0060)
 	- to_lat: Latitude of the destination (e.g., 40.7580)
 	- to_lon: Longitude of the destination (e.g., -73.9855)
+
+	Optional departure window (profile query). When either is given, every
+	Pareto-optimal itinerary leaving inside the window is returned:
+	- depart_after: ISO datetime or HH:MM (defaults to now)
+	- depart_before: ISO datetime or HH:MM (defaults to depart_after + 1 hour)
+
+	Optional arrival deadline (reverse query), not combinable with the window above:
+	- arrive_by: ISO datetime or HH:MM; itineraries arriving no later than this
+
+	Optional trip filters (0 or 1, default 0):
+	- wheelchair: ride only wheelchair accessible trips
+	- bikes: ride only trips allowing bikes
+	Filtered queries without a window or deadline use the A* planner, since the
+	precomputed transfer patterns do not know about the filters.
+
+	Every response carries a Server-Timing header with the planner's phase timings.
+	With debug=stats the body becomes {"itineraries": [...], "stats": {...}} with the
+	search counters and DB queries of the request.
+
+	Identical requests (same mode, coordinates to ~1 m and times to the second) that
+	arrive while one is being planned wait for its result instead of searching again,
+	for at most settings.TRANSIT_PLAN_COALESCE_TIMEOUT seconds.
+
+	Optional streaming, selected with stream=ndjson|sse or the matching Accept header:
+	each itinerary is sent as soon as the planner finds it, as one JSON line (NDJSON) or
+	one `itinerary` event (Server-Sent Events, ended by a `done` event). A failure after
+	the first itinerary is reported in-band as {"error": ...} / an `error` event.
+	Streamed requests are not coalesced and carry no Server-Timing header.
+
+	Plans reflect the real-time delays of settings.TRANSIT_REALTIME_FILE (or _SOURCE),
+	polled before planning. Finished results are cached for
+	settings.TRANSIT_PLAN_CACHE_SECONDS; a delay update drops them all.
+
+	Opt-in profiling (settings.TRANSIT_PROFILE_*, see transit_api/profiling.py): a
+	sampled request, or one sending X-Transit-Profile with the configured token, is
+	searched under cProfile and its exact inputs recorded for `manage.py replay_plan`.
+	The response then carries X-Transit-Profile-Id. Streamed requests are not profiled.
 	"""
+	content_negotiation_class = _StreamingContentNegotiation
+
 	def get(self, request, *args, **kwargs):
 		# --- 1. Validate and Parse Input Parameters ---
 		try:
-			start_coords = {
-				'latitude': request.query_params['from_lat'],
-				'longitude': request.query_params['from_lon']
-			}
-			end_coords = {
-				'latitude': request.query_params['to_lat'],
-				'longitude': request.query_params['to_lon']
-			}
+			start_coords = _parse_coords(request.query_params['from_lat'], request.query_params['from_lon'])
+			end_coords = _parse_coords(request.query_params['to_lat'], request.query_params['to_lon'])
 			# For a production app, you might parse the start time from the request too
-			start_time = datetime.now()
+			start_time = datetime.now().replace(microsecond=0)
+			stream = request.query_params.get('stream') or _accepted_stream_format(request.headers.get('Accept', ''))
+			if stream and stream not in STREAM_FORMATS:
+				raise ValueError(f"stream must be one of {', '.join(STREAM_FORMATS)}")
+			depart_after = _parse_time_param(request.query_params.get('depart_after'), start_time)
+			depart_before = _parse_time_param(request.query_params.get('depart_before'), start_time)
+			arrive_by = _parse_time_param(request.query_params.get('arrive_by'), start_time)
+			required = TRIP_WHEELCHAIR * _parse_flag_param(request.query_params, 'wheelchair') \
+				| TRIP_BIKES * _parse_flag_param(request.query_params, 'bikes')
+			is_profile_query = depart_after is not None or depart_before is not None
+			if arrive_by is not None and is_profile_query:
+				raise ValueError("arrive_by cannot be combined with depart_after/depart_before")
+			if is_profile_query:
+				depart_after = depart_after or start_time
+				depart_before = depart_before or depart_after + PROFILE_WINDOW
+				if depart_before < depart_after:
+					raise ValueError("depart_before must not be earlier than depart_after")
+				if depart_before - depart_after > MAX_PROFILE_WINDOW:
+					raise ValueError(f"departure window is limited to {MAX_PROFILE_WINDOW}")
 		except KeyError as e:
 			# If a required parameter is missing
 			return Response(
@@ -64,20 +203,145 @@ class PlanTripView(APIView):
 			)
 
 		# --- 2. Call the Business Logic (The Planner) ---
+		started = perf_counter()
+		stats = PlannerStats()
 		try:
-			planner = TransitPlanner(start_coords, end_coords, start_time)
-			found_itineraries = planner.find_five_paths()
-		except Exception as e:
-			# Catch potential errors during planning (e.g., database issues)
-			# In production, you would log this error.
-			return Response(
-				{"error": "An unexpected error occurred during trip planning."},
-				status=status.HTTP_500_INTERNAL_SERVER_ERROR
+			change = refresh_delays()
+		except Exception:
+			# Plan with the delays we have rather than fail the request
+			logger.exception("Could not refresh real-time delays")
+			change = None
+		if change is not None:
+			plan_cache.invalidate(change)
+		if arrive_by is not None:
+			mode, times = 'arrive_by', (arrive_by,)
+		elif is_profile_query:
+			mode, times = 'profile', (depart_after, depart_before)
+		elif not required and settings.TRANSIT_TRANSFER_PATTERNS_DEFAULT and get_transfer_patterns() is not None:
+			mode, times = 'transfer_patterns', (start_time,)
+		else:
+			mode, times = 'a_star', (start_time,)
+		inputs = PlanInputs(mode, start_coords, end_coords, times, required)
+
+		def plan():
+			with stats.track_queries(), stats.phase('search'):
+				planner, itineraries = inputs.start_planner()
+				itineraries = list(itineraries)
+			# The A* planner breaks its time down by phase itself
+			return itineraries, getattr(planner, 'stats', stats)
+
+		if stream:
+			try:
+				with stats.track_queries(), stats.phase('search'):
+					planner, itineraries = inputs.start_planner()
+			except Exception:
+				return Response(
+					{"error": "An unexpected error occurred during trip planning."},
+					status=status.HTTP_500_INTERNAL_SERVER_ERROR
+				)
+			stats = getattr(planner, 'stats', stats)
+			response = StreamingHttpResponse(
+				_stream_itineraries(stream, itineraries, mode, stats, started),
+				content_type=STREAM_FORMATS[stream]
+			)
+			response['Cache-Control'] = 'no-cache'
+			response['X-Accel-Buffering'] = 'no'  # tell proxies not to hold chunks back
+			return response
+
+		key = (mode, tuple(start_coords.values()), tuple(end_coords.values()), times, required)
+		profiled = should_profile(request)
+		profile_id = None
+		# A profiled request searches afresh rather than reuse a cached or shared result
+		found_itineraries = None if profiled else plan_cache.get(key)
+		if found_itineraries is not None:
+			stats.phases['cached'] = perf_counter() - started
+		else:
+			generation = plan_cache.generation
+			try:
+				if profiled:
+					(found_itineraries, stats), profile_id = record_plan(inputs, plan)
+				else:
+					(found_itineraries, planner_stats), shared = plan_flights.do(
+						key, plan, timeout=getattr(settings, 'TRANSIT_PLAN_COALESCE_TIMEOUT', None)
+					)
+					if shared:
+						# The counters belong to the request that ran the search
+						stats.phases['coalesced'] = perf_counter() - started
+					else:
+						stats = planner_stats
+			except Exception as e:
+				# Catch potential errors during planning (e.g., database issues)
+				# In production, you would log this error.
+				return Response(
+					{"error": "An unexpected error occurred during trip planning."},
+					status=status.HTTP_500_INTERNAL_SERVER_ERROR
+				)
+			plan_cache.put(
+				key, found_itineraries, generation,
+				max_entries=getattr(settings, 'TRANSIT_PLAN_CACHE_SIZE', 0),
+				seconds=getattr(settings, 'TRANSIT_PLAN_CACHE_SECONDS', 0),
 			)
 
 		# --- 3. Serialize the Results ---
-		# The `many=True` argument is crucial because we are serializing a list of itineraries.
-		serializer = ItinerarySerializer(found_itineraries, many=True)
+		# encode_itineraries renders the same JSON as ItinerarySerializer(many=True), without
+		# going through the serializer fields for every leg.
+		with stats.phase('encode'):
+			content = encode_itineraries(found_itineraries)
+		plan_metrics.record(mode, perf_counter() - started, stats)
+		if request.query_params.get('debug') == 'stats':
+			content = b'{"itineraries":' + content + b',"stats":' + json.dumps(stats.as_dict()).encode() + b'}'
 
 		# --- 4. Return the Final HTTP Response ---
-		return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+		response = HttpResponse(content, content_type='application/json', status=status.HTTP_200_OK)
+		response['Server-Timing'] = stats.server_timing()
+		if profile_id is not None:
+			response[PROFILE_ID_HEADER] = profile_id
+		return response
+
+def _accepted_stream_format(accept):
+	for fmt, content_type in STREAM_FORMATS.items():
+		if content_type in accept:
+			return fmt
+	return None
+
+def _stream_itineraries(fmt, itineraries, mode, stats, started):
+	"""Yields the response chunks of a streamed plan, one per itinerary."""
+	count = 0
+	try:
+		for itinerary in itineraries:
+			count += 1
+			content = encode_itinerary(itinerary)
+			yield (b'event: itinerary\ndata: ' + content + b'\n\n') if fmt == 'sse' else (content + b'\n')
+	except Exception:
+		error = b'{"error":"An unexpected error occurred during trip planning."}'
+		yield (b'event: error\ndata: ' + error + b'\n\n') if fmt == 'sse' else (error + b'\n')
+		return
+	plan_metrics.record(mode, perf_counter() - started, stats)
+	if fmt == 'sse':
+		yield b'event: done\ndata: {"count":' + str(count).encode() + b'}\n\n'
+
+class MetricsView(View):
+	"""
+	Planner metrics aggregated since the process started, in the Prometheus text
+	format. Each worker process reports its own totals.
+	"""
+	def get(self, request, *args, **kwargs):
+		content = (
+			plan_metrics.render() + plan_flights.render('transit_plan_coalescing') + plan_cache.render('transit_plan_cache')
+			+ delay_overlay.render() + response_cache.render('transit_response_cache') + warmup_state.render()
+		)
+		return HttpResponse(content, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+class HealthView(View):
+	"""Liveness: 200 whenever the process can answer requests."""
+	def get(self, request, *args, **kwargs):
+		return JsonResponse({'status': 'ok'})
+
+class ReadinessView(View):
+	"""
+	Readiness: 200 once the warmup configured by settings.TRANSIT_WARMUP has finished
+	(or straight away when there is none), 503 while it runs or after it failed. The
+	body reports the warmup's timings and memory.
+	"""
+	def get(self, request, *args, **kwargs):
+		return JsonResponse(warmup_state.as_dict(), status=200 if warmup_state.is_ready else 503)
\ No newline at end of file
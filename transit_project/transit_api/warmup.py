@@ -0,0 +1,147 @@
+"""
+Warm start of the planner data structures.
+
+Without it every worker process loads the timetable, transfer patterns and stop
+search index on its first request. With settings.TRANSIT_WARMUP set, AppConfig.ready
+builds them at startup instead:
+
+  'sync'        in ready() itself. Under a server that imports the application
+                before forking (gunicorn --preload) this happens once in the master,
+                and the workers inherit the structures copy-on-write.
+  'background'  in a thread of each process, so it starts accepting connections at
+                once; /ready/ answers 503 until the warmup has finished.
+
+Each step's wall time and resident memory growth are logged and served by /ready/
+and /metrics/.
+"""
+import gc
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+
+from django.db import connections
+
+from .planning.stats import render_counters
+from .planning.timetable import get_timetable
+from .planning.transfer_patterns import get_transfer_patterns
+from .search import get_stop_index
+
+MODES = ('sync', 'background')
+
+logger = logging.getLogger(__name__)
+
+
+def _rss_kib():
+	"""Current resident set size of this process in KiB (the peak where /proc is unavailable)."""
+	try:
+		with open('/proc/self/statm') as f:
+			return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+	except (OSError, ValueError, IndexError):
+		peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+		return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+# Name -> loader, in the order they run
+STEPS = (
+	('timetable', get_timetable),
+	('transfer_patterns', get_transfer_patterns),
+	('stop_index', get_stop_index),
+)
+
+
+class WarmupState:
+	"""Progress of this process's warmup, safe to read from any thread."""
+	def __init__(self):
+		self._lock = threading.Lock()
+		self.reset()
+
+	def reset(self):
+		with self._lock:
+			self.mode = None
+			self.status = 'idle'  # idle (no warmup configured), warming, ready or failed
+			self.error = None
+			self.steps = {}       # step name -> {'seconds': ..., 'rss_kib': growth}
+			self.seconds = None
+			self.rss_kib = None
+
+	@property
+	def is_ready(self):
+		return self.status in ('idle', 'ready')
+
+	def as_dict(self):
+		with self._lock:
+			return {
+				'status': self.status,
+				'mode': self.mode,
+				'seconds': None if self.seconds is None else round(self.seconds, 3),
+				'rss_kib': self.rss_kib,
+				'steps': {name: dict(step) for name, step in self.steps.items()},
+				'error': self.error,
+			}
+
+	def render(self):
+		"""The warmup gauges in the Prometheus text format."""
+		with self._lock:
+			return render_counters('transit_warmup', [
+				('ready', 'Whether this process has finished warming up (1) or not (0).', int(self.status in ('idle', 'ready'))),
+				('step_seconds', 'Wall time of each warmup step.',
+					{f'step="{name}"': step['seconds'] for name, step in self.steps.items()}),
+				('step_rss_bytes', 'Resident memory added by each warmup step.',
+					{f'step="{name}"': step['rss_kib'] * 1024 for name, step in self.steps.items()}),
+			], 'gauge')
+
+
+warmup_state = WarmupState()
+
+
+def run_warmup(mode='sync', state=warmup_state):
+	"""Runs every step, recording its timing and memory in `state`. Returns True on success."""
+	with state._lock:
+		state.mode, state.status, state.error, state.steps = mode, 'warming', None, {}
+	started, rss_before = time.perf_counter(), _rss_kib()
+	try:
+		for name, load in STEPS:
+			step_started, step_rss = time.perf_counter(), _rss_kib()
+			load()
+			with state._lock:
+				state.steps[name] = {'seconds': round(time.perf_counter() - step_started, 6), 'rss_kib': _rss_kib() - step_rss}
+	except Exception as e:
+		logger.exception("Warmup failed; planner data will load on first use")
+		with state._lock:
+			state.status, state.error = 'failed', f'{type(e).__name__}: {e}'
+		return False
+
+	with state._lock:
+		state.seconds = time.perf_counter() - started
+		state.rss_kib = _rss_kib() - rss_before
+		state.status = 'ready'
+	logger.info("Warmup (%s) finished in %.2fs, %d KiB resident: %s", mode, state.seconds, state.rss_kib,
+		', '.join(f"{name} {step['seconds']:.2f}s/{step['rss_kib']} KiB" for name, step in state.steps.items()))
+	return True
+
+
+def start_warmup(mode):
+	"""Starts the warmup configured by settings.TRANSIT_WARMUP (see the module docstring)."""
+	if mode not in MODES:
+		raise ValueError(f"TRANSIT_WARMUP must be one of {', '.join(MODES)}, not {mode!r}")
+	if mode == 'background':
+		with warmup_state._lock:
+			warmup_state.mode, warmup_state.status = mode, 'warming'
+		threading.Thread(target=_warm_in_background, name='transit-warmup', daemon=True).start()
+		return
+	succeeded = run_warmup(mode)
+	# Forked workers must not share the master's database connections
+	connections.close_all()
+	if succeeded:
+		# Keep the collector from touching (and so copying) the inherited objects in workers
+		gc.freeze()
+
+
+def _warm_in_background():
+	try:
+		run_warmup('background')
+	finally:
+		connections.close_all()  # this thread's connections
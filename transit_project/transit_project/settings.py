@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -118,6 +119,59 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Compiled timetable shared by all worker processes (see `manage.py compile_timetable`).
+# When the file is missing or stale the planner loads the timetable from the database.
+TRANSIT_TIMETABLE_FILE = BASE_DIR / 'timetable.bin'
+
+# Precomputed transfer patterns (see `manage.py precompute_transfer_patterns`); patterns
+# for another feed fall back to live search. /plan/ answers from them only when
+# TRANSIT_TRANSFER_PATTERNS_DEFAULT is on: benchmark them against the live planner first.
+TRANSIT_TRANSFER_PATTERNS_FILE = BASE_DIR / 'transfer_patterns.bin'
+TRANSIT_TRANSFER_PATTERNS_DEFAULT = False
+
+# Identical /plan/ requests arriving together share one search. Waiting requests give up
+# after this many seconds and plan on their own.
+TRANSIT_PLAN_COALESCE_TIMEOUT = 10
+
+# Finished /plan/ results are cached per process: at most this many, for this many
+# seconds. A real-time delay update drops them all.
+TRANSIT_PLAN_CACHE_SIZE = 1024
+TRANSIT_PLAN_CACHE_SECONDS = 60
+
+# Real-time delays applied to the planners (see transit_api/planning/realtime.py): a
+# local GTFS-Realtime trip updates file (JSON, or protobuf *.pb with gtfs-realtime-bindings
+# installed), or the dotted path of a source class with a fetch() method. Polled before
+# planning at most every TRANSIT_REALTIME_POLL_SECONDS. Off when both are empty.
+# TRANSIT_REALTIME_FEED names the imported feed (--feed of import_transit_data) whose
+# trip and stop ids the updates use.
+TRANSIT_REALTIME_FILE = os.environ.get('TRANSIT_REALTIME_FILE', '')
+TRANSIT_REALTIME_SOURCE = ''
+TRANSIT_REALTIME_FEED = os.environ.get('TRANSIT_REALTIME_FEED', 'default')
+TRANSIT_REALTIME_POLL_SECONDS = 15
+
+# Read-only endpoints (/routes/, /stops/, /trips/, /stoptimes/) send an ETag tied to the
+# imported feed version and Cache-Control max-age=TRANSIT_HTTP_CACHE_SECONDS, and answer
+# If-None-Match with 304 without querying. Each process reads the version at most every
+# TRANSIT_FEED_VERSION_SECONDS and keeps up to TRANSIT_RESPONSE_CACHE_BYTES of rendered
+# bodies (0 turns that off).
+TRANSIT_HTTP_CACHE_SECONDS = 300
+TRANSIT_FEED_VERSION_SECONDS = 5
+TRANSIT_RESPONSE_CACHE_BYTES = 32 * 1024 * 1024
+
+# Opt-in profiling of /plan/ (see transit_api/profiling.py): a request is profiled with
+# probability TRANSIT_PROFILE_SAMPLE_RATE, or when it sends X-Transit-Profile set to
+# TRANSIT_PROFILE_TOKEN (never when the token is empty). Each one writes a cProfile dump and
+# its exact planner inputs, replayable with `manage.py replay_plan`, to TRANSIT_PROFILE_DIR.
+# Off when the directory is empty.
+TRANSIT_PROFILE_DIR = os.environ.get('TRANSIT_PROFILE_DIR', '')
+TRANSIT_PROFILE_SAMPLE_RATE = 0.0
+TRANSIT_PROFILE_TOKEN = os.environ.get('TRANSIT_PROFILE_TOKEN', '')
+
+# Build the timetable, transfer patterns and stop search index at startup instead of on
+# the first request: 'sync' (in the master before fork with gunicorn --preload, else per
+# worker) or 'background' (per process, /api/v1/ready/ answers 503 until done). Off when empty.
+TRANSIT_WARMUP = os.environ.get('TRANSIT_WARMUP', '')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 